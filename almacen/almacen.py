@@ -0,0 +1,164 @@
+import json
+import time
+import numpy as np
+from shared.models import Result, ResultBatch, ResultSummary
+from shared import RESULTS_EXCHANGE, RESULTS_BINDING, STORE_QUEUE, STORE_DIR
+from shared import MSG_RESULT_BATCH, MSG_RESULT_SUMMARY, CONTENT_TYPE_BINARY
+from shared import codec, transport
+from shared.stats import Aggregate
+from almacen.columnar import EscritorColumnar, LectorColumnar, modelos_guardados
+
+# Los mensajes se confirman con un solo ack múltiple después de que sus filas
+# están en disco: cada N mensajes o T segundos
+GUARDADO_MENSAJES = 500
+GUARDADO_INTERVAL = 1.0
+
+
+class AlmacenResultados:
+    """Sumidero de resultados: los guarda por model_id en el almacén columnar."""
+
+    def __init__(self, directorio=STORE_DIR):
+        self.directorio = directorio
+        self.escritores = {}
+        self.connection = None
+        self.channel = None
+        self.ultimo_tag = None
+        self.sin_guardar = 0
+        self.filas_guardadas = 0
+        self.resumenes_guardados = 0
+        self.filas_repetidas = 0
+        self.connect()
+
+    def connect(self):
+        try:
+            self.connection = transport.connect()
+            self.channel = self.connection.channel()
+
+            # Cola propia enlazada al exchange de resultados: no compite con el dashboard
+            self.channel.exchange_declare(exchange=RESULTS_EXCHANGE, exchange_type='topic', durable=True)
+            self.channel.queue_declare(queue=STORE_QUEUE, durable=True)
+            self.channel.queue_bind(queue=STORE_QUEUE, exchange=RESULTS_EXCHANGE, routing_key=RESULTS_BINDING)
+            self.channel.basic_qos(prefetch_count=GUARDADO_MENSAJES * 2)
+
+            print(f"Almacén conectado a RabbitMQ, guardando en '{self.directorio}/'")
+
+        except Exception as e:
+            print(f"Error conectando almacén: {e}")
+            raise
+
+    def escritor(self, model_id):
+        if model_id not in self.escritores:
+            self.escritores[model_id] = EscritorColumnar(self.directorio, model_id)
+        return self.escritores[model_id]
+
+    def recibir(self, ch, method, properties, body):
+        try:
+            binario = properties.content_type == CONTENT_TYPE_BINARY
+            if properties.type == MSG_RESULT_SUMMARY:
+                summary = ResultSummary.from_json(body.decode())
+                # Cada escritor sabe qué escenarios ya guardó: las copias repetidas no se escriben dos veces
+                escritor = self.escritor(summary.model_id)
+                if not summary.units or escritor.completitud.claim(summary.units):
+                    escritor.combinar_resumen(Aggregate.from_dict(summary.aggregate), summary.units)
+                    self.resumenes_guardados += 1
+                else:
+                    self.filas_repetidas += sum(cantidad for _, cantidad in summary.units)
+            else:
+                if properties.type == MSG_RESULT_BATCH:
+                    batch = codec.decode_result_batch(body) if binario else ResultBatch.from_json(body.decode())
+                    model_id, worker_id = batch.model_id, batch.worker_id
+                    seqs = np.arange(batch.start_index, batch.start_index + len(batch.results))
+                    results = np.array([np.nan if v is None else v for v in batch.results], dtype=float)
+                else:
+                    result = codec.decode_result(body) if binario else Result.from_json(body.decode())
+                    model_id, worker_id = result.model_id, result.worker_id
+                    seqs = np.array([int(result.scenario_id.rsplit('_', 1)[1])])
+                    results = np.array([result.result], dtype=object)
+
+                nuevos = self.escritor(model_id).completitud.add(int(seqs[0]), len(seqs))
+                self.filas_repetidas += len(seqs) - int(nuevos.sum())
+                if nuevos.any():
+                    self.escritor(model_id).agregar(seqs[nuevos], results[nuevos], worker_id, time.time())
+                    self.filas_guardadas += int(nuevos.sum())
+
+            self.ultimo_tag = method.delivery_tag
+            self.sin_guardar += 1
+            if self.sin_guardar >= GUARDADO_MENSAJES:
+                self.guardar()
+
+        except Exception as e:
+            print(f"Error guardando resultado: {e}")
+            ch.basic_nack(delivery_tag=method.delivery_tag, requeue=False)
+
+    def guardar(self):
+        # Datos y metadatos a disco antes del ack: si el almacén cae, el broker reentrega
+        for escritor in self.escritores.values():
+            escritor.guardar()
+        if self.ultimo_tag is not None:
+            self.channel.basic_ack(delivery_tag=self.ultimo_tag, multiple=True)
+        self.ultimo_tag = None
+        self.sin_guardar = 0
+
+    def revisar(self):
+        if self.sin_guardar:
+            self.guardar()
+        self.connection.call_later(GUARDADO_INTERVAL, self.revisar)
+
+    def iniciar(self):
+        self.channel.basic_consume(queue=STORE_QUEUE, on_message_callback=self.recibir)
+        self.revisar()
+        print("Almacén escuchando resultados...")
+
+        try:
+            self.channel.start_consuming()
+        except KeyboardInterrupt:
+            print("\nAlmacén detenido por usuario")
+        finally:
+            self.cerrar()
+
+    def cerrar(self):
+        try:
+            if self.connection and not self.connection.is_closed:
+                self.guardar()
+                self.connection.close()
+            for escritor in self.escritores.values():
+                escritor.cerrar()
+            print(f"Almacén cerrado: {self.filas_guardadas} resultados y {self.resumenes_guardados} resúmenes guardados, "
+                  f"{self.filas_repetidas} escenarios repetidos descartados")
+        except Exception as e:
+            print(f"Error cerrando almacén: {e}")
+
+
+def consultar(directorio, model_id):
+    lector = LectorColumnar(directorio, model_id)
+    stats = lector.estadisticas()
+    p5, p50, p95 = lector.cuantiles([0.05, 0.5, 0.95])
+    counts, edges = lector.histograma(bins=10)
+    return {
+        "model_id": model_id,
+        "filas": len(lector),
+        "workers": lector.workers,
+        "media": stats.mean,
+        "desviacion": stats.std,
+        "min": stats.minimum if stats.count else None,
+        "max": stats.maximum if stats.count else None,
+        "cuantiles": {"p5": p5, "p50": p50, "p95": p95},
+        "histograma": {"bordes": edges.tolist(), "conteos": counts.tolist()},
+        "resumen_workers": lector.resumen.to_dict()["stats"] if lector.resumen else None
+    }
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Almacén de resultados Monte Carlo")
+    parser.add_argument("--dir", default=STORE_DIR, help="Directorio del almacén")
+    parser.add_argument("--consultar", nargs="*", metavar="MODEL_ID",
+                        help="Mostrar estadísticas de modelos guardados (todos si no se indica ninguno)")
+    args = parser.parse_args()
+
+    if args.consultar is not None:
+        for model_id in args.consultar or modelos_guardados(args.dir):
+            print(json.dumps(consultar(args.dir, model_id), indent=2, ensure_ascii=False))
+    else:
+        AlmacenResultados(args.dir).iniciar()
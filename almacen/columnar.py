@@ -0,0 +1,213 @@
+import json
+import os
+import numpy as np
+from shared.stats import Aggregate, RunningStats, QuantileSketch
+from shared.completion import CompletionIndex, coalesce
+
+# Almacén columnar de resultados, un directorio por model_id:
+#   meta.json             metadatos (versión, filas por chunk, filas escritas,
+#                         rango de escenarios por chunk, workers, resumen y
+#                         rangos de escenarios que cubre el resumen)
+#   chunk_000000.npy ...  arreglos estructurados de CHUNK_ROWS filas
+# Los chunks se crean de tamaño fijo y se abren con mmap: escribir es copiar
+# en el mapa y leer nunca carga más de un chunk a la vez. Las filas más allá
+# del conteo de meta.json (p. ej. tras una caída) se ignoran.
+
+STORE_VERSION = 1
+CHUNK_ROWS = 1 << 20
+ROW_DTYPE = np.dtype([
+    ('seq', '<u8'),         # índice del escenario dentro del modelo
+    ('result', '<f8'),      # NaN = escenario fallido
+    ('worker', '<u2'),      # índice en la lista de workers de meta.json
+    ('timestamp', '<f8'),   # hora de llegada al almacén
+])
+
+
+def _chunk_name(index):
+    return f"chunk_{index:06d}.npy"
+
+
+class EscritorColumnar:
+    """Agrega filas a los chunks de un modelo; `guardar` las hace durables.
+
+    `completitud` tiene los escenarios ya guardados (filas y resumen): al abrir
+    un modelo existente se reconstruye desde la columna seq y los rangos del
+    resumen, así lo que el broker reentrega tras una caída no se guarda dos veces.
+    """
+
+    def __init__(self, directorio, model_id, chunk_rows=CHUNK_ROWS):
+        self.directorio = os.path.join(directorio, model_id)
+        self.model_id = model_id
+        os.makedirs(self.directorio, exist_ok=True)
+
+        self.meta_path = os.path.join(self.directorio, "meta.json")
+        if os.path.exists(self.meta_path):
+            with open(self.meta_path) as f:
+                self.meta = json.load(f)
+        else:
+            self.meta = {"version": STORE_VERSION, "model_id": model_id, "chunk_rows": chunk_rows,
+                         "rows": 0, "chunks": [], "workers": [], "summary": None}
+        self.chunk_rows = self.meta["chunk_rows"]
+        self.workers = {wid: i for i, wid in enumerate(self.meta["workers"])}
+        self.mapa = None
+        self.mapa_indice = None
+
+        self.completitud = CompletionIndex()
+        if self.meta["rows"]:
+            for bloque in LectorColumnar(directorio, model_id).bloques():
+                self.completitud.add_many(bloque['seq'])
+        for inicio, cantidad in self.meta.get("summary_units", []):
+            self.completitud.add(inicio, cantidad)
+
+    def indice_worker(self, worker_id):
+        if worker_id not in self.workers:
+            self.workers[worker_id] = len(self.meta["workers"])
+            self.meta["workers"].append(worker_id)
+        return self.workers[worker_id]
+
+    def _chunk(self, index):
+        if self.mapa_indice != index:
+            if self.mapa is not None:
+                self.mapa.flush()
+            path = os.path.join(self.directorio, _chunk_name(index))
+            if index < len(self.meta["chunks"]):
+                self.mapa = np.load(path, mmap_mode='r+')
+            else:
+                self.mapa = np.lib.format.open_memmap(path, mode='w+', dtype=ROW_DTYPE, shape=(self.chunk_rows,))
+                self.meta["chunks"].append({"file": _chunk_name(index), "rows": 0, "seq_min": None, "seq_max": None})
+            self.mapa_indice = index
+        return self.mapa
+
+    def agregar(self, seqs, results, worker_id, timestamp):
+        seqs = np.asarray(seqs, dtype=np.uint64)
+        results = np.asarray(results, dtype=np.float64)
+        worker = self.indice_worker(worker_id)
+
+        escritas = 0
+        while escritas < len(seqs):
+            index, offset = divmod(self.meta["rows"], self.chunk_rows)
+            mapa = self._chunk(index)
+            n = min(self.chunk_rows - offset, len(seqs) - escritas)
+            filas = mapa[offset:offset + n]
+            filas['seq'] = seqs[escritas:escritas + n]
+            filas['result'] = results[escritas:escritas + n]
+            filas['worker'] = worker
+            filas['timestamp'] = timestamp
+
+            # Rango de escenarios por chunk: permite saltear chunks en los range scans
+            chunk = self.meta["chunks"][index]
+            bloque = seqs[escritas:escritas + n]
+            chunk["rows"] = offset + n
+            chunk["seq_min"] = int(bloque.min()) if chunk["seq_min"] is None else min(chunk["seq_min"], int(bloque.min()))
+            chunk["seq_max"] = int(bloque.max()) if chunk["seq_max"] is None else max(chunk["seq_max"], int(bloque.max()))
+
+            self.meta["rows"] += n
+            escritas += n
+
+    def combinar_resumen(self, aggregate, units=None):
+        # Resúmenes de workers en modo agregado: no traen filas, se guardan combinados
+        # junto con los rangos [start_index, count] que cubren
+        if units:
+            self.meta["summary_units"] = coalesce(self.meta.get("summary_units", []) + list(units))
+        if self.meta["summary"] is not None:
+            total = Aggregate.from_dict(self.meta["summary"])
+            total.merge(aggregate)
+            aggregate = total
+        self.meta["summary"] = aggregate.to_dict()
+
+    def guardar(self):
+        if self.mapa is not None:
+            self.mapa.flush()
+        # meta.json se reemplaza de forma atómica, siempre después de los datos
+        temporal = self.meta_path + ".tmp"
+        with open(temporal, "w") as f:
+            json.dump(self.meta, f)
+        os.replace(temporal, self.meta_path)
+
+    def cerrar(self):
+        self.guardar()
+        self.mapa = None
+        self.mapa_indice = None
+
+
+class LectorColumnar:
+    """Consultas sobre los resultados guardados de un modelo, chunk por chunk vía mmap."""
+
+    def __init__(self, directorio, model_id):
+        self.directorio = os.path.join(directorio, model_id)
+        self.model_id = model_id
+        with open(os.path.join(self.directorio, "meta.json")) as f:
+            self.meta = json.load(f)
+        self.workers = self.meta["workers"]
+
+    def __len__(self):
+        return self.meta["rows"]
+
+    @property
+    def resumen(self):
+        return Aggregate.from_dict(self.meta["summary"]) if self.meta["summary"] else None
+
+    def bloques(self, chunks=None):
+        """Vistas de solo lectura de cada chunk, limitadas a sus filas escritas."""
+        for i, chunk in enumerate(self.meta["chunks"]):
+            if chunks is not None and i not in chunks:
+                continue
+            if chunk["rows"]:
+                mapa = np.load(os.path.join(self.directorio, chunk["file"]), mmap_mode='r')
+                yield mapa[:chunk["rows"]]
+
+    def agregado(self):
+        """Aggregate (estadísticos, histograma y sketch) de todas las filas."""
+        aggregate = Aggregate()
+        for bloque in self.bloques():
+            aggregate.update(bloque['result'])
+        return aggregate
+
+    def estadisticas(self):
+        stats = RunningStats()
+        for bloque in self.bloques():
+            values = bloque['result']
+            stats.update(values[np.isfinite(values)])
+        return stats
+
+    def cuantiles(self, qs):
+        """Cuantiles con error relativo acotado por el sketch, en una sola pasada."""
+        sketch = QuantileSketch()
+        for bloque in self.bloques():
+            values = bloque['result']
+            sketch.update(values[np.isfinite(values)])
+        return [sketch.quantile(q) for q in qs]
+
+    def histograma(self, bins=50, rango=None):
+        """Conteos con bordes fijos; sin rango se usa [min, max] (una pasada extra)."""
+        if rango is None:
+            stats = self.estadisticas()
+            if not stats.count:
+                return np.zeros(bins, dtype=np.int64), np.linspace(0, 1, bins + 1)
+            rango = (stats.minimum, stats.maximum)
+        edges = np.linspace(rango[0], rango[1], bins + 1)
+        counts = np.zeros(bins, dtype=np.int64)
+        for bloque in self.bloques():
+            counts += np.histogram(bloque['result'], bins=edges)[0]
+        return counts, edges
+
+    def rango(self, seq_inicio, seq_fin):
+        """Filas con seq en [seq_inicio, seq_fin), leyendo solo los chunks que pueden contenerlas."""
+        candidatos = {
+            i for i, chunk in enumerate(self.meta["chunks"])
+            if chunk["rows"] and chunk["seq_max"] >= seq_inicio and chunk["seq_min"] < seq_fin
+        }
+        partes = []
+        for bloque in self.bloques(candidatos):
+            seq = bloque['seq']
+            partes.append(bloque[(seq >= seq_inicio) & (seq < seq_fin)])
+        filas = np.concatenate(partes) if partes else np.empty(0, dtype=ROW_DTYPE)
+        return np.sort(filas, order='seq')
+
+
+def modelos_guardados(directorio):
+    """model_id de los modelos con resultados en el almacén."""
+    if not os.path.isdir(directorio):
+        return []
+    return sorted(nombre for nombre in os.listdir(directorio)
+                  if os.path.exists(os.path.join(directorio, nombre, "meta.json")))
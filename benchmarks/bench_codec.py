@@ -0,0 +1,63 @@
+"""Micro-benchmark del codec binario contra el JSON de shared.models.
+
+Uso: python -m benchmarks.bench_codec [--variables 3] [--batch 512]
+"""
+import argparse
+import timeit
+import numpy as np
+from shared.models import Scenario, Result, ScenarioBatch, ResultBatch
+from shared import codec
+
+
+def medir(funcion, repeticiones):
+    # Mejor de 5 rondas, en microsegundos por llamada
+    tiempos = timeit.repeat(funcion, number=repeticiones, repeat=5)
+    return min(tiempos) / repeticiones * 1e6
+
+
+def casos(num_variables, batch_size):
+    rng = np.random.default_rng(0)
+    nombres = [f"var{i}" for i in range(num_variables)]
+    model_id = "a1b2c3d4"
+
+    scenario = Scenario(f"{model_id}_000042", model_id, {n: float(rng.uniform(1, 6)) for n in nombres})
+    result = Result(scenario.scenario_id, model_id, float(rng.uniform(3, 18)), "worker_0f1e2d3c")
+    batch = ScenarioBatch(f"{model_id}_b000512", model_id, 512,
+                          {n: rng.uniform(1, 6, batch_size).tolist() for n in nombres})
+    result_batch = ResultBatch(batch.batch_id, model_id, 512, rng.uniform(3, 18, batch_size).tolist(),
+                               "worker_0f1e2d3c")
+
+    return [
+        ("Scenario", scenario.to_json, Scenario.from_json,
+         lambda: codec.encode_scenario(scenario, nombres), lambda b: codec.decode_scenario(b, nombres)),
+        ("Result", result.to_json, Result.from_json,
+         lambda: codec.encode_result(result), codec.decode_result),
+        (f"ScenarioBatch[{batch_size}]", batch.to_json, ScenarioBatch.from_json,
+         lambda: codec.encode_scenario_batch(batch, nombres), lambda b: codec.decode_scenario_batch(b, nombres)),
+        (f"ResultBatch[{batch_size}]", result_batch.to_json, ResultBatch.from_json,
+         lambda: codec.encode_result_batch(result_batch), codec.decode_result_batch),
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark JSON vs binario")
+    parser.add_argument("--variables", type=int, default=3)
+    parser.add_argument("--batch", type=int, default=512)
+    parser.add_argument("--repeticiones", type=int, default=2000)
+    args = parser.parse_args()
+
+    print(f"{'mensaje':<22}{'formato':<9}{'bytes':>9}{'encode µs':>12}{'decode µs':>12}")
+    for nombre, json_enc, json_dec, bin_enc, bin_dec in casos(args.variables, args.batch):
+        repeticiones = max(args.repeticiones // (args.batch if "Batch" in nombre else 1), 10)
+        json_body = json_enc()
+        bin_body = bin_enc()
+        filas = [
+            ("json", len(json_body.encode()), medir(json_enc, repeticiones), medir(lambda: json_dec(json_body), repeticiones)),
+            ("binario", len(bin_body), medir(bin_enc, repeticiones), medir(lambda: bin_dec(bin_body), repeticiones)),
+        ]
+        for formato, tamano, t_enc, t_dec in filas:
+            print(f"{nombre:<22}{formato:<9}{tamano:>9}{t_enc:>12.2f}{t_dec:>12.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,331 @@
+"""Throughput de punta a punta: productor, consumidores y dashboard.
+
+Corre las tres etapas una después de la otra sobre el mismo trabajo, con
+el código real de cada componente:
+
+  productor   publicar_escenarios(esperar=False) hasta que el broker confirma todo.
+              Latencia: publicación -> confirm del broker.
+  consumidor  --workers ConsumidorMonteCarlo (PoolConsumidores con
+              --procesos, ConsumidorPipeline con --hilos) drenan la cola del
+              trabajo. Latencia: cómputo por mensaje, de las métricas de los
+              workers; en pipeline, también la utilización de cada etapa.
+  dashboard   el callback de resultados del dashboard lee todo lo que
+              publicaron los workers. Latencia: por mensaje.
+
+Por defecto se usa el transporte 'local' de shared.transport (broker en
+memoria, sin red); con --transporte rabbitmq, el RabbitMQ de RABBITMQ_HOST. En
+cada etapa se informa escenarios/s, mensajes/s, p50/p99 y el pico de RSS
+del proceso. Se miden los modelos de modelos/ y modelos sintéticos de
+costo configurable (--costos: cantidad de np.sin encadenados por escenario).
+
+El resultado se guarda en JSON (por defecto benchmarks/resultados/<commit>.json);
+--comparar contra el JSON de otro commit marca las regresiones de
+escenarios/s y termina con código 1 si hay alguna.
+
+Uso: python -m benchmarks.bench_extremo [--escenarios 100000] [--lote 512] [--workers 1]
+     [--costos 0,50] [--escalar] [--transporte local|rabbitmq] [--latencia 0.0005]
+     [--comparar base.json] [modelos/x.txt ...]
+"""
+import argparse
+import contextlib
+import datetime
+import glob
+import json
+import math
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import numpy as np
+import pika
+from shared import RESULTS_EXCHANGE, transport
+from shared.transport import LocalTransport, RabbitMQTransport
+from productor.productor import ProductorMonteCarlo
+from productor.publicador import MARCA_ALTA
+from consumidor.consumidor import ConsumidorMonteCarlo
+from visualizador import dashboard
+
+SEMILLA = 12345
+ESPERA_MAXIMA = 600.0
+TOLERANCIA_REGRESION = 0.10
+# Parámetros que tienen que coincidir para que dos corridas sean comparables
+PARAMETROS_COMPARABLES = ("escenarios", "lote", "workers", "procesos", "hilos", "prefetch", "crudos", "latencia")
+
+
+def commit_actual():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "desconocido"
+
+
+def rss_pico_mb():
+    # ru_maxrss está en KB en Linux y en bytes en macOS
+    pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return pico / (2 ** 20 if sys.platform == "darwin" else 2 ** 10)
+
+
+def percentiles_ms(latencias):
+    valores = np.asarray(latencias, dtype=float) * 1000 if len(latencias) else np.zeros(1)
+    return float(np.percentile(valores, 50)), float(np.percentile(valores, 99))
+
+
+def etapa(segundos, escenarios, mensajes, latencias):
+    p50, p99 = percentiles_ms(latencias)
+    return {
+        "segundos": round(segundos, 4),
+        "escenarios_por_s": round(escenarios / segundos, 1) if segundos > 0 else None,
+        "mensajes_por_s": round(mensajes / segundos, 1) if segundos > 0 else None,
+        "latencia_p50_ms": round(p50, 4),
+        "latencia_p99_ms": round(p99, 4),
+        "rss_pico_mb": round(rss_pico_mb(), 1)
+    }
+
+
+def modelo_sintetico(costo, variables, escalar):
+    """Texto de un modelo cuyo costo por escenario crece con `costo`."""
+    nombres = [f"x{i}" for i in range(variables)]
+    pasos = [f"resultado = {' + '.join(nombres)}"]
+    pasos += [f"resultado = np.sin(resultado) + {nombres[i % variables]}" for i in range(costo)]
+    if escalar:
+        # Una expresión condicional no es vectorizable: fuerza el bucle escalar
+        pasos.append("resultado = resultado if resultado == resultado else 0.0")
+    lineas = [f"# Modelo sintético: {costo} pasos {'escalares' if escalar else 'vectorizados'}",
+              f"FUNCTION: {'; '.join(pasos)}"]
+    lineas += [f"VAR: {nombre}, uniform, min=0, max=1" for nombre in nombres]
+    return "\n".join(lineas) + "\n"
+
+
+def esperar(condicion, descripcion, intervalo=0.001):
+    limite = time.perf_counter() + ESPERA_MAXIMA
+    while not condicion():
+        if time.perf_counter() > limite:
+            raise TimeoutError(f"Sin terminar tras {ESPERA_MAXIMA:.0f}s: {descripcion}")
+        time.sleep(intervalo)
+
+
+@contextlib.contextmanager
+def silencio(activo=True):
+    # Los componentes imprimen por cada lote; eso no es parte de lo que se mide
+    if not activo:
+        yield
+        return
+    with open(os.devnull, "w") as nulo, contextlib.redirect_stdout(nulo):
+        yield
+
+
+def crear_worker(args, indice):
+    worker_id = f"bench_{indice}"
+    if args.procesos:
+        from consumidor.pool import PoolConsumidores
+        return PoolConsumidores(args.procesos, worker_id, resultados_crudos=args.crudos, prefetch=args.prefetch)
+    if args.hilos:
+        from consumidor.pipeline import ConsumidorPipeline
+        return ConsumidorPipeline(args.hilos, worker_id, resultados_crudos=args.crudos, prefetch=args.prefetch)
+    return ConsumidorMonteCarlo(worker_id, resultados_crudos=args.crudos, prefetch=args.prefetch)
+
+
+def correr_caso(ruta, args):
+    escenarios = args.escenarios
+    productor = ProductorMonteCarlo()
+    workers, hilos = [], []
+    sumidero = None
+    try:
+        if not productor.cargar_modelo_desde_archivo(ruta, SEMILLA):
+            raise ValueError(f"No se pudo cargar {ruta}")
+        productor.publicar_modelo()
+        trabajo = productor.trabajo
+        model_id = productor.current_model.model_id
+
+        # Cola del dashboard enlazada solo a este trabajo, antes de que haya resultados
+        sumidero = transport.connect()
+        canal = sumidero.channel()
+        canal.exchange_declare(exchange=RESULTS_EXCHANGE, exchange_type='topic', durable=True)
+        cola = canal.queue_declare(queue='', exclusive=True).method.queue
+        canal.queue_bind(queue=cola, exchange=RESULTS_EXCHANGE, routing_key=trabajo.results_key)
+
+        # 1. Productor
+        inicio = time.perf_counter()
+        productor.publicar_escenarios(escenarios, args.lote, esperar=False)
+        segundos = time.perf_counter() - inicio
+        publicador = productor.publicador
+        etapa_productor = etapa(segundos, productor.scenarios_generados, publicador.confirmados, list(publicador.latencias))
+
+        # 2. Consumidores: se suscriben al trabajo con el anuncio que se repite al arrancar
+        inicio = time.perf_counter()
+        for indice in range(args.workers):
+            worker = crear_worker(args, indice)
+            hilo = threading.Thread(target=worker.iniciar_consumo, daemon=True)
+            hilo.start()
+            workers.append(worker)
+            hilos.append(hilo)
+        productor.registro.anunciar(trabajo)
+        esperar(lambda: sum(w.escenarios_procesados() for w in workers) >= escenarios, "consumo de escenarios")
+        segundos = time.perf_counter() - inicio
+        for worker in workers:
+            worker.detener()
+        for hilo in hilos:
+            hilo.join(timeout=30)
+        latencias = [latencia for w in workers for latencia in w.latencias]
+        mensajes = math.ceil(escenarios / args.lote)
+        etapa_consumidor = etapa(segundos, escenarios, mensajes, latencias)
+        if args.hilos:
+            utilizaciones = [w.utilizacion(w.inicio_etapas, dict.fromkeys(w.ocupado, 0.0)) for w in workers]
+            etapa_consumidor["utilizacion_etapas"] = {
+                nombre: round(float(np.mean([u[nombre] for u in utilizaciones])), 3) for nombre in utilizaciones[0]}
+
+        # 3. Dashboard: su callback de resultados sobre todo lo que publicaron los workers
+        dashboard.modelos.clear()
+        latencias = []
+        recibidos = [0]
+
+        def medir(ch, method, properties, body):
+            antes = time.perf_counter()
+            dashboard.recibir_resultado(ch, method, properties, body)
+            latencias.append(time.perf_counter() - antes)
+            recibidos[0] += 1
+
+        inicio = time.perf_counter()
+        canal.basic_consume(queue=cola, on_message_callback=medir)
+        limite = inicio + ESPERA_MAXIMA
+        while dashboard.modelos[model_id].aggregate.count < escenarios:
+            if time.perf_counter() > limite:
+                raise TimeoutError("El dashboard no recibió todos los resultados")
+            sumidero.process_data_events(time_limit=0.01)
+        segundos = time.perf_counter() - inicio
+        etapa_dashboard = etapa(segundos, escenarios, recibidos[0], latencias)
+
+        estimacion = dashboard.modelos[model_id].aggregate.mean
+        return {
+            "productor": etapa_productor,
+            "consumidor": etapa_consumidor,
+            "dashboard": etapa_dashboard,
+            "media": estimacion,
+            "mensajes_resultado": recibidos[0]
+        }
+    finally:
+        for worker in workers:
+            worker.detener()
+        for hilo in hilos:
+            hilo.join(timeout=30)
+        if productor.trabajo:
+            with contextlib.suppress(Exception):
+                productor.channel.queue_delete(queue=productor.trabajo.queue)
+        if sumidero and sumidero.is_open:
+            sumidero.close()
+        productor.cerrar()
+
+
+def casos(args, directorio):
+    for ruta in args.modelos or sorted(glob.glob(os.path.join("modelos", "*.txt"))):
+        yield os.path.basename(ruta), ruta
+    for costo in args.costos:
+        for escalar in ([False, True] if args.escalar else [False]):
+            nombre = f"sintetico_c{costo}{'_escalar' if escalar else ''}"
+            ruta = os.path.join(directorio, f"{nombre}.txt")
+            with open(ruta, "w") as f:
+                f.write(modelo_sintetico(costo, args.variables, escalar))
+            yield nombre, ruta
+
+
+def comparar(actual, base, tolerancia):
+    """Imprime la relación de escenarios/s contra `base`; devuelve las regresiones."""
+    anteriores = {caso["modelo"]: caso for caso in base["casos"]}
+    regresiones = []
+    print(f"\nComparación contra {base['commit']} (tolerancia {tolerancia:.0%}):")
+    distintos = [clave for clave in PARAMETROS_COMPARABLES
+                 if actual["parametros"].get(clave) != base["parametros"].get(clave)]
+    if distintos or actual["transporte"] != base["transporte"]:
+        print(f"  Advertencia: las corridas difieren en {', '.join(distintos) or 'transporte'}; la comparación no es directa")
+    for caso in actual["casos"]:
+        anterior = anteriores.get(caso["modelo"])
+        if not anterior:
+            continue
+        for nombre in ("productor", "consumidor", "dashboard"):
+            ahora, antes = caso[nombre]["escenarios_por_s"], anterior[nombre]["escenarios_por_s"]
+            if not ahora or not antes:
+                continue
+            relacion = ahora / antes
+            marca = ""
+            if relacion < 1 - tolerancia:
+                marca = "  REGRESIÓN"
+                regresiones.append((caso["modelo"], nombre, relacion))
+            print(f"  {caso['modelo']:<28}{nombre:<12}{antes:>14.0f} -> {ahora:>12.0f} esc/s ({relacion:.2f}x){marca}")
+    return regresiones
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Throughput de punta a punta de productor, consumidores y dashboard")
+    parser.add_argument("modelos", nargs="*", help="Archivos de modelo (por defecto modelos/*.txt)")
+    parser.add_argument("--escenarios", type=int, default=100000)
+    parser.add_argument("--lote", type=int, default=512, help="Escenarios por mensaje")
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--procesos", type=int, default=0, help="Procesos de cómputo por worker (modo pool)")
+    parser.add_argument("--hilos", type=int, default=0, help="Hilos de cómputo por worker (modo pipeline)")
+    parser.add_argument("--prefetch", type=int, default=None, help="Prefetch fijo (por defecto adaptativo)")
+    parser.add_argument("--crudos", action="store_true", help="Resultados crudos en lugar de resúmenes")
+    parser.add_argument("--costos", type=lambda texto: [int(c) for c in texto.split(",") if c], default=[0, 50],
+                        help="Costos de los modelos sintéticos, separados por coma ('' = ninguno)")
+    parser.add_argument("--variables", type=int, default=3, help="Variables de los modelos sintéticos")
+    parser.add_argument("--escalar", action="store_true", help="Medir también la versión escalar de los sintéticos")
+    parser.add_argument("--transporte", choices=["local", "rabbitmq"], default="local")
+    parser.add_argument("--latencia", type=float, default=0.0, help="RTT simulado del transporte local, en segundos")
+    parser.add_argument("--salida", default=None, help="JSON de salida (por defecto benchmarks/resultados/<commit>.json)")
+    parser.add_argument("--comparar", metavar="BASE.json", default=None)
+    parser.add_argument("--tolerancia", type=float, default=TOLERANCIA_REGRESION)
+    parser.add_argument("--verbose", action="store_true", help="No silenciar la salida de los componentes")
+    args = parser.parse_args()
+
+    # Las etapas van en serie: todo lo publicado tiene que caber bajo la marca alta del publicador
+    if args.escenarios >= MARCA_ALTA:
+        parser.error(f"{args.escenarios} escenarios superan los {MARCA_ALTA} de la marca alta; reducí --escenarios")
+
+    commit = commit_actual()
+    reporte = {
+        "commit": commit,
+        "fecha": datetime.datetime.now().isoformat(timespec="seconds"),
+        "transporte": args.transporte,
+        "parametros": {clave: valor for clave, valor in vars(args).items()
+                       if clave not in ("salida", "comparar", "verbose")},
+        "entorno": {"python": platform.python_version(), "numpy": np.__version__,
+                    "pika": pika.__version__, "cpus": os.cpu_count()},
+        "casos": []
+    }
+
+    print(f"{'modelo':<28}{'etapa':<12}{'esc/s':>14}{'msg/s':>12}{'p50 ms':>10}{'p99 ms':>10}{'RSS MB':>9}")
+    with tempfile.TemporaryDirectory() as directorio:
+        for nombre, ruta in casos(args, directorio):
+            # Un broker local nuevo por caso: cada uno arranca con las colas vacías
+            elegido = LocalTransport(latency=args.latencia) if args.transporte == "local" else RabbitMQTransport()
+            with transport.using(elegido), silencio(not args.verbose):
+                resultado = correr_caso(ruta, args)
+            resultado = {"modelo": nombre, "escenarios": args.escenarios, **resultado}
+            if isinstance(elegido, LocalTransport):
+                resultado["broker"] = elegido.broker.stats()
+            reporte["casos"].append(resultado)
+
+            for etapa_nombre in ("productor", "consumidor", "dashboard"):
+                datos = resultado[etapa_nombre]
+                print(f"{nombre:<28}{etapa_nombre:<12}{datos['escenarios_por_s']:>14.0f}{datos['mensajes_por_s']:>12.0f}"
+                      f"{datos['latencia_p50_ms']:>10.3f}{datos['latencia_p99_ms']:>10.3f}{datos['rss_pico_mb']:>9.0f}")
+
+    salida = args.salida or os.path.join("benchmarks", "resultados", f"{commit}.json")
+    os.makedirs(os.path.dirname(salida) or ".", exist_ok=True)
+    with open(salida, "w") as f:
+        json.dump(reporte, f, indent=2, ensure_ascii=False)
+    print(f"\nResultados guardados en {salida}")
+
+    if args.comparar:
+        with open(args.comparar) as f:
+            regresiones = comparar(reporte, json.load(f), args.tolerancia)
+        if regresiones:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""Varianza por escenario de cada método de muestreo sobre los modelos de modelos/.
+
+Para cada modelo y método se repite la estimación de la media con R
+semillas distintas de N escenarios cada una; N·Var(estimación) es la
+varianza por escenario (la de un escenario i.i.d. para 'random'). La
+eficiencia es cuántas veces menos escenarios necesita el método para la
+misma precisión que el muestreo pseudoaleatorio.
+
+Uso: python -m benchmarks.bench_muestreo [--escenarios 4096] [--repeticiones 100] [modelos/x.txt ...]
+"""
+import argparse
+import glob
+import os
+import numpy as np
+from shared.sampling import SamplingEngine, SAMPLING_METHODS
+from shared.stats import Aggregate
+from productor.productor import parsear_modelo
+from shared.evaluation import ModeloCompilado, evaluar_vectorizado, evaluar_escalar
+
+
+def evaluar(compilado, columnas, cantidad):
+    if compilado.vectorizable:
+        return evaluar_vectorizado(compilado.codigo, columnas, cantidad)
+    return np.array([
+        evaluar_escalar(compilado.codigo, {n: float(v[i]) for n, v in columnas.items()}, compilado.exec_globals)
+        for i in range(cantidad)
+    ], dtype=float)
+
+
+def estimaciones(compilado, metodo, controles, escenarios, repeticiones):
+    medias = []
+    for semilla in range(repeticiones):
+        sampler = SamplingEngine(compilado.model.variables, semilla, method=metodo,
+                                 correlation=compilado.model.correlation)
+        columnas = sampler.sample(0, escenarios)
+        aggregate = Aggregate(controls=controles)
+        aggregate.update(evaluar(compilado, columnas, escenarios), columnas)
+        medias.append(aggregate.mean)
+    return np.array(medias)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Varianza por escenario según el método de muestreo")
+    parser.add_argument("modelos", nargs="*", help="Archivos de modelo (por defecto modelos/*.txt)")
+    parser.add_argument("--escenarios", type=int, default=4096, help="Escenarios por estimación (potencia de 2 para Sobol)")
+    parser.add_argument("--repeticiones", type=int, default=100)
+    args = parser.parse_args()
+
+    archivos = args.modelos or sorted(glob.glob(os.path.join("modelos", "*.txt")))
+    for archivo in archivos:
+        with open(archivo) as f:
+            model, _ = parsear_modelo(f.readlines(), os.path.dirname(archivo))
+        model.controls = model.controls or [var.name for var in model.variables]
+        compilado = ModeloCompilado(model)
+
+        casos = [(metodo, None) for metodo in SAMPLING_METHODS]
+        casos.append(("random+control", compilado.controles))
+        casos.append(("sobol+control", compilado.controles))
+
+        print(f"\n{os.path.basename(archivo)}  ({args.repeticiones} x {args.escenarios} escenarios, "
+              f"controles: {', '.join(model.controls)})")
+        print(f"{'método':<16}{'media':>12}{'var/escenario':>16}{'eficiencia':>14}")
+        referencia = None
+        for nombre, controles in casos:
+            metodo = nombre.split("+")[0]
+            medias = estimaciones(compilado, metodo, controles, args.escenarios, args.repeticiones)
+            varianza = medias.var(ddof=1) * args.escenarios
+            if referencia is None:
+                referencia = varianza
+            # Por debajo del redondeo de punto flotante la estimación es exacta
+            if varianza <= referencia * 1e-12:
+                eficiencia = "exacto"
+            else:
+                eficiencia = f"{referencia / varianza:.4g}x"
+            print(f"{nombre:<16}{medias.mean():>12.5f}{varianza:>16.4g}{eficiencia:>14}")
+
+
+if __name__ == "__main__":
+    main()
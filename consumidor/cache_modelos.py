@@ -0,0 +1,57 @@
+from collections import OrderedDict
+from shared.evaluation import ModeloCompilado
+
+CAPACIDAD_CACHE = 8
+
+
+class CacheModelos:
+    """LRU acotado de modelos compilados, indexado por model_id."""
+
+    def __init__(self, capacidad=CAPACIDAD_CACHE):
+        self.capacidad = capacidad
+        self.modelos = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def obtener(self, model_id):
+        compilado = self.modelos.get(model_id)
+        if compilado is None:
+            self.misses += 1
+            return None
+        self.modelos.move_to_end(model_id)
+        self.hits += 1
+        return compilado
+
+    def agregar(self, model):
+        if model.model_id in self.modelos:
+            self.modelos.move_to_end(model.model_id)
+            return self.modelos[model.model_id]
+
+        compilado = ModeloCompilado(model)
+        self.modelos[model.model_id] = compilado
+        while len(self.modelos) > self.capacidad:
+            self.modelos.popitem(last=False)
+            self.evictions += 1
+        return compilado
+
+    def consultar(self, model_id):
+        # Sin tocar el orden LRU ni las estadísticas de hits
+        return self.modelos.get(model_id)
+
+    def __contains__(self, model_id):
+        return model_id in self.modelos
+
+    def __len__(self):
+        return len(self.modelos)
+
+    def estadisticas(self):
+        consultas = self.hits + self.misses
+        return {
+            "modelos": list(self.modelos.keys()),
+            "capacidad": self.capacidad,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": f"{(self.hits / consultas * 100):.1f}%" if consultas else "N/A"
+        }
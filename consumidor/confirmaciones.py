@@ -0,0 +1,45 @@
+import bisect
+
+
+class ConfirmacionesAgrupadas:
+    """Seguimiento de delivery tags para confirmar en grupo con multiple=True.
+
+    Un ack múltiple confirma todos los tags menores o iguales del canal,
+    incluidos mensajes estacionados o todavía en cálculo. Por eso solo se
+    confirma con multiple=True hasta el tag anterior al menor que sigue en
+    curso; los listos por encima de ese límite se confirman de a uno.
+    """
+
+    def __init__(self):
+        self.en_curso = set()
+        self.listos = []  # tags ya resueltos y sin confirmar, ordenados
+
+    def recibido(self, delivery_tag):
+        self.en_curso.add(delivery_tag)
+
+    def listo(self, delivery_tag):
+        self.en_curso.discard(delivery_tag)
+        bisect.insort(self.listos, delivery_tag)
+
+    def descartado(self, delivery_tag):
+        # El mensaje se resolvió con nack por fuera de los grupos
+        self.en_curso.discard(delivery_tag)
+
+    def __len__(self):
+        return len(self.listos)
+
+    def confirmar(self, channel):
+        """Confirma todos los listos con el mínimo de frames; devuelve cuántos confirmó."""
+        if not self.listos:
+            return 0
+
+        limite = min(self.en_curso) if self.en_curso else None
+        corte = bisect.bisect_left(self.listos, limite) if limite is not None else len(self.listos)
+        if corte:
+            channel.basic_ack(delivery_tag=self.listos[corte - 1], multiple=True)
+        for delivery_tag in self.listos[corte:]:
+            channel.basic_ack(delivery_tag=delivery_tag)
+
+        confirmados = len(self.listos)
+        self.listos = []
+        return confirmados
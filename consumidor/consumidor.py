@@ -1,16 +1,60 @@
 import pika
 import json
+import struct
 import uuid
-import random
 import time
+import functools
 import numpy as np
-from shared.models import MonteCarloModel, Scenario, Result
-from shared import RABBITMQ_HOST, RABBITMQ_PORT, RABBITMQ_USER, RABBITMQ_PASS, SCENARIOS_QUEUE, MODEL_QUEUE, RESULTS_QUEUE
+from collections import deque, defaultdict
+from shared.models import MonteCarloModel, Scenario, Result, ScenarioBatch, ResultBatch, WorkUnit, ResultSummary, WorkerMetrics, Job
+from shared import SCENARIOS_QUEUE, RESULTS_QUEUE
+from shared import MSG_SCENARIO_BATCH, MSG_RESULT_BATCH, MSG_WORK_UNIT, CONTENT_TYPE_JSON, CONTENT_TYPE_BINARY
+from shared import WIRE_CONTENT_TYPE, MSG_RESULT_SUMMARY, SUMMARY_FLUSH_SCENARIOS, SUMMARY_FLUSH_INTERVAL
+from shared import METRICS_EXCHANGE, METRICS_INTERVAL, MSG_WORKER_METRICS
+from shared import MODELS_EXCHANGE, MODEL_REQUEST_QUEUE, MODEL_REQUEST_TIMEOUT, MSG_MODEL_REQUEST
+from shared import RESULTS_EXCHANGE, RESULTS_BINDING
+from shared import JOBS_EXCHANGE, JOB_ANNOUNCE_INTERVAL, JOB_IDLE_TIMEOUT, JOB_QUEUE_ARGUMENTS
+from shared import DEAD_LETTER_EXCHANGE, QUARANTINE_QUEUE, RETRY_HEADER, ERROR_HEADER, MAX_RETRIES, REISSUE_HEADER
+from shared import codec, transport
+from shared.stats import Aggregate
+from shared.completion import coalesce
+from shared.evaluation import evaluar_escalar, evaluar_vectorizado
+from consumidor.cache_modelos import CacheModelos, CAPACIDAD_CACHE
+from consumidor.confirmaciones import ConfirmacionesAgrupadas
+from consumidor.planificador import PlanificadorTrabajos
+
+# Control de flujo adaptativo: el prefetch se ajusta para cubrir el RTT con
+# mensajes en vuelo, sin pasar de PREFETCH_MAX mensajes ni de
+# PREFETCH_MAX_ESCENARIOS escenarios retenidos sin ack
+PREFETCH_INICIAL = 32
+PREFETCH_MAX = 2000
+PREFETCH_MAX_ESCENARIOS = 200000
+AJUSTE_PREFETCH_INTERVAL = 2.0
+# Cambiar el prefetch recrea los consumidores y el broker reentrega (redelivered) lo que
+# tenía reservado: solo se hace si el objetivo cambia al menos FACTOR_AJUSTE_PREFETCH
+# veces y pasaron AJUSTE_PREFETCH_MIN segundos desde el ajuste anterior
+FACTOR_AJUSTE_PREFETCH = 2.0
+AJUSTE_PREFETCH_MIN = 30.0
+# Resultados crudos: se publican y confirman en grupo cada N mensajes o T segundos
+ACK_INTERVAL = 0.2
+# Con el tiempo de servicio conocido, el intervalo baja a MENSAJES_POR_GRUPO mensajes de cómputo
+MENSAJES_POR_GRUPO = 4
+INTERVALO_GRUPO_MIN = 0.05
+# Latencias por mensaje que se guardan para los percentiles de las métricas
+VENTANA_LATENCIAS = 1000
+# Pedidos de un modelo sin respuesta tras los que se devuelven sus escenarios a la cola
+MAX_PEDIDOS_MODELO = 3
+# Mensajes que se atienden entre dos pasadas de I/O (timers, acks, entregas nuevas)
+MENSAJES_POR_VUELTA = 16
+# Latencias medidas a partir de las cuales se deja de usar el perfil del modelo
+MIN_MEDICIONES_SERVICIO = 10
 
 class ConsumidorMonteCarlo:
-    def __init__(self, worker_id=None):
+    def __init__(self, worker_id=None, capacidad_cache=CAPACIDAD_CACHE, resultados_crudos=False, prefetch=None):
         self.worker_id = worker_id or f"worker_{uuid.uuid4().hex[:8]}"
         self.current_model = None
+        self.compilado = None
+        self.modelos = CacheModelos(capacidad_cache)
         self.scenarios_processed = 0
         self.total_processing_time = 0
         self.connection = None
@@ -18,23 +62,70 @@ class ConsumidorMonteCarlo:
         self.last_activity = time.time()
         self.model_loaded = False
         self.model_load_time = None
+        self.resultados_crudos = resultados_crudos
+        # prefetch=None activa el control de flujo adaptativo; un número lo deja fijo
+        self.prefetch_adaptativo = prefetch is None
+        self.prefetch_count = prefetch or PREFETCH_INICIAL
+        self.prefetch_minimo = 1
+        self.rtt = None
+        self.escenarios_por_mensaje = 1.0
+        self.ajustes_prefetch = 0
+        self.ultimo_ajuste_prefetch = 0.0
+        self.perfil_estimado = None  # perfil del productor, hasta medir el servicio propio
+        self.confirmaciones = ConfirmacionesAgrupadas()
+        self.salida = []  # resultados crudos del grupo en curso: (routing_key, body, properties)
+        # (model_id, delivery_tag o None) -> Aggregate y [[start_index, count]] del grupo en curso
+        self.agregados = {}
+        self.unidades = defaultdict(list)
+        self.repetibles = set()  # delivery tags de mensajes cuyo resultado puede llegar dos veces
+        self.escenarios_sin_publicar = 0
+        self.inicio_grupo = None
+        self.resumenes_publicados = 0
+        self.grupos_confirmados = 0
+        self.latencias = deque(maxlen=VENTANA_LATENCIAS)
+        self.ultima_metrica = (time.time(), 0)
+        self.cola_modelos = None
+        self.estacionados = defaultdict(list)  # model_id -> [(method, properties, body)] sin ack
+        self.pedidos_modelo = {}  # model_id -> (último pedido, intentos)
+        # Trabajos: la cola compartida SCENARIOS_QUEUE es el trabajo None
+        self.planificador = PlanificadorTrabajos()
+        self.trabajos = {}  # job_id -> último Job anunciado
+        self.anuncios = {}  # job_id -> hora local del último anuncio
+        self.trabajo_por_modelo = {}  # model_id -> job_id, para rutear los resultados
+        self.suscripciones = {}  # job_id -> {"cola", "tag", "ultima_entrega"}
+        self.cola_trabajos = None
+        self.escenarios_leidos = 0
+        self.reintentados = 0
+        self.en_cuarentena = 0
+        self.detenido = False
         self.connect()
     
     def connect(self):
         try:
-            credentials = pika.PlainCredentials(RABBITMQ_USER, RABBITMQ_PASS)
-            self.connection = pika.BlockingConnection(
-                pika.ConnectionParameters(
-                    host=RABBITMQ_HOST,
-                    port=RABBITMQ_PORT,
-                    credentials=credentials
-                )
-            )
+            self.connection = transport.connect()
             self.channel = self.connection.channel()
             
             self.channel.queue_declare(queue=SCENARIOS_QUEUE, durable=True)
-            self.channel.queue_declare(queue=MODEL_QUEUE, durable=True)
             self.channel.queue_declare(queue=RESULTS_QUEUE, durable=True)
+            self.channel.exchange_declare(exchange=RESULTS_EXCHANGE, exchange_type='topic', durable=True)
+            self.channel.queue_bind(queue=RESULTS_QUEUE, exchange=RESULTS_EXCHANGE, routing_key=RESULTS_BINDING)
+            self.channel.queue_declare(queue=MODEL_REQUEST_QUEUE, durable=True)
+            self.channel.exchange_declare(exchange=METRICS_EXCHANGE, exchange_type='fanout')
+            
+            # Mensajes que agotaron sus reintentos (o que el broker rechazó)
+            self.channel.exchange_declare(exchange=DEAD_LETTER_EXCHANGE, exchange_type='fanout', durable=True)
+            self.channel.queue_declare(queue=QUARANTINE_QUEUE, durable=True)
+            self.channel.queue_bind(queue=QUARANTINE_QUEUE, exchange=DEAD_LETTER_EXCHANGE)
+            
+            # Cola propia para los modelos: recibe el broadcast y las respuestas a los pedidos
+            self.channel.exchange_declare(exchange=MODELS_EXCHANGE, exchange_type='fanout')
+            self.cola_modelos = self.channel.queue_declare(queue='', exclusive=True).method.queue
+            self.channel.queue_bind(exchange=MODELS_EXCHANGE, queue=self.cola_modelos)
+            
+            # Anuncios de trabajos: cada uno indica la cola a la que suscribirse
+            self.channel.exchange_declare(exchange=JOBS_EXCHANGE, exchange_type='fanout')
+            self.cola_trabajos = self.channel.queue_declare(queue='', exclusive=True).method.queue
+            self.channel.queue_bind(exchange=JOBS_EXCHANGE, queue=self.cola_trabajos)
             
             print(f"Consumidor {self.worker_id} conectado a RabbitMQ")
             
@@ -42,56 +133,144 @@ class ConsumidorMonteCarlo:
             print(f"Error conectando consumidor {self.worker_id}: {e}")
             raise
     
-    def cargar_modelo(self):
-        if self.model_loaded and self.current_model:
-            print(f"{self.worker_id}: Modelo {self.current_model.model_id} ya cargado")
-            return True
-            
+    def recibir_modelo(self, ch, method, properties, body):
         try:
-            method_frame, header_frame, body = self.channel.basic_get(MODEL_QUEUE, auto_ack=False)
-            
-            if method_frame and body:
-                model_data = body.decode()
-                self.current_model = MonteCarloModel.from_json(model_data)
-                self.model_loaded = True
-                self.model_load_time = time.time()
-                
-                self.channel.basic_nack(method_frame.delivery_tag, requeue=True)
-                
-                print(f"{self.worker_id} cargó modelo: {self.current_model.model_id}")
-                print(f"Mensaje permanece en cola para otros consumidores")
-                return True
-            else:
-                print(f"{self.worker_id}: No hay modelo disponible en cola")
-                return False
-                
+            compilado = self.modelos.agregar(MonteCarloModel.from_json(body.decode()))
         except Exception as e:
             print(f"{self.worker_id} error cargando modelo: {e}")
-            return False
+            return
+        
+        print(f"{self.worker_id} cargó modelo: {compilado.model_id}")
+        print(f"Evaluación {'vectorizada' if compilado.vectorizable else 'escalar'}")
+        self.pedidos_modelo.pop(compilado.model_id, None)
+        
+        perfil = compilado.model.profile
+        if perfil and len(self.latencias) < MIN_MEDICIONES_SERVICIO:
+            # Sin mediciones propias, el perfil estima el costo de cada mensaje y su tamaño
+            self.perfil_estimado = perfil
+            self.escenarios_por_mensaje = float(perfil["batch_size"])
+        
+        # Los escenarios que esperaban este modelo se procesan ahora
+        for est_method, est_properties, est_body in self.estacionados.pop(compilado.model_id, []):
+            self.procesar_escenario(self.channel, est_method, est_properties, est_body)
+    
+    def pedir_modelo(self, model_id):
+        _, intentos = self.pedidos_modelo.get(model_id, (0, 0))
+        self.pedidos_modelo[model_id] = (time.time(), intentos + 1)
+        self.channel.basic_publish(
+            exchange='',
+            routing_key=MODEL_REQUEST_QUEUE,
+            body=model_id,
+            properties=pika.BasicProperties(type=MSG_MODEL_REQUEST, reply_to=self.cola_modelos,
+                                            correlation_id=model_id)
+        )
+        print(f"{self.worker_id}: Modelo {model_id} pedido al registro (intento {intentos + 1})")
+    
+    def revisar_pedidos(self):
+        ahora = time.time()
+        for model_id, (pedido, intentos) in list(self.pedidos_modelo.items()):
+            if ahora - pedido < MODEL_REQUEST_TIMEOUT:
+                continue
+            if intentos < MAX_PEDIDOS_MODELO:
+                self.pedir_modelo(model_id)
+                continue
+            
+            # Nadie tiene el modelo: los escenarios vuelven a la cola para otro worker
+            estacionados = self.estacionados.pop(model_id, [])
+            print(f"{self.worker_id}: Modelo {model_id} no disponible, devolviendo {len(estacionados)} mensajes")
+            for est_method, _, _ in estacionados:
+                self.descartar(est_method.delivery_tag, requeue=True)
+            del self.pedidos_modelo[model_id]
+        self.connection.call_later(MODEL_REQUEST_TIMEOUT / 2, self.revisar_pedidos)
+    
+    def recibir_trabajo(self, ch, method, properties, body):
+        try:
+            job = Job.from_json(body.decode())
+        except Exception as e:
+            print(f"{self.worker_id} anuncio de trabajo inválido: {e}")
+            return
+        
+        self.trabajos[job.job_id] = job
+        self.anuncios[job.job_id] = time.time()
+        self.trabajo_por_modelo[job.model_id] = job.job_id
+        if job.job_id in self.suscripciones:
+            self.planificador.agregar(job.job_id, job.weight)
+        elif job.status != "done":
+            self.channel.queue_declare(queue=job.queue, durable=True, arguments=JOB_QUEUE_ARGUMENTS)
+            self.suscribir(job.job_id, job.queue, job.weight)
+            print(f"{self.worker_id} suscripto al trabajo {job.job_id} (peso {job.weight})")
+    
+    def suscribir(self, job_id, cola, peso=1):
+        # Cada consumidor toma el prefetch vigente al suscribirse (basic_qos por consumidor)
+        self.planificador.agregar(job_id, peso)
+        tag = self.channel.basic_consume(queue=cola, on_message_callback=functools.partial(self.recibir_escenario, job_id))
+        self.suscripciones[job_id] = {"cola": cola, "tag": tag, "ultima_entrega": time.time()}
+    
+    def desuscribir(self, job_id):
+        suscripcion = self.suscripciones.pop(job_id)
+        self.channel.basic_cancel(suscripcion["tag"])
+        return suscripcion
+    
+    def recibir_escenario(self, job_id, ch, method, properties, body):
+        # Se encola por trabajo; el planificador decide el orden de atención
+        self.confirmaciones.recibido(method.delivery_tag)
+        if job_id in self.suscripciones:
+            self.suscripciones[job_id]["ultima_entrega"] = time.time()
+        self.planificador.encolar(job_id, (method, properties, body))
+    
+    def atender_pendientes(self, limite=MENSAJES_POR_VUELTA):
+        atendidos = 0
+        while atendidos < limite and self.capacidad_libre() > 0:
+            siguiente = self.planificador.siguiente()
+            if siguiente is None:
+                break
+            job_id, (method, properties, body) = siguiente
+            self.escenarios_leidos = 0
+            self.procesar_escenario(self.channel, method, properties, body)
+            self.planificador.cobrar(job_id, max(self.escenarios_leidos, 1))
+            atendidos += 1
+        return atendidos
+    
+    def capacidad_libre(self):
+        return 1
+    
+    def revisar_trabajos(self):
+        # Un trabajo que ya no se anuncia (o terminó) se abandona cuando su cola deja de entregar
+        ahora = time.time()
+        for job_id in [j for j in self.suscripciones if j is not None]:
+            job = self.trabajos[job_id]
+            anunciado = job.status == "active" and ahora - self.anuncios[job_id] < 3 * JOB_ANNOUNCE_INTERVAL
+            inactivo = job.status == "done" or ahora - self.suscripciones[job_id]["ultima_entrega"] > JOB_IDLE_TIMEOUT
+            if not anunciado and inactivo and not self.planificador.pendientes_de(job_id):
+                self.desuscribir(job_id)
+                self.planificador.quitar(job_id)
+                print(f"{self.worker_id} deja el trabajo {job_id} ({job.status})")
+        self.connection.call_later(JOB_ANNOUNCE_INTERVAL, self.revisar_trabajos)
+    
+    def clave_resultados(self, model_id):
+        job_id = self.trabajo_por_modelo.get(model_id)
+        return self.trabajos[job_id].results_key if job_id else RESULTS_QUEUE
+    
+    def activar_modelo(self, compilado):
+        self.compilado = compilado
+        self.current_model = compilado.model
+        self.model_loaded = True
+        self.model_load_time = compilado.load_time
     
     def ejecutar_modelo(self, scenario):
+        return self.evaluar(scenario.parameters)
+    
+    def evaluar(self, parameters):
         if not self.current_model:
             print("No hay modelo")
             return None, 0
         
         try:
-            context = scenario.parameters.copy()
-            
-            exec_globals = {
-                'random': random,
-                'np': np,
-                'resultado': 0
-            }
-            exec_globals.update(context)
-            
-            # Ejecutar el código del modelo
+            # Ejecutar el código ya compilado del modelo
             start_time = time.time()
-            exec(self.current_model.function_code, exec_globals)
+            result_value = evaluar_escalar(self.compilado.codigo, parameters, self.compilado.exec_globals)
             processing_time = time.time() - start_time
             
-            # Obtener el resultado
-            result_value = exec_globals.get('resultado', 0)
-            
             self.scenarios_processed += 1
             self.total_processing_time += processing_time
             self.last_activity = time.time()
@@ -102,66 +281,435 @@ class ConsumidorMonteCarlo:
             print(f"Error ejecutando modelo: {e}")
             return None, 0
     
+    def ejecutar_lote(self, batch):
+        if self.compilado.vectorizable:
+            try:
+                return self.ejecutar_lote_vectorizado(batch)
+            except Exception as e:
+                print(f"Error en evaluación vectorizada, usando bucle escalar: {e}")
+                self.compilado.vectorizable = False
+        
+        results = []
+        processing_time = 0
+        for parameters in batch.rows():
+            result_value, tiempo = self.evaluar(parameters)
+            results.append(result_value)
+            processing_time += tiempo
+        return results, processing_time
+    
+    def ejecutar_lote_vectorizado(self, batch):
+        columnas = {name: np.asarray(values, dtype=float) for name, values in batch.columns.items()}
+        
+        start_time = time.time()
+        valores = evaluar_vectorizado(self.compilado.codigo, columnas, batch.count)
+        processing_time = time.time() - start_time
+        
+        self.scenarios_processed += batch.count
+        self.total_processing_time += processing_time
+        self.last_activity = time.time()
+        
+        return valores.tolist(), processing_time
+    
+    def asegurar_modelo(self, method, properties, body, model_id):
+        if self.current_model and model_id == self.current_model.model_id:
+            return True
+        
+        compilado = self.modelos.obtener(model_id)
+        if compilado:
+            self.activar_modelo(compilado)
+            return True
+        
+        # Sin el modelo el mensaje queda estacionado (sin ack) hasta que llegue
+        self.estacionados[model_id].append((method, properties, body))
+        if model_id not in self.pedidos_modelo:
+            self.pedir_modelo(model_id)
+        return False
+    
     def procesar_escenario(self, ch, method, properties, body):
+        self.confirmaciones.recibido(method.delivery_tag)
+        if self.puede_repetirse(method, properties):
+            self.repetibles.add(method.delivery_tag)
+        if properties.type == MSG_SCENARIO_BATCH:
+            self.procesar_lote(ch, method, properties, body)
+            return
+        if properties.type == MSG_WORK_UNIT:
+            self.procesar_unidad(ch, method, properties, body)
+            return
+        
+        recibido = time.time()
         try:
-            scenario_data = body.decode()
-            scenario = Scenario.from_json(scenario_data)
-            
-            if not self.current_model or scenario.model_id != self.current_model.model_id:
-                print(f"{self.worker_id}: Recargando modelo para {scenario.model_id}")
-                if not self.cargar_modelo():
-                    print(f"{self.worker_id}: Modelo no disponible, reintentando...")
-                    ch.basic_nack(delivery_tag=method.delivery_tag, requeue=True)
-                    time.sleep(1)
+            if properties.content_type == CONTENT_TYPE_BINARY:
+                # En binario las variables van por índice: hace falta el modelo para decodificar
+                if not self.asegurar_modelo(method, properties, body, codec.peek_model_id(body)):
+                    return
+                scenario = codec.decode_scenario(body, self.compilado.nombres_variables)
+            else:
+                scenario = Scenario.from_json(body.decode())
+                if not self.asegurar_modelo(method, properties, body, scenario.model_id):
                     return
             
             print(f"{self.worker_id} procesando: {scenario.scenario_id}")
             
             result_value, processing_time = self.ejecutar_modelo(scenario)
+            self.entregar_resultado(scenario, result_value, properties.content_type, method.delivery_tag)
+            self.latencias.append(time.time() - recibido)
             
-            if result_value is not None:
-                result = Result(
-                    scenario_id=scenario.scenario_id,
-                    model_id=scenario.model_id,
-                    result=result_value,
-                    worker_id=self.worker_id
-                )
-                
-                self.channel.basic_publish(
-                    exchange='',
-                    routing_key=RESULTS_QUEUE,
-                    body=result.to_json(),
-                    properties=pika.BasicProperties(delivery_mode=2)
-                )
-                
-                print(f"{self.worker_id} completó {scenario.scenario_id}")
+        except Exception as e:
+            print(f"Error procesando escenario: {e}")
+            self.reintentar(method, properties, body, e)
+    
+    def leer_lote(self, ch, method, properties, body):
+        if properties.content_type == CONTENT_TYPE_BINARY:
+            if not self.asegurar_modelo(method, properties, body, codec.peek_model_id(body)):
+                return None
+            batch = codec.decode_scenario_batch(body, self.compilado.nombres_variables)
+        else:
+            batch = ScenarioBatch.from_json(body.decode())
+            if not self.asegurar_modelo(method, properties, body, batch.model_id):
+                return None
+        self.escenarios_leidos = batch.count
+        return batch
+    
+    def procesar_lote(self, ch, method, properties, body):
+        recibido = time.time()
+        try:
+            batch = self.leer_lote(ch, method, properties, body)
+            if batch is None:
+                return
+            
+            results, processing_time = self.ejecutar_lote(batch)
+            print(f"{self.worker_id} completó lote {batch.batch_id} ({batch.count} escenarios, {processing_time:.3f}s)")
             
-            ch.basic_ack(delivery_tag=method.delivery_tag)
+            self.entregar_lote(batch, results, properties.content_type, method.delivery_tag)
+            self.latencias.append(time.time() - recibido)
             
         except Exception as e:
-            print(f"Error procesando escenario: {e}")
-            ch.basic_nack(delivery_tag=method.delivery_tag, requeue=False)
+            print(f"Error procesando lote: {e}")
+            self.reintentar(method, properties, body, e)
+    
+    def leer_unidad(self, ch, method, properties, body):
+        unit = WorkUnit.from_json(body.decode())
+        if not self.asegurar_modelo(method, properties, body, unit.model_id):
+            return None
+        
+        # Los escenarios se generan aquí: (semilla, índice) los fija sin importar qué worker los calcule
+        columns = self.compilado.sampler(unit.seed).sample(unit.start_index, unit.count)
+        self.escenarios_leidos = unit.count
+        return ScenarioBatch(unit.unit_id, unit.model_id, unit.start_index, columns)
+    
+    def procesar_unidad(self, ch, method, properties, body):
+        recibido = time.time()
+        try:
+            batch = self.leer_unidad(ch, method, properties, body)
+            if batch is None:
+                return
+            
+            results, processing_time = self.ejecutar_lote(batch)
+            print(f"{self.worker_id} completó unidad {batch.batch_id} ({batch.count} escenarios, {processing_time:.3f}s)")
+            
+            self.entregar_lote(batch, results, WIRE_CONTENT_TYPE, method.delivery_tag)
+            self.latencias.append(time.time() - recibido)
+            
+        except Exception as e:
+            print(f"Error procesando unidad de trabajo: {e}")
+            self.reintentar(method, properties, body, e)
+    
+    def entregar_resultado(self, scenario, result_value, content_type, delivery_tag):
+        if not self.resultados_crudos:
+            columns = {name: [value] for name, value in scenario.parameters.items()}
+            indice = int(scenario.scenario_id.rsplit('_', 1)[1])
+            self.acumular(scenario.model_id, [result_value], delivery_tag, columns, [indice, 1])
+            return
+        
+        # Un escenario fallido también se publica (result None): así queda contado como terminado
+        result = Result(
+            scenario_id=scenario.scenario_id,
+            model_id=scenario.model_id,
+            result=result_value,
+            worker_id=self.worker_id
+        )
+        
+        result_body, content_type = self.serializar(result, content_type)
+        self.salida.append((self.clave_resultados(scenario.model_id), result_body,
+                            pika.BasicProperties(delivery_mode=2, content_type=content_type)))
+        
+        estado = "completó" if result_value is not None else "falló en"
+        print(f"{self.worker_id} {estado} {scenario.scenario_id}")
+        
+        self.resuelto(delivery_tag, 1)
+    
+    def entregar_lote(self, batch, results, content_type, delivery_tag):
+        if self.resultados_crudos:
+            self.salida.append((self.clave_resultados(batch.model_id), *self.mensaje_resultado_lote(batch, results, content_type)))
+            self.resuelto(delivery_tag, batch.count)
+        else:
+            self.acumular(batch.model_id, results, delivery_tag, batch.columns, [batch.start_index, batch.count])
+    
+    def puede_repetirse(self, method, properties):
+        # Reentregas, reintentos y copias del productor: otro worker puede haber calculado lo mismo
+        headers = properties.headers or {}
+        return method.redelivered or RETRY_HEADER in headers or REISSUE_HEADER in headers
+    
+    def acumular(self, model_id, results, delivery_tag, columns=None, unidad=None):
+        # Los resúmenes que repiten un escenario ya contado se descartan enteros: lo que
+        # puede ser una copia va en su propio resumen, así no arrastra a los demás lotes
+        clave = (model_id, delivery_tag if delivery_tag in self.repetibles else None)
+        self.repetibles.discard(delivery_tag)
+        if clave not in self.agregados:
+            compilado = self.modelos.consultar(model_id)
+            self.agregados[clave] = Aggregate(controls=compilado.controles if compilado else None)
+        self.agregados[clave].update(results, columns)
+        if unidad is not None:
+            self.unidades[clave].append(unidad)
+        self.escenarios_sin_publicar += len(results)
+        self.resuelto(delivery_tag, len(results))
+    
+    def resuelto(self, delivery_tag, escenarios):
+        self.confirmaciones.listo(delivery_tag)
+        if self.inicio_grupo is None:
+            self.inicio_grupo = time.time()
+            # El grupo se cierra a tiempo aunque el intervalo sea menor que el período de revisar_grupo
+            self.connection.call_later(self.intervalo_grupo(), self.vaciar_vencido)
+        self.escenarios_por_mensaje = 0.9 * self.escenarios_por_mensaje + 0.1 * escenarios
+        if self.grupo_completo():
+            self.vaciar_grupo()
+    
+    def tamano_grupo(self):
+        # Medio prefetch: el broker sigue entregando la otra mitad mientras se confirma este grupo
+        return max(1, self.prefetch_count // 2)
+    
+    def intervalo_grupo(self):
+        # Un grupo cubre unos MENSAJES_POR_GRUPO mensajes de cómputo, sin pasar del intervalo fijo:
+        # con mensajes grandes no se espera a juntar medio prefetch para publicar
+        tope = ACK_INTERVAL if self.resultados_crudos else SUMMARY_FLUSH_INTERVAL
+        servicio = self.tiempo_servicio()
+        if servicio is None:
+            return tope
+        return min(max(MENSAJES_POR_GRUPO * servicio, INTERVALO_GRUPO_MIN), tope)
+    
+    def grupo_completo(self):
+        intervalo = self.intervalo_grupo()
+        return (len(self.confirmaciones) >= self.tamano_grupo()
+                or self.escenarios_sin_publicar >= SUMMARY_FLUSH_SCENARIOS
+                or (self.inicio_grupo is not None and time.time() - self.inicio_grupo >= intervalo))
+    
+    def vaciar_grupo(self):
+        # Primero se publica todo lo que cubre el grupo y recién después se confirma:
+        # si el worker muere en el medio, el broker reentrega los mensajes sin ack
+        for routing_key, body, properties in self.salida:
+            self.channel.basic_publish(exchange=RESULTS_EXCHANGE, routing_key=routing_key, body=body, properties=properties)
+        self.salida = []
+        self.publicar_resumenes()
+        
+        if self.confirmaciones.confirmar(self.channel):
+            self.grupos_confirmados += 1
+        self.inicio_grupo = None
+    
+    def publicar_resumenes(self):
+        for clave, aggregate in self.agregados.items():
+            model_id = clave[0]
+            self.resumenes_publicados += 1
+            summary = ResultSummary(
+                summary_id=f"{self.worker_id}_{self.resumenes_publicados:06d}",
+                model_id=model_id,
+                worker_id=self.worker_id,
+                aggregate=aggregate.to_dict(),
+                units=coalesce(self.unidades.pop(clave, []))
+            )
+            self.channel.basic_publish(
+                exchange=RESULTS_EXCHANGE,
+                routing_key=self.clave_resultados(model_id),
+                body=summary.to_json(),
+                properties=pika.BasicProperties(delivery_mode=2, type=MSG_RESULT_SUMMARY, content_type=CONTENT_TYPE_JSON)
+            )
+        
+        if self.escenarios_sin_publicar:
+            print(f"{self.worker_id} publicó resumen de {self.escenarios_sin_publicar} escenarios")
+        self.agregados = {}
+        self.unidades.clear()
+        self.escenarios_sin_publicar = 0
+    
+    def descartar(self, delivery_tag, requeue):
+        self.repetibles.discard(delivery_tag)
+        self.confirmaciones.descartado(delivery_tag)
+        self.channel.basic_nack(delivery_tag=delivery_tag, requeue=requeue)
+    
+    def reintentar(self, method, properties, body, error):
+        # Una copia con el contador incrementado vuelve al final de su cola (o a cuarentena)
+        # y recién después se confirma el original: si el worker cae en el medio, se reentrega
+        headers = dict(properties.headers or {})
+        intentos = headers.get(RETRY_HEADER, 0) + 1
+        headers.update({RETRY_HEADER: intentos, ERROR_HEADER: f"{self.worker_id}: {error}"[:500]})
+        copia = pika.BasicProperties(delivery_mode=2, type=properties.type,
+                                     content_type=properties.content_type, headers=headers)
+        
+        if intentos > MAX_RETRIES:
+            print(f"{self.worker_id}: mensaje de {method.routing_key} a cuarentena tras {MAX_RETRIES} reintentos")
+            self.channel.basic_publish(exchange=DEAD_LETTER_EXCHANGE, routing_key=method.routing_key,
+                                       body=body, properties=copia)
+            self.en_cuarentena += 1
+        else:
+            self.channel.basic_publish(exchange='', routing_key=method.routing_key, body=body, properties=copia)
+            self.reintentados += 1
+        self.repetibles.discard(method.delivery_tag)
+        self.confirmaciones.descartado(method.delivery_tag)
+        self.channel.basic_ack(delivery_tag=method.delivery_tag)
+    
+    def vaciar_vencido(self):
+        # Publica y confirma lo acumulado aunque no lleguen más mensajes
+        if len(self.confirmaciones) and self.grupo_completo():
+            self.vaciar_grupo()
+    
+    def revisar_grupo(self):
+        self.vaciar_vencido()
+        self.connection.call_later(self.intervalo_grupo() / 2, self.revisar_grupo)
+    
+    def fijar_prefetch(self, prefetch_count):
+        # basic_qos es una RPC síncrona: su duración sirve como medida del RTT al broker
+        inicio = time.perf_counter()
+        self.channel.basic_qos(prefetch_count=prefetch_count)
+        rtt = time.perf_counter() - inicio
+        self.rtt = rtt if self.rtt is None else 0.7 * self.rtt + 0.3 * rtt
+        self.prefetch_count = prefetch_count
+        
+        # El límite por consumidor se fija al suscribirse: los consumidores existentes se
+        # recrean para tomarlo. Los mensajes ya entregados siguen sin ack en el canal
+        for job_id in list(self.suscripciones):
+            suscripcion = self.desuscribir(job_id)
+            tag = self.channel.basic_consume(queue=suscripcion["cola"],
+                                             on_message_callback=functools.partial(self.recibir_escenario, job_id))
+            self.suscripciones[job_id] = dict(suscripcion, tag=tag)
+    
+    def tiempo_servicio(self):
+        """Tiempo mediano de cómputo por mensaje, o None si aún no hay mediciones ni perfil."""
+        if len(self.latencias) < MIN_MEDICIONES_SERVICIO:
+            return self.servicio_estimado()
+        return float(np.median(list(self.latencias)[-100:]))
+    
+    def servicio_estimado(self):
+        perfil = self.perfil_estimado
+        if not perfil:
+            return None
+        costo = perfil["vector_cost"] if perfil["vectorizable"] else perfil["scalar_cost"]
+        return (perfil["vector_overhead"] or 0.0) + costo * self.escenarios_por_mensaje
+    
+    def prefetch_objetivo(self):
+        servicio = self.tiempo_servicio()
+        if servicio is None or self.rtt is None:
+            return self.prefetch_count
+        
+        # Producto ancho de banda-retardo: mensajes que el worker consume durante un RTT,
+        # con margen, más el grupo que queda esperando su ack
+        en_vuelo = int(np.ceil(2 * self.rtt / max(servicio, 1e-6)))
+        objetivo = 2 * max(en_vuelo, 1)
+        limite = max(1, int(PREFETCH_MAX_ESCENARIOS / max(self.escenarios_por_mensaje, 1.0)))
+        return max(self.prefetch_minimo, min(objetivo, PREFETCH_MAX, limite))
+    
+    def ajustar_prefetch(self):
+        objetivo = self.prefetch_objetivo()
+        # Solo se cambia ante diferencias grandes y espaciadas, para no oscilar ni reentregar seguido
+        cambio = max(objetivo, self.prefetch_count) / max(min(objetivo, self.prefetch_count), 1)
+        if cambio >= FACTOR_AJUSTE_PREFETCH and time.time() - self.ultimo_ajuste_prefetch >= AJUSTE_PREFETCH_MIN:
+            self.ultimo_ajuste_prefetch = time.time()
+            print(f"{self.worker_id}: prefetch {self.prefetch_count} -> {objetivo} "
+                  f"(RTT {self.rtt * 1000:.2f}ms, servicio {self.tiempo_servicio() * 1000:.3f}ms/msg)")
+            self.fijar_prefetch(objetivo)
+            self.ajustes_prefetch += 1
+        self.connection.call_later(AJUSTE_PREFETCH_INTERVAL, self.ajustar_prefetch)
+    
+    def escenarios_procesados(self):
+        return self.scenarios_processed
+    
+    def procesos_activos(self):
+        return 1
+    
+    def metricas(self):
+        ahora = time.time()
+        procesados = self.escenarios_procesados()
+        antes, procesados_antes = self.ultima_metrica
+        self.ultima_metrica = (ahora, procesados)
+        
+        latencias = np.array(self.latencias) * 1000 if self.latencias else np.zeros(1)
+        return WorkerMetrics(
+            worker_id=self.worker_id,
+            timestamp=ahora,
+            processed=procesados,
+            scenarios_per_sec=(procesados - procesados_antes) / (ahora - antes) if ahora > antes else 0.0,
+            latency_p50=float(np.percentile(latencias, 50)),
+            latency_p99=float(np.percentile(latencias, 99)),
+            cache=self.modelos.estadisticas(),
+            current_model=self.current_model.model_id if self.current_model else None,
+            idle_time=ahora - self.last_activity,
+            processes=self.procesos_activos(),
+            jobs=self.planificador.estadisticas()
+        )
+    
+    def publicar_metricas(self):
+        # Latido periódico: quien no se suscribió al exchange simplemente no lo recibe
+        try:
+            self.channel.basic_publish(
+                exchange=METRICS_EXCHANGE,
+                routing_key='',
+                body=self.metricas().to_json(),
+                properties=pika.BasicProperties(type=MSG_WORKER_METRICS, content_type=CONTENT_TYPE_JSON)
+            )
+        except Exception as e:
+            print(f"{self.worker_id} error publicando métricas: {e}")
+        self.connection.call_later(METRICS_INTERVAL, self.publicar_metricas)
+    
+    def mensaje_resultado_lote(self, batch, results, content_type=CONTENT_TYPE_JSON):
+        result_batch = ResultBatch(
+            batch_id=batch.batch_id,
+            model_id=batch.model_id,
+            start_index=batch.start_index,
+            results=results,
+            worker_id=self.worker_id
+        )
+        
+        result_body, content_type = self.serializar(result_batch, content_type)
+        return result_body, pika.BasicProperties(delivery_mode=2, type=MSG_RESULT_BATCH, content_type=content_type)
+    
+    def serializar(self, mensaje, content_type):
+        # Los resultados se responden en el mismo formato en que llegó el escenario
+        if content_type == CONTENT_TYPE_BINARY:
+            try:
+                if isinstance(mensaje, ResultBatch):
+                    return codec.encode_result_batch(mensaje), CONTENT_TYPE_BINARY
+                return codec.encode_result(mensaje), CONTENT_TYPE_BINARY
+            except (TypeError, ValueError, struct.error):
+                # Resultados no numéricos no caben en float64: se envían como JSON
+                pass
+        return mensaje.to_json(), CONTENT_TYPE_JSON
     
     def iniciar_consumo(self):
         print(f"Consumidor {self.worker_id} iniciando...")
         
-        if not self.cargar_modelo():
-            print(f"{self.worker_id}: Esperando modelo...")
-            time.sleep(2)
-            if not self.cargar_modelo():
-                print(f"{self.worker_id}: Sin modelo")
+        # Los modelos llegan por broadcast o a pedido; no hace falta esperar uno para empezar
+        self.channel.basic_consume(
+            queue=self.cola_modelos,
+            on_message_callback=self.recibir_modelo,
+            auto_ack=True
+        )
         
-        # Configurar consumo de escenarios
-        self.channel.basic_qos(prefetch_count=1)
+        # Configurar consumo de escenarios: la cola compartida y las de cada trabajo anunciado
+        self.fijar_prefetch(max(self.prefetch_count, self.prefetch_minimo))
+        self.suscribir(None, SCENARIOS_QUEUE)
         self.channel.basic_consume(
-            queue=SCENARIOS_QUEUE,
-            on_message_callback=self.procesar_escenario
+            queue=self.cola_trabajos,
+            on_message_callback=self.recibir_trabajo,
+            auto_ack=True
         )
         
         print(f"{self.worker_id} listo para procesar escenarios")
+        self.revisar_grupo()
+        self.revisar_trabajos()
+        self.publicar_metricas()
+        self.revisar_pedidos()
+        if self.prefetch_adaptativo:
+            self.ajustar_prefetch()
         
         try:
-            self.channel.start_consuming()
+            self.bucle_consumo()
         except KeyboardInterrupt:
             print(f"\nConsumidor {self.worker_id} detenido por usuario")
         except Exception as e:
@@ -169,6 +717,16 @@ class ConsumidorMonteCarlo:
         finally:
             self.cerrar()
     
+    def detener(self):
+        # Se puede llamar desde otro hilo: el bucle termina en su próxima vuelta y cerrar() vacía el grupo
+        self.detenido = True
+    
+    def bucle_consumo(self):
+        while not self.detenido:
+            # Con mensajes pendientes solo se recoge lo que ya llegó, sin esperar
+            self.connection.process_data_events(time_limit=0 if len(self.planificador) else 0.1)
+            self.atender_pendientes()
+    
     def obtener_estadisticas(self):
         avg_time = (self.total_processing_time / self.scenarios_processed 
                    if self.scenarios_processed > 0 else 0)
@@ -185,6 +743,16 @@ class ConsumidorMonteCarlo:
             "worker_id": self.worker_id,
             "modelo_actual": modelo_info,
             "modelo_cargado": self.model_loaded,
+            "mensajes_estacionados": sum(len(m) for m in self.estacionados.values()),
+            "cache_modelos": self.modelos.estadisticas(),
+            "resultados": "crudos" if self.resultados_crudos else "resumen",
+            "resumenes_publicados": self.resumenes_publicados,
+            "prefetch": f"{self.prefetch_count} ({'adaptativo' if self.prefetch_adaptativo else 'fijo'}, {self.ajustes_prefetch} ajustes)",
+            "rtt_broker": f"{self.rtt * 1000:.2f}ms" if self.rtt is not None else "N/A",
+            "grupos_confirmados": self.grupos_confirmados,
+            "mensajes_reintentados": self.reintentados,
+            "mensajes_en_cuarentena": self.en_cuarentena,
+            "trabajos": self.planificador.estadisticas(),
             "escenarios_procesados": self.scenarios_processed,
             "tiempo_total_procesamiento": f"{self.total_processing_time:.3f}s",
             "tiempo_promedio": f"{avg_time:.3f}s",
@@ -196,6 +764,9 @@ class ConsumidorMonteCarlo:
     def cerrar(self):
         try:
             if self.connection and not self.connection.is_closed:
+                if len(self.confirmaciones):
+                    self.vaciar_grupo()
+                
                 # Mostrar estadísticas finales
                 print(f"\nEstadisticas {self.worker_id}:")
                 stats = self.obtener_estadisticas()
@@ -208,10 +779,30 @@ class ConsumidorMonteCarlo:
             print(f"Error cerrando consumidor {self.worker_id}: {e}")
 
 if __name__ == "__main__":
-    import sys
+    import argparse
+    
+    parser = argparse.ArgumentParser(description="Consumidor Monte Carlo")
+    parser.add_argument("worker_id", nargs="?", default=None)
+    parser.add_argument("--processes", type=int, default=0,
+                        help="Procesos de cómputo por host (modo pool); 0 = un solo proceso")
+    parser.add_argument("--threads", type=int, default=0,
+                        help="Hilos de cómputo en pipeline (recepción, cómputo y publicación solapados); 0 = sin pipeline")
+    parser.add_argument("--raw", action="store_true",
+                        help="Publicar un resultado por escenario en lugar de resúmenes (depuración)")
+    parser.add_argument("--prefetch", type=int, default=None,
+                        help="Prefetch fijo; por defecto se ajusta según el RTT y el tiempo de cómputo")
+    args = parser.parse_args()
     
-    worker_id = sys.argv[1] if len(sys.argv) > 1 else None
-    consumidor = ConsumidorMonteCarlo(worker_id)
+    if args.processes > 0:
+        from consumidor.pool import PoolConsumidores
+        consumidor = PoolConsumidores(args.processes, args.worker_id, resultados_crudos=args.raw,
+                                      prefetch=args.prefetch)
+    elif args.threads > 0:
+        from consumidor.pipeline import ConsumidorPipeline
+        consumidor = ConsumidorPipeline(args.threads, args.worker_id, resultados_crudos=args.raw,
+                                        prefetch=args.prefetch)
+    else:
+        consumidor = ConsumidorMonteCarlo(args.worker_id, resultados_crudos=args.raw, prefetch=args.prefetch)
     
     try:
         consumidor.iniciar_consumo()
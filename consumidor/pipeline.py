@@ -0,0 +1,224 @@
+import time
+import queue
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from shared import WIRE_CONTENT_TYPE
+from consumidor.consumidor import ConsumidorMonteCarlo, MENSAJES_POR_VUELTA
+from shared.evaluation import evaluar_escalar, evaluar_vectorizado
+
+# Lotes en cálculo por hilo (uno calculando y otro esperando)
+LOTES_POR_HILO = 2
+ETAPAS = ("recepcion", "computo", "publicacion")
+
+
+def _evaluar_lote(compilado, batch):
+    """Evalúa un lote en un hilo de cómputo; devuelve (resultados, tiempo de evaluación)."""
+    if compilado.vectorizable:
+        try:
+            columnas = {name: np.asarray(values, dtype=float) for name, values in batch.columns.items()}
+            start_time = time.time()
+            valores = evaluar_vectorizado(compilado.codigo, columnas, batch.count)
+            return valores.tolist(), time.time() - start_time
+        except Exception as e:
+            print(f"Error en evaluación vectorizada, usando bucle escalar: {e}")
+            compilado.vectorizable = False
+
+    # Globals propios: los del modelo compilado los comparten los demás hilos
+    exec_globals = dict(compilado.exec_globals)
+    results = []
+    start_time = time.time()
+    for parameters in batch.rows():
+        try:
+            results.append(evaluar_escalar(compilado.codigo, parameters, exec_globals))
+        except Exception as e:
+            print(f"Error ejecutando modelo: {e}")
+            results.append(None)
+    return results, time.time() - start_time
+
+
+class LoteEnCalculo:
+    """Un lote entre la etapa de recepción y la de publicación."""
+
+    def __init__(self, batch, compilado, method, properties, body, content_type):
+        self.batch = batch
+        self.compilado = compilado
+        self.method = method
+        self.properties = properties
+        self.body = body  # para reintentarlo si falla
+        self.content_type = content_type
+        self.recibido = time.time()
+        self.resultados = None
+        self.tiempo = 0.0  # evaluación del modelo
+        self.ocupado = 0.0  # todo el trabajo del hilo de cómputo con este lote
+        self.error = None
+
+    def calcular(self):
+        inicio = time.perf_counter()
+        try:
+            self.resultados, self.tiempo = _evaluar_lote(self.compilado, self.batch)
+        except Exception as e:
+            self.error = e
+        self.ocupado = time.perf_counter() - inicio
+
+
+class ConsumidorPipeline(ConsumidorMonteCarlo):
+    """Consumidor en tres etapas que se solapan: recepción, cómputo y publicación.
+
+    El hilo de la conexión recibe y decodifica los mensajes y pasa los lotes a
+    un pool de hilos que evalúa el modelo. Cada lote terminado vuelve al hilo
+    de la conexión (add_callback_threadsafe), que publica los resultados y
+    confirma. Mientras se calcula se siguen leyendo frames y atendiendo
+    heartbeats, y publicar no frena el cómputo. Los lotes en cálculo están
+    acotados a LOTES_POR_HILO por hilo; el resto espera en el planificador.
+
+    numpy libera el GIL en la evaluación vectorizada, así que los hilos
+    calculan en paralelo; los modelos escalares quedan serializados por el
+    GIL y para ellos conviene el modo pool (--processes).
+    """
+
+    def __init__(self, hilos, worker_id=None, resultados_crudos=False, prefetch=None):
+        self.num_hilos = hilos
+        self.ejecutor = None
+        self.en_calculo = 0
+        self.completados = queue.SimpleQueue()
+        # Segundos ocupados por etapa; la utilización se mide por ventanas
+        self.ocupado = dict.fromkeys(ETAPAS, 0.0)
+        self.etapa_actual = None
+        self.inicio_etapas = time.perf_counter()
+        self.ultima_utilizacion = (self.inicio_etapas, dict(self.ocupado))
+        super().__init__(worker_id, resultados_crudos=resultados_crudos, prefetch=prefetch)
+        self.prefetch_minimo = hilos * LOTES_POR_HILO
+
+    @contextmanager
+    def etapa(self, nombre):
+        # Una etapa anidada en otra (p. ej. un grupo que se vacía al recibir) cuenta para la exterior
+        if self.etapa_actual is not None:
+            yield
+            return
+        self.etapa_actual = nombre
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.ocupado[nombre] += time.perf_counter() - inicio
+            self.etapa_actual = None
+
+    def procesar_lote(self, ch, method, properties, body):
+        try:
+            batch = self.leer_lote(ch, method, properties, body)
+            if batch is not None:
+                self.calcular(batch, method, properties, body, properties.content_type)
+
+        except Exception as e:
+            print(f"Error procesando lote: {e}")
+            self.reintentar(method, properties, body, e)
+
+    def procesar_unidad(self, ch, method, properties, body):
+        try:
+            # El muestreo queda en la recepción: los samplers del modelo no son thread-safe
+            batch = self.leer_unidad(ch, method, properties, body)
+            if batch is not None:
+                self.calcular(batch, method, properties, body, WIRE_CONTENT_TYPE)
+
+        except Exception as e:
+            print(f"Error procesando unidad de trabajo: {e}")
+            self.reintentar(method, properties, body, e)
+
+    def calcular(self, batch, method, properties, body, content_type):
+        # El lote lleva su modelo: el actual puede cambiar antes de que termine
+        self.en_calculo += 1
+        self.ejecutor.submit(self.tarea, LoteEnCalculo(batch, self.compilado, method, properties, body, content_type))
+
+    def tarea(self, lote):
+        # Hilo de cómputo: lo único que toca de la conexión es add_callback_threadsafe
+        lote.calcular()
+        self.completados.put(lote)
+        self.connection.add_callback_threadsafe(self.recoger_resultados)
+
+    def recoger_resultados(self):
+        with self.etapa("publicacion"):
+            while True:
+                try:
+                    lote = self.completados.get_nowait()
+                except queue.Empty:
+                    return
+                self.en_calculo -= 1
+                self.ocupado["computo"] += lote.ocupado
+                self.entregar(lote)
+
+    def entregar(self, lote):
+        if lote.error is not None:
+            print(f"Error procesando lote {lote.batch.batch_id}: {lote.error}")
+            self.reintentar(lote.method, lote.properties, lote.body, lote.error)
+            return
+
+        self.scenarios_processed += lote.batch.count
+        self.total_processing_time += lote.tiempo
+        self.last_activity = time.time()
+        try:
+            self.entregar_lote(lote.batch, lote.resultados, lote.content_type, lote.method.delivery_tag)
+            self.latencias.append(time.time() - lote.recibido)
+            print(f"{self.worker_id} completó lote {lote.batch.batch_id} ({lote.batch.count} escenarios, {lote.tiempo:.3f}s)")
+        except Exception as e:
+            print(f"Error publicando lote {lote.batch.batch_id}: {e}")
+            self.descartar(lote.method.delivery_tag, requeue=True)
+
+    def atender_pendientes(self, limite=MENSAJES_POR_VUELTA):
+        with self.etapa("recepcion"):
+            return super().atender_pendientes(limite)
+
+    def vaciar_grupo(self):
+        with self.etapa("publicacion"):
+            super().vaciar_grupo()
+
+    def capacidad_libre(self):
+        return self.num_hilos * LOTES_POR_HILO - self.en_calculo
+
+    def bucle_consumo(self):
+        self.ejecutor = ThreadPoolExecutor(self.num_hilos, thread_name_prefix=f"{self.worker_id}_computo")
+        while not self.detenido:
+            # Un lote terminado corta la espera: su callback se atiende dentro de process_data_events
+            ocioso = not len(self.planificador) or self.capacidad_libre() <= 0
+            self.connection.process_data_events(time_limit=0.1 if ocioso else 0)
+            self.atender_pendientes()
+
+    def utilizacion(self, desde, ocupado_antes):
+        """Fracción del tiempo transcurrido desde `desde` que cada etapa estuvo ocupada."""
+        transcurrido = max(time.perf_counter() - desde, 1e-9)
+        utilizacion = {etapa: (self.ocupado[etapa] - ocupado_antes[etapa]) / transcurrido for etapa in ETAPAS}
+        # El cómputo se reparte entre los hilos: 1.0 es todo el pool ocupado
+        utilizacion["computo"] /= self.num_hilos
+        return utilizacion
+
+    def metricas(self):
+        metricas = super().metricas()
+        metricas.stages = self.utilizacion(*self.ultima_utilizacion)
+        self.ultima_utilizacion = (time.perf_counter(), dict(self.ocupado))
+        return metricas
+
+    def procesos_activos(self):
+        return self.num_hilos
+
+    def tiempo_servicio(self):
+        # Como en el pool: con N hilos en paralelo sale un lote cada latencia / N
+        servicio = super().tiempo_servicio()
+        return servicio / self.num_hilos if servicio is not None else None
+
+    def obtener_estadisticas(self):
+        stats = super().obtener_estadisticas()
+        utilizacion = self.utilizacion(self.inicio_etapas, dict.fromkeys(ETAPAS, 0.0))
+        stats.update({
+            "hilos_computo": self.num_hilos,
+            "lotes_en_calculo": self.en_calculo,
+            "utilizacion_etapas": {etapa: f"{valor * 100:.1f}%" for etapa, valor in utilizacion.items()}
+        })
+        return stats
+
+    def cerrar(self):
+        # Se termina lo que está en cálculo y se publica antes de vaciar el último grupo
+        if self.ejecutor:
+            self.ejecutor.shutdown(wait=True)
+            if self.connection and not self.connection.is_closed:
+                self.recoger_resultados()
+        super().cerrar()
@@ -0,0 +1,66 @@
+from collections import deque
+
+
+class PlanificadorTrabajos:
+    """Reparto ponderado del cómputo del worker entre los trabajos suscriptos.
+
+    Stride scheduling: cada trabajo acumula un pase (escenarios calculados /
+    peso) y siempre se atiende al trabajo con mensajes pendientes de menor
+    pase. Con varias colas con backlog, cada trabajo recibe una fracción del
+    worker proporcional a su peso; un trabajo solo usa el worker completo.
+    Un trabajo que vuelve a tener mensajes arranca desde el menor pase de los
+    activos, así no acumula crédito mientras estuvo vacío.
+    """
+
+    def __init__(self):
+        self.pendientes = {}
+        self.pesos = {}
+        self.pases = {}
+        self.escenarios = {}
+
+    def agregar(self, job_id, peso=1):
+        self.pendientes.setdefault(job_id, deque())
+        self.pases.setdefault(job_id, self._pase_minimo())
+        self.escenarios.setdefault(job_id, 0)
+        self.pesos[job_id] = max(1, peso)
+
+    def quitar(self, job_id):
+        for tabla in (self.pesos, self.pases, self.escenarios):
+            tabla.pop(job_id, None)
+        return list(self.pendientes.pop(job_id, ()))
+
+    def _pase_minimo(self, excepto=None):
+        activos = [self.pases[j] for j, cola in self.pendientes.items() if cola and j != excepto]
+        return min(activos) if activos else min(self.pases.values(), default=0.0)
+
+    def encolar(self, job_id, mensaje):
+        cola = self.pendientes[job_id]
+        if not cola:
+            self.pases[job_id] = max(self.pases[job_id], self._pase_minimo(excepto=job_id))
+        cola.append(mensaje)
+
+    def siguiente(self):
+        """(job_id, mensaje) del trabajo con menor pase, o None si no hay nada pendiente."""
+        candidatos = [j for j, cola in self.pendientes.items() if cola]
+        if not candidatos:
+            return None
+        job_id = min(candidatos, key=self.pases.__getitem__)
+        return job_id, self.pendientes[job_id].popleft()
+
+    def cobrar(self, job_id, escenarios):
+        if job_id in self.pases:
+            self.pases[job_id] += escenarios / self.pesos[job_id]
+            self.escenarios[job_id] += escenarios
+
+    def pendientes_de(self, job_id):
+        return len(self.pendientes.get(job_id, ()))
+
+    def __len__(self):
+        return sum(len(cola) for cola in self.pendientes.values())
+
+    def estadisticas(self):
+        return {
+            str(job_id): {"peso": self.pesos[job_id], "pendientes": len(self.pendientes[job_id]),
+                          "escenarios": self.escenarios[job_id]}
+            for job_id in self.pesos
+        }
@@ -0,0 +1,316 @@
+import time
+import queue
+import multiprocessing as mp
+from multiprocessing import shared_memory, resource_tracker
+import numpy as np
+from shared.models import MonteCarloModel
+from shared import WIRE_CONTENT_TYPE
+from consumidor.consumidor import ConsumidorMonteCarlo
+from consumidor.cache_modelos import CacheModelos
+from shared.evaluation import evaluar_escalar, evaluar_vectorizado
+
+# Lotes en vuelo por proceso de cómputo (uno calculando y otro esperando)
+LOTES_POR_PROCESO = 2
+# Reinicios de proceso que aguanta un lote antes de devolverse a su cola como fallido
+MAX_REINICIOS_LOTE = 2
+
+
+def _evaluar_bloque(compilado, bloque, nombres, cantidad):
+    """Escribe en la última fila de `bloque` el resultado de cada escenario (NaN si falla)."""
+    columnas = {nombre: bloque[i] for i, nombre in enumerate(nombres)}
+    salida = bloque[len(nombres)]
+
+    if compilado.vectorizable:
+        try:
+            salida[:] = evaluar_vectorizado(compilado.codigo, columnas, cantidad)
+            return
+        except Exception:
+            compilado.vectorizable = False
+
+    for j in range(cantidad):
+        try:
+            parameters = {nombre: float(columnas[nombre][j]) for nombre in nombres}
+            salida[j] = evaluar_escalar(compilado.codigo, parameters, compilado.exec_globals)
+        except Exception:
+            salida[j] = np.nan
+
+
+def _proceso_computo(indice, tareas, completados):
+    """Proceso hijo: evalúa bloques alojados en memoria compartida por el padre.
+
+    Informa lo de cada bloque (los totales los lleva el padre, que sobrevive a
+    los reinicios). Si el modelo ya salió de su cache responde None y el padre
+    reenvía la tarea con el modelo.
+    """
+    modelos = CacheModelos()
+
+    while True:
+        tarea = tareas.get()
+        if tarea is None:
+            break
+
+        tarea_id, nombre_shm, model_json, model_id, nombres, cantidad = tarea
+        if model_json:
+            modelos.agregar(MonteCarloModel.from_json(model_json))
+        compilado = modelos.obtener(model_id)
+        if compilado is None:
+            completados.put((tarea_id, indice, None))
+            continue
+
+        shm = shared_memory.SharedMemory(name=nombre_shm)
+        try:
+            bloque = np.ndarray((len(nombres) + 1, cantidad), dtype=np.float64, buffer=shm.buf)
+            start_time = time.time()
+            _evaluar_bloque(compilado, bloque, nombres, cantidad)
+            tiempo = time.time() - start_time
+            del bloque
+        finally:
+            shm.close()
+
+        completados.put((tarea_id, indice, {
+            "escenarios": cantidad,
+            "tiempo": tiempo,
+            "cache_modelos": modelos.estadisticas()
+        }))
+
+
+class ProcesoComputo:
+    def __init__(self, indice):
+        self.indice = indice
+        self.reinicios = 0
+        self.escenarios_procesados = 0
+        self.tiempo_total = 0.0
+        self.cache_modelos = {}
+        self.iniciar()
+
+    def iniciar(self):
+        # Colas nuevas en cada arranque: un hijo que muere puede dejar las anteriores bloqueadas
+        self.tareas = mp.Queue()
+        self.completados = mp.Queue()
+        self.modelos_enviados = set()
+        self.en_vuelo = {}
+        self.proceso = mp.Process(
+            target=_proceso_computo,
+            args=(self.indice, self.tareas, self.completados),
+            daemon=True
+        )
+        self.proceso.start()
+
+    def completado(self, estadisticas):
+        self.escenarios_procesados += estadisticas["escenarios"]
+        self.tiempo_total += estadisticas["tiempo"]
+        self.cache_modelos = estadisticas["cache_modelos"]
+
+    def enviar(self, tarea_id, lote):
+        model_json = None
+        if lote.model.model_id not in self.modelos_enviados:
+            model_json = lote.model.to_json()
+            self.modelos_enviados.add(lote.model.model_id)
+
+        self.en_vuelo[tarea_id] = lote
+        self.tareas.put((tarea_id, lote.shm.name, model_json, lote.model.model_id, lote.nombres, lote.cantidad))
+
+    def detener(self):
+        if self.proceso.is_alive():
+            self.tareas.put(None)
+            self.proceso.join(timeout=2)
+        if self.proceso.is_alive():
+            self.proceso.terminate()
+
+
+class LoteCompartido:
+    """Bloque columnar (variables + fila de resultados) en memoria compartida."""
+
+    def __init__(self, batch, model, method, properties, body, content_type):
+        self.batch = batch
+        self.model = model
+        self.method = method
+        self.properties = properties
+        self.body = body  # para reintentarlo si hace caer a los procesos
+        self.content_type = content_type
+        self.recibido = time.time()
+        self.reinicios = 0
+        self.nombres = [var.name for var in model.variables]
+        self.cantidad = batch.count
+
+        filas = len(self.nombres) + 1
+        self.shm = shared_memory.SharedMemory(create=True, size=max(filas * self.cantidad * 8, 1))
+        self.bloque = np.ndarray((filas, self.cantidad), dtype=np.float64, buffer=self.shm.buf)
+        for i, nombre in enumerate(self.nombres):
+            self.bloque[i] = batch.columns[nombre]
+
+    def resultados(self):
+        return [None if np.isnan(v) else v for v in self.bloque[-1].tolist()]
+
+    def liberar(self):
+        del self.bloque
+        self.shm.close()
+        self.shm.unlink()
+
+
+class PoolConsumidores(ConsumidorMonteCarlo):
+    """Una conexión a RabbitMQ que reparte lotes entre N procesos de cómputo supervisados."""
+
+    def __init__(self, procesos, worker_id=None, resultados_crudos=False, prefetch=None):
+        self.num_procesos = procesos
+        self.procesos = []
+        self.siguiente_tarea = 0
+        super().__init__(worker_id, resultados_crudos=resultados_crudos, prefetch=prefetch)
+        self.prefetch_minimo = procesos * LOTES_POR_PROCESO
+
+    def iniciar_procesos(self):
+        # El tracker de memoria compartida debe existir antes de crear los hijos para
+        # que lo hereden; si no, cada hijo arranca el suyo y borra los segmentos al morir
+        resource_tracker.ensure_running()
+        self.procesos = [ProcesoComputo(i) for i in range(self.num_procesos)]
+        print(f"{self.worker_id}: {self.num_procesos} procesos de cómputo iniciados")
+
+    def procesar_lote(self, ch, method, properties, body):
+        try:
+            batch = self.leer_lote(ch, method, properties, body)
+            if batch is not None:
+                self.despachar(batch, method, properties, body, properties.content_type)
+
+        except Exception as e:
+            print(f"Error procesando lote: {e}")
+            self.reintentar(method, properties, body, e)
+
+    def procesar_unidad(self, ch, method, properties, body):
+        try:
+            batch = self.leer_unidad(ch, method, properties, body)
+            if batch is not None:
+                self.despachar(batch, method, properties, body, WIRE_CONTENT_TYPE)
+
+        except Exception as e:
+            print(f"Error procesando unidad de trabajo: {e}")
+            self.reintentar(method, properties, body, e)
+
+    def despachar(self, batch, method, properties, body, content_type):
+        lote = LoteCompartido(batch, self.current_model, method, properties, body, content_type)
+
+        # Se asigna al proceso con menos lotes pendientes
+        proceso = min(self.procesos, key=lambda p: len(p.en_vuelo))
+        self.siguiente_tarea += 1
+        proceso.enviar(self.siguiente_tarea, lote)
+
+    def recoger_resultados(self):
+        for proceso in self.procesos:
+            self.recoger_de(proceso)
+
+    def recoger_de(self, proceso):
+        while True:
+            try:
+                tarea_id, indice, estadisticas = proceso.completados.get_nowait()
+            except queue.Empty:
+                return
+
+            if estadisticas is None:
+                # El hijo ya no tiene el modelo (lo desalojó su cache): se reenvía con él
+                lote = proceso.en_vuelo.get(tarea_id)
+                if lote is not None:
+                    proceso.modelos_enviados.discard(lote.model.model_id)
+                    proceso.enviar(tarea_id, lote)
+                continue
+
+            proceso.completado(estadisticas)
+            lote = proceso.en_vuelo.pop(tarea_id, None)
+            if lote is None:
+                continue
+
+            try:
+                self.entregar_lote(lote.batch, lote.resultados(), lote.content_type, lote.method.delivery_tag)
+                self.last_activity = time.time()
+                self.latencias.append(self.last_activity - lote.recibido)
+                print(f"{self.worker_id}/p{indice} completó lote {lote.batch.batch_id} ({lote.cantidad} escenarios)")
+            except Exception as e:
+                print(f"Error publicando lote {lote.batch.batch_id}: {e}")
+                self.descartar(lote.method.delivery_tag, requeue=True)
+            finally:
+                lote.liberar()
+
+    def supervisar(self):
+        for proceso in self.procesos:
+            if proceso.proceso.is_alive():
+                continue
+
+            print(f"{self.worker_id}: proceso {proceso.indice} terminó (código {proceso.proceso.exitcode}), reiniciando")
+            pendientes = proceso.en_vuelo
+            proceso.reinicios += 1
+            proceso.iniciar()
+
+            # Los lotes que tenía asignados siguen en memoria compartida: se reenvían,
+            # salvo los que ya vieron caer demasiados procesos (pueden ser la causa)
+            for tarea_id, lote in pendientes.items():
+                lote.reinicios += 1
+                if lote.reinicios <= MAX_REINICIOS_LOTE:
+                    proceso.enviar(tarea_id, lote)
+                    continue
+                print(f"{self.worker_id}: lote {lote.batch.batch_id} en {lote.reinicios} caídas de proceso, se devuelve")
+                try:
+                    self.reintentar(lote.method, lote.properties, lote.body,
+                                    f"proceso de cómputo terminó (código {proceso.proceso.exitcode})")
+                finally:
+                    lote.liberar()
+
+    def capacidad_libre(self):
+        # Los lotes esperan en el planificador y no en las colas de los procesos:
+        # así el orden entre trabajos lo sigue decidiendo el planificador
+        return self.num_procesos * LOTES_POR_PROCESO - sum(len(p.en_vuelo) for p in self.procesos)
+
+    def bucle_consumo(self):
+        self.iniciar_procesos()
+        while not self.detenido:
+            self.connection.process_data_events(time_limit=0.05)
+            self.recoger_resultados()
+            self.atender_pendientes(len(self.planificador))
+            self.supervisar()
+
+    def escenarios_procesados(self):
+        return self.scenarios_processed + sum(p.escenarios_procesados for p in self.procesos)
+
+    def procesos_activos(self):
+        return sum(1 for p in self.procesos if p.proceso.is_alive())
+
+    def tiempo_servicio(self):
+        # La latencia de un lote incluye la espera en la cola del proceso; con N
+        # procesos en paralelo el pool despacha un lote cada latencia / N
+        servicio = super().tiempo_servicio()
+        return servicio / max(self.procesos_activos(), 1) if servicio is not None else None
+
+    def obtener_estadisticas(self):
+        stats = super().obtener_estadisticas()
+
+        por_proceso = []
+        procesados = self.scenarios_processed
+        tiempo_total = self.total_processing_time
+        for proceso in self.procesos:
+            procesados += proceso.escenarios_procesados
+            tiempo_total += proceso.tiempo_total
+            por_proceso.append({
+                "proceso": proceso.indice,
+                "pid": proceso.proceso.pid,
+                "vivo": proceso.proceso.is_alive(),
+                "reinicios": proceso.reinicios,
+                "lotes_en_vuelo": len(proceso.en_vuelo),
+                "escenarios_procesados": proceso.escenarios_procesados,
+                "tiempo_total_procesamiento": f"{proceso.tiempo_total:.3f}s",
+                "cache_modelos": proceso.cache_modelos
+            })
+
+        avg_time = tiempo_total / procesados if procesados > 0 else 0
+        stats.update({
+            "procesos": por_proceso,
+            "escenarios_procesados": procesados,
+            "tiempo_total_procesamiento": f"{tiempo_total:.3f}s",
+            "tiempo_promedio": f"{avg_time:.3f}s",
+            "eficiencia": f"{(avg_time * 1000):.1f}ms/escenario" if avg_time > 0 else "N/A"
+        })
+        return stats
+
+    def cerrar(self):
+        super().cerrar()
+        for proceso in self.procesos:
+            proceso.detener()
+            for lote in proceso.en_vuelo.values():
+                lote.liberar()
+            proceso.en_vuelo = {}
@@ -0,0 +1,165 @@
+import json
+import math
+from statistics import NormalDist
+from shared.models import Result, ResultBatch, ResultSummary
+from shared import MSG_RESULT_BATCH, MSG_RESULT_SUMMARY, CONTENT_TYPE_BINARY
+from shared import codec
+from shared.stats import Aggregate, SKETCH_ACCURACY
+
+# Escenarios mínimos antes de aceptar la convergencia: con pocas muestras el
+# error estimado también es ruidoso y puede cortar demasiado pronto
+MIN_ESCENARIOS_CONVERGENCIA = 1000
+CONFIANZA_POR_DEFECTO = 0.95
+
+
+class ObjetivoPrecision:
+    """Precisión buscada para la media o un cuantil de los resultados.
+
+    tipo 'rse' es el error estándar relativo (error estándar / |estimación|);
+    'halfwidth' es la semiamplitud absoluta del intervalo de confianza. Para
+    cuantiles el intervalo es el de estadísticos de orden (sin supuestos de
+    distribución), evaluado sobre el sketch del Aggregate.
+    """
+
+    def __init__(self, estadistico='mean', tipo='rse', valor=0.01, confianza=CONFIANZA_POR_DEFECTO):
+        if tipo not in ('rse', 'halfwidth'):
+            raise ValueError(f"Tipo de precisión desconocido: {tipo}")
+        if valor <= 0:
+            raise ValueError("La precisión objetivo debe ser positiva")
+        if not 0 < confianza < 1:
+            raise ValueError("La confianza debe estar entre 0 y 1")
+        self.estadistico = estadistico
+        self.cuantil = None if estadistico == 'mean' else self._cuantil(estadistico)
+        self.tipo = tipo
+        self.valor = valor
+        self.confianza = confianza
+        self.z = NormalDist().inv_cdf(0.5 + confianza / 2)
+
+        if self.cuantil is not None and tipo == 'rse' and valor < SKETCH_ACCURACY:
+            print(f"Advertencia: el sketch de cuantiles tiene error relativo {SKETCH_ACCURACY}; "
+                  f"un objetivo rse={valor} puede no alcanzarse")
+
+    @staticmethod
+    def _cuantil(estadistico):
+        # 'p95' -> 0.95, 'p99.9' -> 0.999, 'median' -> 0.5
+        if estadistico == 'median':
+            return 0.5
+        if estadistico.startswith('p'):
+            q = float(estadistico[1:]) / 100
+            if 0 < q < 1:
+                return q
+        raise ValueError(f"Estadístico desconocido: {estadistico}")
+
+    @classmethod
+    def desde_texto(cls, texto):
+        """'mean rse=0.001', 'p95 halfwidth=0.5 confidence=0.99'."""
+        partes = texto.split()
+        if len(partes) < 2:
+            raise ValueError(f"Objetivo de precisión inválido: '{texto}'")
+        opciones = dict(parte.split("=", 1) for parte in partes[1:])
+        confianza = float(opciones.pop("confidence", CONFIANZA_POR_DEFECTO))
+        if len(opciones) != 1:
+            raise ValueError(f"Se esperaba 'rse=' o 'halfwidth=' en '{texto}'")
+        (tipo, valor), = opciones.items()
+        return cls(partes[0], tipo, float(valor), confianza)
+
+    def estimar(self, aggregate):
+        """(estimación, semiamplitud del intervalo de confianza)."""
+        stats = aggregate.stats
+        if stats.count < 2:
+            return None, math.inf
+        if self.cuantil is None:
+            # Estimador ajustado si los workers acumulan variables de control
+            return aggregate.mean, self.z * aggregate.stderr
+
+        # Intervalo de orden: los cuantiles q ± z·sqrt(q(1-q)/n) acotan al cuantil q
+        q, n = self.cuantil, stats.count
+        delta = self.z * math.sqrt(q * (1 - q) / n)
+        inferior = aggregate.sketch.quantile(max(0.0, q - delta))
+        superior = aggregate.sketch.quantile(min(1.0, q + delta))
+        return aggregate.sketch.quantile(q), (superior - inferior) / 2
+
+    def error(self, aggregate):
+        estimacion, semiamplitud = self.estimar(aggregate)
+        if self.tipo == 'halfwidth':
+            return semiamplitud
+        if estimacion is None or estimacion == 0:
+            return math.inf
+        return semiamplitud / self.z / abs(estimacion)
+
+    def alcanzado(self, aggregate):
+        return aggregate.stats.count >= MIN_ESCENARIOS_CONVERGENCIA and self.error(aggregate) <= self.valor
+
+    def escenarios_necesarios(self, aggregate):
+        # El error baja como 1/sqrt(n): n_necesario = n·(error / objetivo)²
+        n = aggregate.stats.count
+        error = self.error(aggregate)
+        if n < 2 or not math.isfinite(error):
+            return None
+        return max(MIN_ESCENARIOS_CONVERGENCIA, math.ceil(n * (error / self.valor) ** 2))
+
+    def __str__(self):
+        return f"{self.estadistico} {self.tipo}={self.valor} (confianza {self.confianza:.0%})"
+
+
+class SeguimientoConvergencia:
+    """Estadísticos de un modelo armados a partir del stream de resultados.
+
+    Con `en_vuelo` (UnidadesEnVuelo) cada escenario se cuenta una sola vez
+    aunque lo hayan calculado dos workers.
+    """
+
+    def __init__(self, model_id, objetivo, en_vuelo=None):
+        self.model_id = model_id
+        self.objetivo = objetivo
+        self.en_vuelo = en_vuelo
+        self.aggregate = Aggregate()
+        self.mensajes = 0
+
+    @property
+    def recibidos(self):
+        return self.aggregate.count
+
+    def recibir(self, ch, method, properties, body):
+        try:
+            binario = properties.content_type == CONTENT_TYPE_BINARY
+            if properties.type == MSG_RESULT_SUMMARY:
+                summary = ResultSummary.from_json(body.decode())
+                if summary.model_id == self.model_id and self.contar(summary.units):
+                    self.aggregate.merge(Aggregate.from_dict(summary.aggregate))
+            elif properties.type == MSG_RESULT_BATCH:
+                batch = codec.decode_result_batch(body) if binario else ResultBatch.from_json(body.decode())
+                if batch.model_id == self.model_id and self.contar([[batch.start_index, len(batch.results)]]):
+                    self.aggregate.update(batch.results)
+            else:
+                result = codec.decode_result(body) if binario else Result.from_json(body.decode())
+                indice = int(result.scenario_id.rsplit('_', 1)[1])
+                if result.model_id == self.model_id and self.contar([[indice, 1]]):
+                    self.aggregate.update([result.result])
+            self.mensajes += 1
+        except Exception as e:
+            print(f"Error leyendo resultado para convergencia: {e}")
+
+    def contar(self, unidades):
+        # Resúmenes sin rangos (workers anteriores): no hay cómo saber si se repiten
+        return self.en_vuelo is None or not unidades or self.en_vuelo.completar(unidades)
+
+    def alcanzado(self):
+        return self.objetivo.alcanzado(self.aggregate)
+
+    def escenarios_necesarios(self):
+        return self.objetivo.escenarios_necesarios(self.aggregate)
+
+    def resumen(self):
+        estimacion, semiamplitud = self.objetivo.estimar(self.aggregate)
+        return {
+            "estadistico": self.objetivo.estadistico,
+            "estimacion": estimacion,
+            "intervalo": [estimacion - semiamplitud, estimacion + semiamplitud] if estimacion is not None else None,
+            "error": self.objetivo.error(self.aggregate),
+            "objetivo": str(self.objetivo),
+            "escenarios": self.recibidos
+        }
+
+    def __str__(self):
+        return json.dumps(self.resumen(), ensure_ascii=False)
@@ -0,0 +1,109 @@
+"""Corrida completa en una sola máquina, sin RabbitMQ.
+
+Levanta en un mismo proceso, sobre el transporte 'local' (shared.transport):
+los workers (cada uno con su pool de procesos de cómputo), opcionalmente el
+almacén y el dashboard, y el productor. Los componentes son los mismos que
+en la versión distribuida; solo cambia la conexión que abren.
+
+Uso: python -m productor.nodo_local [--workers 1] [--procesos N] [--dashboard] [--almacen DIR]
+     [--modelo modelos/x.txt [--escenarios N] [--semilla S]]
+
+Sin --modelo se abre el menú interactivo del productor.
+"""
+import argparse
+import json
+import os
+import threading
+import time
+from shared import STORE_DIR, transport
+from shared.transport import LocalTransport
+from productor.productor import ProductorMonteCarlo
+from consumidor.consumidor import ConsumidorMonteCarlo
+
+
+def iniciar_workers(cantidad, procesos):
+    workers, hilos = [], []
+    for indice in range(cantidad):
+        worker_id = f"local_{indice}"
+        if procesos:
+            from consumidor.pool import PoolConsumidores
+            worker = PoolConsumidores(procesos, worker_id)
+        else:
+            worker = ConsumidorMonteCarlo(worker_id)
+        hilo = threading.Thread(target=worker.iniciar_consumo, daemon=True)
+        hilo.start()
+        workers.append(worker)
+        hilos.append(hilo)
+    return workers, hilos
+
+
+def correr_modelo(productor, workers, ruta, escenarios, semilla):
+    """Publica un modelo, espera todos sus resultados e imprime la estimación."""
+    model = productor.cargar_modelo_desde_archivo(ruta, semilla)
+    if not model or not productor.publicar_modelo():
+        return
+
+    inicio = time.time()
+    if productor.objetivo and not escenarios:
+        productor.publicar_hasta_converger(productor.objetivo)
+        return
+
+    # Publica y espera todos los resultados (los rezagados y huecos se vuelven a publicar)
+    seguimiento = productor.publicar_escenarios(escenarios or model.iterations, productor.tamano_mensaje())
+    duracion = time.time() - inicio
+    print(json.dumps({
+        "segundos": round(duracion, 3),
+        "escenarios_por_s": round(seguimiento.recibidos / duracion) if duracion > 0 else None,
+        "workers": len(workers)
+    }, indent=2, ensure_ascii=False))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sistema Monte Carlo completo en un solo proceso")
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--procesos", type=int, default=os.cpu_count() or 1,
+                        help="Procesos de cómputo por worker; 0 = calcular en el hilo del worker")
+    parser.add_argument("--dashboard", action="store_true", help="Abrir el dashboard (en el hilo principal)")
+    parser.add_argument("--almacen", nargs="?", const=STORE_DIR, default=None, metavar="DIR",
+                        help="Guardar los resultados en el almacén columnar")
+    parser.add_argument("--modelo", default=None, help="Correr este modelo y salir, sin menú")
+    parser.add_argument("--escenarios", type=int, default=None,
+                        help="Escenarios a publicar (por defecto ITERATIONS, o hasta PRECISION si el modelo la define)")
+    parser.add_argument("--semilla", type=int, default=None)
+    args = parser.parse_args()
+
+    transport.set_transport(LocalTransport())
+
+    if args.almacen:
+        from almacen.almacen import AlmacenResultados
+        threading.Thread(target=AlmacenResultados(args.almacen).iniciar, daemon=True).start()
+    workers, hilos = iniciar_workers(args.workers, args.procesos)
+    productor = ProductorMonteCarlo()
+
+    def ejecutar():
+        try:
+            if args.modelo:
+                correr_modelo(productor, workers, args.modelo, args.escenarios, args.semilla)
+            else:
+                productor.ejecutar_interactivo()
+        except KeyboardInterrupt:
+            print("\nCerrando")
+        finally:
+            for worker in workers:
+                worker.detener()
+            # Esperar que cada worker cierre su pool y libere la memoria compartida
+            for hilo in hilos:
+                hilo.join(timeout=10)
+            productor.cerrar()
+
+    if args.dashboard:
+        # matplotlib necesita el hilo principal: el productor corre en otro
+        from visualizador import dashboard
+        threading.Thread(target=ejecutar, daemon=True).start()
+        dashboard.main()
+    else:
+        ejecutar()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+import math
+import time
+import numpy as np
+from shared.models import ResultBatch
+from shared import PROFILE_SCENARIOS, MESSAGE_TARGET_COMPUTE, MESSAGE_MAX_BYTES
+from shared import codec
+from shared.evaluation import ModeloCompilado, evaluar_escalar, evaluar_vectorizado
+
+# Presupuesto de la medición escalar: se corta antes si el modelo es muy caro
+TIEMPO_MAXIMO_ESCALAR = 0.5
+REPETICIONES_VECTORIZADO = 3
+
+
+def _medir_vectorizado(compilado, columnas, cantidad):
+    """(resultados, mejor tiempo) de evaluar las primeras `cantidad` filas vectorizadas."""
+    parciales = {nombre: valores[:cantidad] for nombre, valores in columnas.items()}
+    mejor = math.inf
+    for _ in range(REPETICIONES_VECTORIZADO):
+        inicio = time.perf_counter()
+        valores = evaluar_vectorizado(compilado.codigo, parciales, cantidad)
+        mejor = min(mejor, time.perf_counter() - inicio)
+    return valores, mejor
+
+
+def _tamano_mensaje(costo, sobrecosto, bytes_por_escenario):
+    # Potencia de 2 más cercana al objetivo: conserva la alineación con los
+    # flujos de muestreo, las rebanadas de LHS y los tramos de Sobol
+    ideal = max((MESSAGE_TARGET_COMPUTE - sobrecosto) / max(costo, 1e-9), 1)
+    tamano = 2 ** round(math.log2(ideal))
+    tope = 2 ** int(math.log2(max(MESSAGE_MAX_BYTES / max(bytes_por_escenario, 1), 1)))
+    return max(1, min(tamano, tope))
+
+
+def perfilar_modelo(model, sampler):
+    """Prueba el modelo sobre una muestra y devuelve su perfil de costo.
+
+    Compila FUNCTION, la evalúa escenario por escenario (falla si algún
+    escenario da error) y, si es vectorizable, sobre la muestra completa y la
+    mitad para separar el costo por escenario del costo fijo por llamada.
+    Los resultados vectorizados se comparan con los escalares sobre los
+    mismos escenarios: si difieren, el modelo se marca como no vectorizable.
+    """
+    try:
+        compilado = ModeloCompilado(model)
+    except SyntaxError as e:
+        raise ValueError(f"FUNCTION no compila: {e}")
+
+    columnas = sampler.sample(0, PROFILE_SCENARIOS)
+    filas = [{nombre: float(valores[i]) for nombre, valores in columnas.items()}
+             for i in range(PROFILE_SCENARIOS)]
+
+    escalares = []
+    exec_globals = dict(compilado.exec_globals)
+    inicio = time.perf_counter()
+    for i, parameters in enumerate(filas):
+        try:
+            escalares.append(evaluar_escalar(compilado.codigo, parameters, exec_globals))
+        except Exception as e:
+            raise ValueError(f"FUNCTION falla en el escenario de prueba {i} ({parameters}): {e}")
+        if time.perf_counter() - inicio > TIEMPO_MAXIMO_ESCALAR:
+            break
+    costo_escalar = (time.perf_counter() - inicio) / len(escalares)
+
+    costo_vectorizado = sobrecosto = None
+    if compilado.vectorizable:
+        try:
+            valores, tiempo = _medir_vectorizado(compilado, columnas, PROFILE_SCENARIOS)
+            _, tiempo_mitad = _medir_vectorizado(compilado, columnas, PROFILE_SCENARIOS // 2)
+            esperado = np.asarray(escalares, dtype=float)
+            if np.allclose(valores[:len(esperado)], esperado, equal_nan=True):
+                costo_vectorizado = max(tiempo - tiempo_mitad, 0) / (PROFILE_SCENARIOS - PROFILE_SCENARIOS // 2)
+                sobrecosto = max(tiempo - costo_vectorizado * PROFILE_SCENARIOS, 0)
+        except Exception:
+            pass
+
+    # Tamaño de un resultado como lo publicaría un worker (binario, o JSON si no es numérico)
+    batch = ResultBatch("perfil", model.model_id, 0, escalares, "perfil")
+    try:
+        bytes_resultado = len(codec.encode_result_batch(batch)) / len(escalares)
+    except (TypeError, ValueError):
+        bytes_resultado = len(batch.to_json()) / len(escalares)
+
+    vectorizable = costo_vectorizado is not None
+    costo = costo_vectorizado if vectorizable else costo_escalar
+    bytes_por_escenario = max(8 * len(model.variables), bytes_resultado)
+    tamano = _tamano_mensaje(costo, sobrecosto or 0.0, bytes_por_escenario)
+    return {
+        "vectorizable": vectorizable,
+        "scalar_cost": costo_escalar,
+        "vector_cost": costo_vectorizado,
+        "vector_overhead": sobrecosto,
+        "result_bytes": bytes_resultado,
+        "batch_size": tamano,
+        "message_cost": (sobrecosto or 0.0) + costo * tamano
+    }
+
+
+def describir_perfil(profile):
+    vectorizado = (f"vectorizado {profile['vector_cost'] * 1e6:.3f} µs/escenario"
+                   if profile["vectorizable"] else "no vectorizable")
+    return (f"escalar {profile['scalar_cost'] * 1e6:.2f} µs/escenario, {vectorizado}, "
+            f"{profile['result_bytes']:.0f} B/resultado -> {profile['batch_size']} escenarios por mensaje "
+            f"(~{profile['message_cost'] * 1000:.1f} ms)")
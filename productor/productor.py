@@ -2,38 +2,169 @@
 import pika
 import json
 import uuid
-import numpy as np
 import os
-from shared.models import MonteCarloModel, VariableDefinition, DistributionType, Scenario
-from shared import RABBITMQ_HOST, RABBITMQ_PORT, RABBITMQ_USER, RABBITMQ_PASS, SCENARIOS_QUEUE, MODEL_QUEUE, RESULTS_QUEUE
+import re
+import math
+import time
+from shared.models import MonteCarloModel, VariableDefinition, DistributionType, Scenario, ScenarioBatch, WorkUnit, Job
+from shared import SCENARIOS_QUEUE
+from shared import BATCH_SIZE, MSG_SCENARIO_BATCH, MSG_WORK_UNIT, WIRE_CONTENT_TYPE, CONTENT_TYPE_BINARY, CONTENT_TYPE_JSON
+from shared import MODELS_EXCHANGE, MODEL_REQUEST_QUEUE, MSG_MODEL, RESULTS_EXCHANGE, JOB_QUEUE_ARGUMENTS, REISSUE_HEADER
+from shared import codec, transport
+from shared.sampling import SamplingEngine, STREAM_BLOCK, SAMPLING_METHODS, cholesky_factor
+from shared.distributions import validate_parameters, empirical_values, LIST_PARAMETERS
+from productor.publicador import PublicadorConfirmado
+from productor.registro import RegistroModelos
+from productor.convergencia import ObjetivoPrecision, SeguimientoConvergencia, MIN_ESCENARIOS_CONVERGENCIA
+from productor.perfil import perfilar_modelo, describir_perfil
+from productor.rezagados import UnidadesEnVuelo
+
+# Publicación por olas hasta alcanzar la precisión objetivo: la siguiente ola
+# sale cuando queda menos de media ola pendiente, así los workers no se vacían
+OLA_MAX_CRECIMIENTO = 2
+# Mensajes mínimos por ola: con uno solo, cortar al converger no ahorra nada
+MENSAJES_POR_OLA = 4
+ESPERA_RESULTADOS = 30.0
+
+def parsear_variable(texto, directorio=None):
+    """VariableDefinition de una línea VAR: nombre, distribución, parámetro=valor, ..."""
+    parts = texto.split(",")
+    var_name = parts[0].strip()
+    try:
+        dist_type = DistributionType(parts[1].strip())
+    except (IndexError, ValueError):
+        raise ValueError(f"{var_name}: la distribución debe ser una de "
+                         f"{', '.join(d.value for d in DistributionType)}")
+    
+    params = {}
+    for param in parts[2:]:
+        key, value = (p.strip() for p in param.split("=", 1))
+        if key == "file" and dist_type == DistributionType.EMPIRICAL:
+            # Las observaciones se leen ahora y viajan dentro del modelo
+            with open(os.path.join(directorio or "", value)) as archivo:
+                contenido = " ".join(linea.split("#")[0] for linea in archivo)
+            params["values"] = [float(v) for v in contenido.replace(",", " ").split()]
+        elif key in LIST_PARAMETERS:
+            # Listas separadas por espacios: la coma separa parámetros
+            params[key] = [float(v) for v in value.split()]
+        else:
+            params[key] = float(value)
+    if dist_type == DistributionType.EMPIRICAL and "values" in params:
+        params["values"] = empirical_values(params["values"])
+    
+    validate_parameters(var_name, dist_type, params)
+    return VariableDefinition(var_name, dist_type, params)
+
+def parsear_modelo(lines, directorio=None):
+    """MonteCarloModel y objetivo de precisión (o None) a partir de las líneas de un archivo de modelo.
+    
+    CORRELATION: a, b, c va seguida de una fila de la matriz por línea
+    (valores separados por coma, en el orden de los nombres).
+    """
+    model_id = str(uuid.uuid4())[:8]
+    function_code = ""
+    variables = []
+    iterations = 1000
+    objetivo = None
+    sampling = "random"
+    controls = []
+    correlation = []
+    filas_pendientes = None  # (nombres, filas) de un CORRELATION sin completar
+    
+    for line in lines:
+        line = line.strip()
+        if line.startswith("#") or not line:
+            continue
+        
+        if filas_pendientes is not None:
+            nombres, filas = filas_pendientes
+            if re.match(r"^[A-Z]+:", line):
+                raise ValueError(f"CORRELATION de {', '.join(nombres)} necesita {len(nombres)} filas")
+            filas.append([float(v) for v in line.split(",")])
+            if len(filas) == len(nombres):
+                correlation.append({"variables": nombres, "matrix": filas})
+                filas_pendientes = None
+            continue
+        
+        if line.startswith("FUNCTION:"):
+            function_code = line.replace("FUNCTION:", "").strip()
+        elif line.startswith("ITERATIONS:"):
+            iterations = int(line.replace("ITERATIONS:", "").strip())
+        elif line.startswith("PRECISION:"):
+            objetivo = ObjetivoPrecision.desde_texto(line.replace("PRECISION:", "").strip())
+        elif line.startswith("SAMPLING:"):
+            sampling = line.replace("SAMPLING:", "").strip().lower()
+            if sampling not in SAMPLING_METHODS:
+                raise ValueError(f"SAMPLING debe ser uno de {', '.join(SAMPLING_METHODS)}")
+        elif line.startswith("CONTROL:"):
+            controls = [name.strip() for name in line.replace("CONTROL:", "").split(",") if name.strip()]
+        elif line.startswith("CORRELATION:"):
+            nombres = [name.strip() for name in line.replace("CORRELATION:", "").split(",") if name.strip()]
+            filas_pendientes = (nombres, [])
+        elif line.startswith("VAR:"):
+            variables.append(parsear_variable(line.replace("VAR:", "").strip(), directorio))
+    
+    if filas_pendientes is not None:
+        raise ValueError(f"CORRELATION de {', '.join(filas_pendientes[0])} necesita {len(filas_pendientes[0])} filas")
+    
+    definidas = [var.name for var in variables]
+    repetidas = {name for name in definidas if definidas.count(name) > 1}
+    if repetidas:
+        raise ValueError(f"Variables definidas más de una vez: {', '.join(sorted(repetidas))}")
+    desconocidas = set(controls) - set(definidas)
+    if desconocidas:
+        raise ValueError(f"Variables de control sin VAR: {', '.join(sorted(desconocidas))}")
+    
+    correlacionadas = [name for group in correlation for name in group["variables"]]
+    desconocidas = set(correlacionadas) - set(definidas)
+    if desconocidas:
+        raise ValueError(f"Variables de CORRELATION sin VAR: {', '.join(sorted(desconocidas))}")
+    repetidas = {name for name in correlacionadas if correlacionadas.count(name) > 1}
+    if repetidas:
+        raise ValueError(f"Variables en más de un CORRELATION: {', '.join(sorted(repetidas))}")
+    for group in correlation:
+        cholesky_factor(group["variables"], group["matrix"])
+    
+    model = MonteCarloModel(
+        model_id=model_id,
+        function_code=function_code,
+        variables=variables,
+        iterations=iterations,
+        sampling=sampling,
+        controls=controls,
+        correlation=correlation
+    )
+    return model, objetivo
 
 class ProductorMonteCarlo:
     def __init__(self):
         self.connection = None
         self.channel = None
         self.current_model = None
+        self.sampler = None
         self.scenarios_generados = 0
+        self.publicador = None
+        self.content_type = WIRE_CONTENT_TYPE
         self.modelos_disponibles = {}
+        self.objetivo = None
+        self.trabajo = None
+        self.en_vuelo = None  # lotes del trabajo actual sin resultado (UnidadesEnVuelo)
+        self.registro = RegistroModelos()
         self.connect()
+        self.registro.iniciar()
         self.cargar_modelos_disponibles()
     
     def connect(self):
         try:
-            credentials = pika.PlainCredentials(RABBITMQ_USER, RABBITMQ_PASS)
-            self.connection = pika.BlockingConnection(
-                pika.ConnectionParameters(
-                    host=RABBITMQ_HOST,
-                    port=RABBITMQ_PORT,
-                    credentials=credentials
-                )
-            )
+            self.connection = transport.connect()
             self.channel = self.connection.channel()
             
             # Declarar las colas
             self.channel.queue_declare(queue=SCENARIOS_QUEUE, durable=True)
-            self.channel.queue_declare(queue=MODEL_QUEUE, durable=True)
+            self.channel.queue_declare(queue=MODEL_REQUEST_QUEUE, durable=True)
+            self.channel.exchange_declare(exchange=MODELS_EXCHANGE, exchange_type='fanout')
             
-            print("Productor conectado a RabbitMQ")
+            print(f"Productor conectado ({transport.get_transport().name})")
             
         except Exception as e:
             print(f"Error conectando a RabbitMQ: {e}")
@@ -55,48 +186,32 @@ class ProductorMonteCarlo:
         else:
             print("No hay modelos en el directorio 'modelos/'")
 
-    def cargar_modelo_desde_archivo(self, archivo_path: str):
+    def cargar_modelo_desde_archivo(self, archivo_path: str, seed: int = None):
         try:
             with open(archivo_path, 'r') as file:
                 lines = file.readlines()
             
-            # Parsear el archivo
-            model_id = str(uuid.uuid4())[:8]
-            function_code = ""
-            variables = []
-            iterations = 1000
+            model, objetivo = parsear_modelo(lines, os.path.dirname(archivo_path))
+            sampler = SamplingEngine(model.variables, seed, method=model.sampling, correlation=model.correlation)
+            # Antes de publicar: un modelo que falla no reemplaza al actual ni llega a los workers
+            model.profile = perfilar_modelo(model, sampler)
+            self.current_model, self.sampler = model, sampler
+            variables = model.variables
+            self.scenarios_generados = 0
+            self.objetivo = objetivo
             
-            for line in lines:
-                line = line.strip()
-                if line.startswith("#") or not line:
-                    continue
-                
-                if line.startswith("FUNCTION:"):
-                    function_code = line.replace("FUNCTION:", "").strip()
-                elif line.startswith("ITERATIONS:"):
-                    iterations = int(line.replace("ITERATIONS:", "").strip())
-                elif line.startswith("VAR:"):
-                    parts = line.replace("VAR:", "").strip().split(",")
-                    var_name = parts[0].strip()
-                    dist_type = DistributionType(parts[1].strip())
-                    
-                    params = {}
-                    for param in parts[2:]:
-                        key, value = param.strip().split("=")
-                        params[key] = float(value)
-                    
-                    variables.append(VariableDefinition(var_name, dist_type, params))
-            
-            self.current_model = MonteCarloModel(
-                model_id=model_id,
-                function_code=function_code,
-                variables=variables,
-                iterations=iterations
-            )
-            
-            print(f"Modelo cargado: {model_id}")
+            print(f"Modelo cargado: {self.current_model.model_id}")
             print(f"Variables: {[var.name for var in variables]}")
-            print(f"Iteraciones: {iterations}")
+            print(f"Iteraciones: {self.current_model.iterations}")
+            print(f"Muestreo: {self.current_model.sampling}")
+            if self.current_model.controls:
+                print(f"Variables de control: {self.current_model.controls}")
+            for group in self.current_model.correlation:
+                print(f"Correlacionadas: {group['variables']}")
+            print(f"Semilla: {self.sampler.seed}")
+            print(f"Perfil: {describir_perfil(self.current_model.profile)}")
+            if objetivo:
+                print(f"Precisión objetivo: {objetivo}")
             
             return self.current_model
             
@@ -104,63 +219,283 @@ class ProductorMonteCarlo:
             print(f"Error cargando modelo: {e}")
             return None
     
-    def publicar_modelo(self):
+    def publicar_modelo(self, peso: int = 1):
         if not self.current_model:
             print("o hay modelo cargado")
             return False
         
         try:
-            try:
-                self.channel.queue_purge(MODEL_QUEUE)
-                print("Modelo anterior eliminado")
-            except Exception as e:
-                print(f"No se pudo limpiar cola de modelo: {e}")
+            # El registro responde a los workers que lo pidan más tarde por model_id
+            self.registro.registrar(self.current_model)
+            
+            # Cada modelo publicado es un trabajo nuevo con su propia cola; el anterior
+            # queda cerrado y los workers terminan lo que tenga pendiente
+            if self.trabajo and self.trabajo.status == "active":
+                self.trabajo.status = "closed"
+                self.registro.anunciar(self.trabajo)
+            self.trabajo = Job(str(uuid.uuid4())[:8], self.current_model.model_id, peso,
+                               first_index=self.scenarios_generados)
+            self.en_vuelo = UnidadesEnVuelo()
             
             properties = pika.BasicProperties(
-                delivery_mode=2,
-                expiration='300000'
+                type=MSG_MODEL,
+                content_type=CONTENT_TYPE_JSON
             )
             
+            # Broadcast a los workers ya conectados; cada uno lo guarda en su cache
             self.channel.basic_publish(
-                exchange='',
-                routing_key=MODEL_QUEUE,
+                exchange=MODELS_EXCHANGE,
+                routing_key='',
                 body=self.current_model.to_json(),
                 properties=properties
-            )           
+            )
+            # Los workers se suscriben a la cola del trabajo al recibir el anuncio
+            self.registro.registrar_trabajo(self.trabajo)
+            print(f"Trabajo {self.trabajo.job_id} (peso {peso}) en la cola {self.trabajo.queue}")
             return True
             
         except Exception as e:
             print(f"Error publicando modelo: {e}")
             return False
     
-    def generar_escenario(self):
+    def generar_escenario(self, indice: int = None):
         if not self.current_model:
             return None
         
-        parameters = {}
-        for variable in self.current_model.variables:
-            if variable.distribution == DistributionType.UNIFORM:
-                low = variable.parameters.get('min', 0)
-                high = variable.parameters.get('max', 1)
-                parameters[variable.name] = np.random.uniform(low, high)
-            
-            elif variable.distribution == DistributionType.NORMAL:
-                mean = variable.parameters.get('mean', 0)
-                std = variable.parameters.get('std', 1)
-                parameters[variable.name] = np.random.normal(mean, std)
-            
-            elif variable.distribution == DistributionType.EXPONENTIAL:
-                scale = variable.parameters.get('scale', 1)
-                parameters[variable.name] = np.random.exponential(scale)
+        indice = self.scenarios_generados if indice is None else indice
+        columns = self.sampler.sample(indice, 1)
+        parameters = {name: float(values[0]) for name, values in columns.items()}
         
-        scenario_id = f"{self.current_model.model_id}_{self.scenarios_generados:06d}"
+        scenario_id = f"{self.current_model.model_id}_{indice:06d}"
         return Scenario(scenario_id, self.current_model.model_id, parameters)
     
-    def publicar_escenarios(self, cantidad: int):
+    def generar_lote(self, cantidad: int, inicio: int = None):
         if not self.current_model:
+            return None
+        
+        # Un arreglo por variable: se muestrea todo el bloque de una vez. Con un
+        # `inicio` ya publicado se regenera el mismo lote (semilla e índice lo fijan)
+        inicio = self.scenarios_generados if inicio is None else inicio
+        columns = self.sampler.sample(inicio, cantidad)
+        
+        batch_id = f"{self.current_model.model_id}_b{inicio:06d}"
+        return ScenarioBatch(batch_id, self.current_model.model_id, inicio, columns)
+    
+    def serializar(self, mensaje):
+        if self.content_type != CONTENT_TYPE_BINARY:
+            return mensaje.to_json()
+        
+        # En binario cada variable se identifica por su posición en el modelo
+        variable_names = [var.name for var in self.current_model.variables]
+        if isinstance(mensaje, ScenarioBatch):
+            return codec.encode_scenario_batch(mensaje, variable_names)
+        return codec.encode_scenario(mensaje, variable_names)
+    
+    def iniciar_publicador(self):
+        # Un publicador por trabajo: cada uno declara y vigila la profundidad de su cola
+        if self.publicador and self.publicador.cola != self.trabajo.queue:
+            self.publicador.cerrar()
+            self.publicador = None
+        if not self.publicador:
+            self.publicador = PublicadorConfirmado(cola=self.trabajo.queue, argumentos=JOB_QUEUE_ARGUMENTS)
+            self.publicador.iniciar()
+        self.publicador.reiniciar_estadisticas()
+    
+    def publicar_ola(self, cantidad: int, batch_size: int, unidades: bool):
+        antes = self.scenarios_generados
+        if unidades:
+            self.publicar_unidades(cantidad, batch_size)
+        elif batch_size > 1:
+            self.publicar_lotes(cantidad, batch_size)
+        else:
+            self.publicar_individuales(cantidad)
+        
+        # El anuncio lleva lo publicado: el dashboard lo usa para el progreso del trabajo
+        self.trabajo.published += self.scenarios_generados - antes
+        self.registro.anunciar(self.trabajo)
+    
+    def publicar_escenarios(self, cantidad: int, batch_size: int = 1, unidades: bool = False, esperar: bool = True):
+        """Publica `cantidad` escenarios y, con `esperar`, sigue sus resultados hasta tenerlos todos.
+        
+        Mientras espera vuelve a publicar los lotes rezagados y los huecos. Devuelve
+        el seguimiento de los resultados (None sin `esperar`).
+        """
+        if not self.trabajo:
+            print("No hay modelo cargado. Primero carga un modelo.")
+            return None
+        
+        batch_size = batch_size or self.tamano_mensaje(unidades)
+        self.iniciar_publicador()
+        seguimiento = suscripcion = None
+        if esperar:
+            seguimiento, suscripcion = self.seguir_resultados(self.objetivo or ObjetivoPrecision())
+        
+        try:
+            antes = self.scenarios_generados
+            self.publicar_ola(cantidad, batch_size, unidades)
+            
+            # Se espera la confirmación del broker antes de dar el trabajo por publicado
+            if not self.publicador.esperar_confirmaciones():
+                print("Advertencia: quedaron mensajes sin confirmar por el broker")
+            print(json.dumps(self.publicador.estadisticas(), indent=2, ensure_ascii=False))
+            
+            if esperar:
+                print(f"Esperando los resultados del trabajo {self.trabajo.job_id}...")
+                self.esperar_resultados(seguimiento, self.scenarios_generados - antes, unidades)
+                print(json.dumps({**seguimiento.resumen(), **self.en_vuelo.estadisticas()}, indent=2, ensure_ascii=False))
+        finally:
+            if suscripcion:
+                self.dejar_de_seguir(suscripcion)
+        return seguimiento
+    
+    def publicar_hasta_converger(self, objetivo: ObjetivoPrecision, batch_size: int = None, unidades: bool = False):
+        if not self.trabajo:
             print("No hay modelo cargado. Primero carga un modelo.")
             return
         
+        tope = self.current_model.iterations
+        self.iniciar_publicador()
+        seguimiento, suscripcion = self.seguir_resultados(objetivo)
+        en_vuelo = self.en_vuelo
+        
+        print(f"Publicando por olas hasta {objetivo}, con tope de {tope} escenarios (ITERATIONS)")
+        # Las olas dependen del objetivo, no del tamaño de mensaje: cada una se parte en varios mensajes
+        ola_inicial = min(tope, MIN_ESCENARIOS_CONVERGENCIA)
+        ola = ola_inicial
+        lote = batch_size
+        publicados = 0
+        olas = 0
+        recibidos = 0
+        ultimo_progreso = time.time()
+        
+        try:
+            while True:
+                pendientes = publicados - seguimiento.recibidos
+                if publicados < tope and pendientes <= ola / 2:
+                    # Se proyectan los escenarios que faltan con el error actual (~1/sqrt(n))
+                    necesarios = seguimiento.escenarios_necesarios() if olas else ola_inicial
+                    faltan = ola if necesarios is None else necesarios - publicados
+                    if faltan > 0:
+                        ola = min(tope - publicados, max(ola_inicial, min(faltan, OLA_MAX_CRECIMIENTO * ola)))
+                        antes = self.scenarios_generados
+                        lote = batch_size or self.tamano_mensaje(unidades, ola)
+                        self.publicar_ola(ola, lote, unidades)
+                        if self.scenarios_generados == antes:
+                            break
+                        publicados += self.scenarios_generados - antes
+                        olas += 1
+                
+                self.connection.process_data_events(time_limit=0.2)
+                self.reemitir_rezagados(unidades)
+                
+                if seguimiento.alcanzado():
+                    break
+                if publicados >= tope and seguimiento.recibidos >= publicados:
+                    print("Se alcanzó ITERATIONS sin llegar a la precisión objetivo")
+                    break
+                if seguimiento.recibidos != recibidos:
+                    recibidos = seguimiento.recibidos
+                    ultimo_progreso = time.time()
+                elif time.time() - ultimo_progreso > ESPERA_RESULTADOS:
+                    print(f"Sin resultados nuevos en {ESPERA_RESULTADOS:.0f}s, se detiene la publicación")
+                    break
+        finally:
+            self.dejar_de_seguir(suscripcion)
+        
+        if not self.publicador.esperar_confirmaciones():
+            print("Advertencia: quedaron mensajes sin confirmar por el broker")
+        
+        purgados = 0
+        if seguimiento.alcanzado():
+            # Lo que sigue en la cola del trabajo ya no cambia la estimación. Lo que los
+            # workers tienen en prefetch se termina de calcular igual
+            mensajes = self.channel.queue_purge(queue=self.trabajo.queue).method.message_count
+            purgados = min(mensajes * (lote or 1), publicados - seguimiento.recibidos)
+            en_vuelo.olvidar()
+            self.trabajo.status = "done"
+            self.registro.anunciar(self.trabajo)
+        
+        print(json.dumps({
+            "convergido": seguimiento.alcanzado(),
+            **seguimiento.resumen(),
+            "olas": olas,
+            "publicados": publicados,
+            "purgados": purgados,
+            "trabajo": self.trabajo.job_id,
+            "tope_iterations": tope,
+            "escenarios_ahorrados": tope - (publicados - purgados),
+            **en_vuelo.estadisticas()
+        }, indent=2, ensure_ascii=False))
+    
+    def seguir_resultados(self, objetivo: ObjetivoPrecision):
+        """Empieza a leer los resultados del trabajo actual; devuelve el seguimiento y su suscripción."""
+        # Cola exclusiva enlazada solo a los resultados de este trabajo, antes de publicar
+        self.channel.exchange_declare(exchange=RESULTS_EXCHANGE, exchange_type='topic', durable=True)
+        cola = self.channel.queue_declare(queue='', exclusive=True).method.queue
+        self.channel.queue_bind(queue=cola, exchange=RESULTS_EXCHANGE, routing_key=self.trabajo.results_key)
+        seguimiento = SeguimientoConvergencia(self.current_model.model_id, objetivo, self.en_vuelo)
+        consumer_tag = self.channel.basic_consume(queue=cola, on_message_callback=seguimiento.recibir, auto_ack=True)
+        return seguimiento, (cola, consumer_tag)
+    
+    def dejar_de_seguir(self, suscripcion):
+        cola, consumer_tag = suscripcion
+        self.channel.basic_cancel(consumer_tag)
+        self.channel.queue_delete(queue=cola)
+    
+    def esperar_resultados(self, seguimiento: SeguimientoConvergencia, total: int, unidades: bool = False):
+        """Espera los resultados de `total` escenarios; False si dejan de llegar."""
+        recibidos = seguimiento.recibidos
+        ultimo_progreso = time.time()
+        huecos_reemitidos = False
+        while seguimiento.recibidos < total:
+            self.connection.process_data_events(time_limit=0.2)
+            self.reemitir_rezagados(unidades)
+            if seguimiento.recibidos != recibidos:
+                recibidos = seguimiento.recibidos
+                ultimo_progreso = time.time()
+            elif time.time() - ultimo_progreso < ESPERA_RESULTADOS:
+                continue
+            elif not huecos_reemitidos:
+                # Un último intento solo con los escenarios que faltan, según el índice de completitud
+                huecos = self.en_vuelo.reemitir_huecos()
+                print(f"Sin resultados nuevos en {ESPERA_RESULTADOS:.0f}s, se vuelven a publicar "
+                      f"{len(huecos)} huecos ({self.en_vuelo.faltantes()} escenarios)")
+                huecos_reemitidos = True
+                ultimo_progreso = time.time()
+            else:
+                print(f"Faltan {self.en_vuelo.faltantes()} escenarios "
+                      f"(los mensajes que fallan quedan en la cola de cuarentena)")
+                return False
+        return True
+    
+    def reemitir_rezagados(self, unidades: bool):
+        # Un lote que no termina (worker colgado o lento) o cuyo resultado se descartó vuelve a
+        # publicarse con el mismo rango: sus escenarios son idénticos a los del original. La
+        # marca hace que el worker lo resuma aparte, por si el original también termina
+        self.en_vuelo.cola(self.publicador.profundidad)
+        copia = {REISSUE_HEADER: 1}
+        for inicio, cantidad in self.en_vuelo.a_reemitir():
+            if cantidad == 1 and not unidades:
+                self.publicador.publicar(
+                    self.serializar(self.generar_escenario(inicio)),
+                    pika.BasicProperties(delivery_mode=2, content_type=self.content_type, headers=copia)
+                )
+            elif unidades:
+                unit = WorkUnit(self.current_model.model_id, self.sampler.seed, inicio, cantidad)
+                self.publicador.publicar(
+                    unit.to_json(),
+                    pika.BasicProperties(delivery_mode=2, type=MSG_WORK_UNIT, content_type=CONTENT_TYPE_JSON, headers=copia),
+                    cantidad
+                )
+            else:
+                self.publicador.publicar(
+                    self.serializar(self.generar_lote(cantidad, inicio)),
+                    pika.BasicProperties(delivery_mode=2, type=MSG_SCENARIO_BATCH, content_type=self.content_type,
+                                         headers=copia),
+                    cantidad
+                )
+    
+    def publicar_individuales(self, cantidad: int):
         print(f"Generando {cantidad} escenarios...")
         escenarios_publicados = 0
         
@@ -168,12 +503,11 @@ class ProductorMonteCarlo:
             try:
                 scenario = self.generar_escenario()
                 if scenario:
-                    self.channel.basic_publish(
-                        exchange='',
-                        routing_key=SCENARIOS_QUEUE,
-                        body=scenario.to_json(),
-                        properties=pika.BasicProperties(delivery_mode=2)
+                    self.publicador.publicar(
+                        self.serializar(scenario),
+                        pika.BasicProperties(delivery_mode=2, content_type=self.content_type)
                     )
+                    self.en_vuelo.publicado(self.scenarios_generados, 1)
                     self.scenarios_generados += 1
                     escenarios_publicados += 1
                     
@@ -182,14 +516,77 @@ class ProductorMonteCarlo:
                 
             except Exception as e:
                 print(f"Error publicando escenario: {e}")
+                break
         
         print(f"Total de escenarios publicados: {escenarios_publicados}")
     
+    def publicar_lotes(self, cantidad: int, batch_size: int = BATCH_SIZE):
+        print(f"Generando {cantidad} escenarios en lotes de {batch_size}...")
+        escenarios_publicados = 0
+        lotes_publicados = 0
+        
+        while escenarios_publicados < cantidad:
+            try:
+                batch = self.generar_lote(min(batch_size, cantidad - escenarios_publicados))
+                if not batch:
+                    break
+                
+                self.publicador.publicar(
+                    self.serializar(batch),
+                    pika.BasicProperties(delivery_mode=2, type=MSG_SCENARIO_BATCH, content_type=self.content_type),
+                    batch.count
+                )
+                self.en_vuelo.publicado(batch.start_index, batch.count)
+                self.scenarios_generados += batch.count
+                escenarios_publicados += batch.count
+                lotes_publicados += 1
+                
+                if lotes_publicados % 10 == 0:
+                    print(f"Escenarios publicados: {escenarios_publicados}/{cantidad}")
+                
+            except Exception as e:
+                print(f"Error publicando lote: {e}")
+                break
+        
+        print(f"Total de escenarios publicados: {escenarios_publicados} ({lotes_publicados} lotes)")
+    
+    def publicar_unidades(self, cantidad: int, unit_size: int = STREAM_BLOCK):
+        # Solo se envía (modelo, semilla, rango): cada worker muestrea sus propios escenarios
+        print(f"Publicando {cantidad} escenarios como unidades de trabajo de {unit_size}...")
+        escenarios_publicados = 0
+        unidades_publicadas = 0
+        
+        while escenarios_publicados < cantidad:
+            try:
+                unit = WorkUnit(
+                    model_id=self.current_model.model_id,
+                    seed=self.sampler.seed,
+                    start_index=self.scenarios_generados,
+                    count=min(unit_size, cantidad - escenarios_publicados)
+                )
+                
+                self.publicador.publicar(
+                    unit.to_json(),
+                    pika.BasicProperties(delivery_mode=2, type=MSG_WORK_UNIT, content_type=CONTENT_TYPE_JSON),
+                    unit.count
+                )
+                self.en_vuelo.publicado(unit.start_index, unit.count)
+                self.scenarios_generados += unit.count
+                escenarios_publicados += unit.count
+                unidades_publicadas += 1
+                
+            except Exception as e:
+                print(f"Error publicando unidad de trabajo: {e}")
+                break
+        
+        print(f"Total de escenarios publicados: {escenarios_publicados} ({unidades_publicadas} unidades, semilla {self.sampler.seed})")
+    
     def mostrar_menu_principal(self):
         print("Sistema Menu")
         print("1.Cargar modelo")
         print("2.Publicar escenarios")
-        print("3.Salir")
+        print("3.Publicar hasta converger")
+        print("4.Salir")
     
     def mostrar_menu_modelos(self):
         self.cargar_modelos_disponibles()
@@ -207,6 +604,24 @@ class ProductorMonteCarlo:
         print(f"{len(modelos_lista) + 1}.Volver al menú principal")
         return modelos_lista
     
+    def tamano_mensaje(self, unidades: bool = False, ola: int = None):
+        # Según el perfil del modelo: cada mensaje lleva unos MESSAGE_TARGET_COMPUTE segundos de cómputo
+        if self.current_model and self.current_model.profile:
+            tamano = self.current_model.profile["batch_size"]
+        else:
+            tamano = STREAM_BLOCK if unidades else BATCH_SIZE
+        if ola:
+            # Publicando por olas, ninguna va en menos de MENSAJES_POR_OLA mensajes (potencia de 2, como el perfil)
+            tamano = min(tamano, 2 ** int(math.log2(max(ola // MENSAJES_POR_OLA, 1))))
+        return tamano
+    
+    def pedir_tamano_mensaje(self, por_ola: bool = False):
+        """(escenarios por mensaje, unidades); None = el tamaño por defecto (por ola, si `por_ola`)."""
+        unidades = input("¿Generar los escenarios en los workers? (s/N): ").strip().lower() == "s"
+        por_defecto = f"hasta {self.tamano_mensaje(unidades)}, según la ola" if por_ola else self.tamano_mensaje(unidades)
+        lote = input(f"Escenarios por mensaje (Enter = {por_defecto}, 1 = sin lotes): ").strip()
+        return (int(lote) if lote else None), unidades
+    
     def ejecutar_interactivo(self):    
         while True:
             self.mostrar_menu_principal()
@@ -223,9 +638,12 @@ class ProductorMonteCarlo:
                     if 1 <= seleccion <= len(modelos_lista):
                         modelo_seleccionado = modelos_lista[seleccion - 1]
                         ruta_modelo = self.modelos_disponibles[modelo_seleccionado]
+                        semilla = input("Semilla (Enter = aleatoria): ").strip()
+                        
+                        peso = input("Peso del trabajo frente a otros (Enter = 1): ").strip()
                         
-                        if self.cargar_modelo_desde_archivo(ruta_modelo):
-                            if self.publicar_modelo():
+                        if self.cargar_modelo_desde_archivo(ruta_modelo, int(semilla) if semilla else None):
+                            if self.publicar_modelo(max(1, int(peso)) if peso else 1):
                                 print(f"Modelo '{modelo_seleccionado}'Modelo Publicado")
                     elif seleccion == len(modelos_lista) + 1:
                         continue
@@ -241,14 +659,35 @@ class ProductorMonteCarlo:
                 
                 try:
                     cantidad = input("Cantidad de escenarios a publicar: ").strip()
-                    if cantidad.isdigit():
-                        self.publicar_escenarios(int(cantidad))
+                    batch_size, unidades = self.pedir_tamano_mensaje()
+                    if cantidad.isdigit() and (batch_size is None or batch_size > 0):
+                        self.publicar_escenarios(int(cantidad), batch_size, unidades)
                     else:
                         print("Ingresa un número válido")
                 except ValueError:
                     print("Ingresa un número válido")
             
             elif opcion == "3":
+                if not self.current_model:
+                    print("carga un modelo")
+                    continue
+                
+                try:
+                    por_defecto = f" (Enter = {self.objetivo})" if self.objetivo else ""
+                    texto = input(f"Precisión objetivo, p. ej. 'mean rse=0.001' o 'p95 halfwidth=0.5'{por_defecto}: ").strip()
+                    objetivo = ObjetivoPrecision.desde_texto(texto) if texto else self.objetivo
+                    if not objetivo:
+                        print("Indica una precisión objetivo")
+                        continue
+                    batch_size, unidades = self.pedir_tamano_mensaje(por_ola=True)
+                    if batch_size is None or batch_size > 0:
+                        self.publicar_hasta_converger(objetivo, batch_size, unidades)
+                    else:
+                        print("Ingresa un número válido")
+                except ValueError as e:
+                    print(f"Valor inválido: {e}")
+            
+            elif opcion == "4":
                 print("Saliendo")
                 break
             
@@ -256,6 +695,9 @@ class ProductorMonteCarlo:
                 print("Opción inválida")
     
     def cerrar(self):
+        if self.publicador:
+            self.publicador.cerrar()
+        self.registro.cerrar()
         if self.connection and not self.connection.is_closed:
             self.connection.close()
             print("Conexión cerrada")
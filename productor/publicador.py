@@ -0,0 +1,214 @@
+import threading
+import time
+from collections import deque
+import numpy as np
+from shared import SCENARIOS_QUEUE, transport
+
+# Mensajes publicados y aún sin confirmar que se permiten a la vez
+VENTANA_CONFIRMACION = 512
+# Escenarios en la cola a los que se pausa y se reanuda la publicación. Cada
+# mensaje lleva un lote, así que se cuentan escenarios y no mensajes: la cola
+# informa mensajes y se multiplican por los escenarios por mensaje publicados
+MARCA_ALTA = 2000000
+MARCA_BAJA = 500000
+INTERVALO_PROFUNDIDAD = 0.5
+MAX_REINTENTOS = 3
+
+
+class PublicadorConfirmado:
+    """Publicador con confirmaciones asíncronas (publisher confirms) y backpressure.
+
+    Usa su propia SelectConnection en un hilo de I/O. `publicar` solo se
+    bloquea si la ventana de mensajes sin confirmar está llena o si la cola
+    tiene más escenarios que la marca alta; los nack del broker se reintentan y
+    los mensajes que se agotan se cuentan como perdidos en vez de ignorarse.
+    """
+
+    def __init__(self, cola=SCENARIOS_QUEUE, ventana=VENTANA_CONFIRMACION,
+                 marca_alta=MARCA_ALTA, marca_baja=MARCA_BAJA, argumentos=None):
+        self.cola = cola
+        self.argumentos = argumentos
+        self.ventana = threading.BoundedSemaphore(ventana)
+        self.marca_alta = marca_alta
+        self.marca_baja = marca_baja
+
+        self.connection = None
+        self.channel = None
+        self.hilo = None
+        self.listo = threading.Event()
+        self.sin_presion = threading.Event()
+        self.sin_presion.set()
+        self.error = None
+
+        self.lock = threading.Lock()
+        self.siguiente_tag = 0
+        self.pendientes = {}
+        self.publicados = 0
+        self.confirmados = 0
+        self.reintentos = 0
+        self.perdidos = 0
+        self.pausas = 0
+        self.inicio_pausa = None
+        self.tiempo_pausado = 0.0
+        self.profundidad = 0
+        # Totales de toda la vida del publicador (no se reinician con las estadísticas)
+        self.mensajes_enviados = 0
+        self.escenarios_enviados = 0
+        self.latencias = deque(maxlen=10000)
+        self.inicio = None
+        self.ultima_confirmacion = None
+
+    def iniciar(self, timeout=10):
+        self.connection = transport.connect_async(
+            on_open_callback=self._on_connection_open,
+            on_open_error_callback=self._on_connection_error,
+            on_close_callback=self._on_connection_closed
+        )
+        self.hilo = threading.Thread(target=self.connection.ioloop.start, daemon=True)
+        self.hilo.start()
+
+        if not self.listo.wait(timeout) or self.error:
+            raise ConnectionError(f"No se pudo abrir el publicador: {self.error or 'timeout'}")
+
+    # --- Hilo de I/O ---
+
+    def _on_connection_open(self, connection):
+        connection.channel(on_open_callback=self._on_channel_open)
+
+    def _on_connection_error(self, connection, error):
+        self.error = error
+        self.listo.set()
+        connection.ioloop.stop()
+
+    def _on_connection_closed(self, connection, reason):
+        if self.pendientes:
+            self.error = reason
+        self.listo.set()
+        self.sin_presion.set()
+        connection.ioloop.stop()
+
+    def _on_channel_open(self, channel):
+        self.channel = channel
+        channel.queue_declare(queue=self.cola, durable=True, arguments=self.argumentos, callback=self._on_queue_ok)
+
+    def _on_queue_ok(self, frame):
+        self.channel.confirm_delivery(self._on_confirmacion, callback=self._on_confirm_ok)
+
+    def _on_confirm_ok(self, frame):
+        self.listo.set()
+        self._consultar_profundidad()
+
+    def _consultar_profundidad(self):
+        if self.channel and self.channel.is_open:
+            self.channel.queue_declare(queue=self.cola, passive=True, callback=self._on_profundidad)
+
+    def escenarios_en_cola(self):
+        # La cola solo informa mensajes: se estiman sus escenarios con el promedio publicado
+        if not self.mensajes_enviados:
+            return 0
+        return round(self.profundidad * self.escenarios_enviados / self.mensajes_enviados)
+
+    def _on_profundidad(self, frame):
+        self.profundidad = frame.method.message_count
+        escenarios = self.escenarios_en_cola()
+        if self.sin_presion.is_set() and escenarios >= self.marca_alta:
+            print(f"Backpressure: {escenarios} escenarios ({self.profundidad} mensajes) en cola, pausando publicación")
+            self.pausas += 1
+            self.inicio_pausa = time.time()
+            self.sin_presion.clear()
+        elif not self.sin_presion.is_set() and escenarios <= self.marca_baja:
+            print(f"Backpressure: {escenarios} escenarios ({self.profundidad} mensajes) en cola, reanudando publicación")
+            self.tiempo_pausado += time.time() - self.inicio_pausa
+            self.sin_presion.set()
+        self.connection.ioloop.call_later(INTERVALO_PROFUNDIDAD, self._consultar_profundidad)
+
+    def _enviar(self, body, properties, intentos):
+        self.siguiente_tag += 1
+        with self.lock:
+            self.pendientes[self.siguiente_tag] = (body, properties, time.time(), intentos)
+        self.channel.basic_publish(exchange='', routing_key=self.cola, body=body, properties=properties)
+
+    def _on_confirmacion(self, method_frame):
+        method = method_frame.method
+        ack = method.NAME == 'Basic.Ack'
+        with self.lock:
+            if method.multiple:
+                tags = [tag for tag in self.pendientes if tag <= method.delivery_tag]
+            else:
+                tags = [method.delivery_tag] if method.delivery_tag in self.pendientes else []
+            confirmados = [(tag, self.pendientes.pop(tag)) for tag in tags]
+
+        ahora = time.time()
+        for tag, (body, properties, enviado, intentos) in confirmados:
+            if ack:
+                self.confirmados += 1
+                self.latencias.append(ahora - enviado)
+                self.ventana.release()
+            elif intentos < MAX_REINTENTOS:
+                # El hueco en la ventana se conserva para el reintento
+                self.reintentos += 1
+                self._enviar(body, properties, intentos + 1)
+            else:
+                print(f"Mensaje descartado por el broker tras {intentos + 1} intentos")
+                self.perdidos += 1
+                self.ventana.release()
+        self.ultima_confirmacion = ahora
+
+    # --- API para el hilo del productor ---
+
+    def publicar(self, body, properties, escenarios=1):
+        if self.error:
+            raise ConnectionError(f"Publicador detenido: {self.error}")
+
+        while not (self.sin_presion.wait(1) and self.ventana.acquire(timeout=1)):
+            if self.error:
+                raise ConnectionError(f"Publicador detenido: {self.error}")
+        if self.inicio is None:
+            self.inicio = time.time()
+        self.publicados += 1
+        self.mensajes_enviados += 1
+        self.escenarios_enviados += escenarios
+        self.connection.ioloop.add_callback_threadsafe(lambda: self._enviar(body, properties, 0))
+
+    def reiniciar_estadisticas(self):
+        # Los confirms pendientes de la publicación anterior se cuentan contra ella: si no
+        # llegan, los contadores de mensajes en vuelo se conservan y solo se reinician tasa y latencias
+        if self.esperar_confirmaciones():
+            self.publicados = self.confirmados = self.reintentos = self.perdidos = 0
+        else:
+            print("Advertencia: quedan confirmaciones pendientes; se conservan los contadores de mensajes")
+        self.pausas = 0
+        self.tiempo_pausado = 0.0
+        self.latencias.clear()
+        self.inicio = self.ultima_confirmacion = None
+
+    def esperar_confirmaciones(self, timeout=60):
+        limite = time.time() + timeout
+        while time.time() < limite and not self.error:
+            if self.confirmados + self.perdidos >= self.publicados:
+                return True
+            time.sleep(0.01)
+        return False
+
+    def estadisticas(self):
+        duracion = (self.ultima_confirmacion or time.time()) - (self.inicio or time.time())
+        latencias = np.array(self.latencias) * 1000 if self.latencias else np.zeros(1)
+        return {
+            "publicados": self.publicados,
+            "confirmados": self.confirmados,
+            "reintentos": self.reintentos,
+            "perdidos": self.perdidos,
+            "sin_confirmar": self.publicados - self.confirmados - self.perdidos,
+            "tasa_publicacion": f"{(self.confirmados / duracion if duracion > 0 else 0):.0f} msg/s",
+            "latencia_confirmacion_p50": f"{np.percentile(latencias, 50):.2f}ms",
+            "latencia_confirmacion_p99": f"{np.percentile(latencias, 99):.2f}ms",
+            "profundidad_cola": self.profundidad,
+            "escenarios_en_cola": self.escenarios_en_cola(),
+            "pausas_backpressure": self.pausas,
+            "tiempo_pausado": f"{self.tiempo_pausado:.1f}s"
+        }
+
+    def cerrar(self):
+        if self.connection and not self.connection.is_closed:
+            self.connection.ioloop.add_callback_threadsafe(self.connection.close)
+            self.hilo.join(timeout=5)
@@ -0,0 +1,120 @@
+import threading
+import time
+import pika
+from shared import transport
+from shared import MODEL_REQUEST_QUEUE, MSG_MODEL, CONTENT_TYPE_JSON
+from shared import JOBS_EXCHANGE, JOB_ANNOUNCE_INTERVAL, MSG_JOB
+
+
+class RegistroModelos:
+    """Modelos publicados por este productor, servidos a pedido por model_id.
+
+    Atiende MODEL_REQUEST_QUEUE con su propia conexión en un hilo: cada
+    pedido trae el model_id en el cuerpo y la cola de respuesta en
+    'reply_to'. Así un worker que arranca tarde (o que descartó el modelo de
+    su cache) lo obtiene sin depender de un mensaje con expiración.
+
+    Con la misma conexión anuncia los trabajos del productor en JOBS_EXCHANGE,
+    al cambiar y cada JOB_ANNOUNCE_INTERVAL segundos.
+    """
+
+    def __init__(self):
+        self.modelos = {}
+        self.trabajos = {}
+        self.lock = threading.Lock()
+        self.connection = None
+        self.channel = None
+        self.hilo = None
+        self.listo = threading.Event()
+        self.error = None
+        self.atendidos = 0
+        self.desconocidos = 0
+
+    def registrar(self, model):
+        with self.lock:
+            self.modelos[model.model_id] = model.to_json()
+
+    def registrar_trabajo(self, job):
+        with self.lock:
+            self.trabajos[job.job_id] = job
+        self.anunciar(job)
+
+    def anunciar(self, job):
+        # El canal pertenece al hilo del registro
+        if self.connection and self.connection.is_open:
+            self.connection.add_callback_threadsafe(lambda: self._publicar_trabajo(job))
+
+    def _publicar_trabajo(self, job):
+        job.timestamp = time.time()
+        self.channel.basic_publish(
+            exchange=JOBS_EXCHANGE,
+            routing_key='',
+            body=job.to_json(),
+            properties=pika.BasicProperties(type=MSG_JOB, content_type=CONTENT_TYPE_JSON)
+        )
+
+    def _anunciar_trabajos(self):
+        with self.lock:
+            trabajos = list(self.trabajos.values())
+        for job in trabajos:
+            self._publicar_trabajo(job)
+        self.connection.call_later(JOB_ANNOUNCE_INTERVAL, self._anunciar_trabajos)
+
+    def iniciar(self, timeout=10):
+        self.hilo = threading.Thread(target=self._atender, daemon=True)
+        self.hilo.start()
+        if not self.listo.wait(timeout) or self.error:
+            raise ConnectionError(f"No se pudo iniciar el registro de modelos: {self.error or 'timeout'}")
+
+    def _atender(self):
+        try:
+            self.connection = transport.connect()
+            self.channel = self.connection.channel()
+            self.channel.queue_declare(queue=MODEL_REQUEST_QUEUE, durable=True)
+            self.channel.exchange_declare(exchange=JOBS_EXCHANGE, exchange_type='fanout')
+            self.channel.basic_consume(queue=MODEL_REQUEST_QUEUE, on_message_callback=self._on_pedido)
+            self.connection.call_later(JOB_ANNOUNCE_INTERVAL, self._anunciar_trabajos)
+        except Exception as e:
+            self.error = e
+            self.listo.set()
+            return
+
+        self.listo.set()
+        try:
+            self.channel.start_consuming()
+            self.connection.close()
+        except Exception as e:
+            print(f"Registro de modelos detenido: {e}")
+
+    def _on_pedido(self, ch, method, properties, body):
+        model_id = body.decode()
+        with self.lock:
+            model_json = self.modelos.get(model_id)
+
+        if model_json is None or not properties.reply_to:
+            # Otro productor puede tenerlo: se devuelve a la cola una sola vez
+            self.desconocidos += 1
+            ch.basic_nack(delivery_tag=method.delivery_tag, requeue=not method.redelivered)
+            return
+
+        ch.basic_publish(
+            exchange='',
+            routing_key=properties.reply_to,
+            body=model_json,
+            properties=pika.BasicProperties(type=MSG_MODEL, content_type=CONTENT_TYPE_JSON,
+                                            correlation_id=properties.correlation_id)
+        )
+        ch.basic_ack(delivery_tag=method.delivery_tag)
+        self.atendidos += 1
+
+    def cerrar(self):
+        if self.connection and self.connection.is_open:
+            # Último anuncio: los trabajos activos quedan cerrados y los workers drenan sus colas
+            with self.lock:
+                trabajos = list(self.trabajos.values())
+            for job in trabajos:
+                if job.status == "active":
+                    job.status = "closed"
+                self.anunciar(job)
+            self.connection.add_callback_threadsafe(self.channel.stop_consuming)
+            self.hilo.join(timeout=5)
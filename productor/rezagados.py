@@ -0,0 +1,143 @@
+import time
+from collections import deque
+import numpy as np
+from shared.completion import CompletionIndex
+
+# Re-ejecución especulativa: con la cola del trabajo vacía (todo lo publicado ya
+# está en algún worker), un lote que lleva más de FACTOR_REZAGO veces el
+# percentil PERCENTIL_REZAGO de las latencias observadas se vuelve a publicar,
+# hasta MAX_COPIAS veces. Cuenta el primer resultado que llega; el otro se descarta
+PERCENTIL_REZAGO = 95
+FACTOR_REZAGO = 2.0
+REZAGO_MINIMO = 1.0
+MIN_LATENCIAS_REZAGO = 10
+MAX_COPIAS = 1
+VENTANA_LATENCIAS = 1000
+
+
+class UnidadesEnVuelo:
+    """Lotes y unidades de trabajo publicados cuyo resultado todavía no llegó.
+
+    Cada uno se identifica por su primer escenario (start_index). `completar`
+    recibe los rangos que cubre un resultado y decide si se cuenta: si repite
+    un escenario ya contado (terminaron el original y su copia) se descarta
+    entero, y los huecos que cubría se vuelven a publicar porque sus
+    escenarios quedaron sin contar. Lo contado lleva un bit por escenario.
+    """
+
+    def __init__(self):
+        self.en_vuelo = {}  # start_index -> [count, publicado, copias]
+        self.indice = CompletionIndex()
+        self.desde = None  # rango publicado: [desde, hasta)
+        self.hasta = 0
+        self.tamano_maximo = 1
+        self.latencias = deque(maxlen=VENTANA_LATENCIAS)
+        self.cola_vacia_desde = None
+        self.sin_contar = []  # huecos a volver a publicar
+        self.especulados = 0
+        self.reemitidos = 0
+        self.duplicados = 0
+        self.escenarios_descartados = 0
+
+    def publicado(self, inicio, cantidad):
+        self.en_vuelo[inicio] = [cantidad, time.time(), 0]
+        self.desde = inicio if self.desde is None else min(self.desde, inicio)
+        self.hasta = max(self.hasta, inicio + cantidad)
+        self.tamano_maximo = max(self.tamano_maximo, cantidad)
+
+    def completar(self, unidades):
+        """True si el resultado que cubre `unidades` ([start_index, count]) debe contarse."""
+        # Un mismo worker puede haber calculado el original y la copia en el mismo resumen
+        if not self.indice.claim(unidades):
+            self.duplicados += 1
+            self.escenarios_descartados += sum(cantidad for _, cantidad in unidades)
+            for inicio, cantidad in unidades:
+                self.sin_contar.extend(self.huecos(inicio, inicio + cantidad))
+            return False
+
+        # Los rangos llegan unidos: se recorren los lotes publicados que contienen
+        ahora = time.time()
+        for inicio, cantidad in unidades:
+            posicion = inicio
+            while posicion < inicio + cantidad and posicion in self.en_vuelo:
+                unidad = self.en_vuelo.pop(posicion)
+                self.latencias.append(ahora - unidad[1])
+                posicion += unidad[0]
+        return True
+
+    def huecos(self, desde, hasta):
+        # Rangos sin resultado, partidos según los lotes publicados para no pasar su tamaño
+        partes = []
+        for inicio, cantidad in self.indice.missing(hasta, desde):
+            fin = inicio + cantidad
+            while inicio < fin:
+                lote = self.en_vuelo.get(inicio, [self.tamano_maximo])[0]
+                partes.append((inicio, min(lote, fin - inicio)))
+                inicio += partes[-1][1]
+        return partes
+
+    def olvidar(self):
+        """Deja de esperar lo publicado hasta ahora (se purgó de la cola): no se vuelve a publicar."""
+        self.en_vuelo.clear()
+        self.sin_contar = []
+        self.desde, self.hasta = None, 0
+
+    def faltantes(self):
+        """Escenarios publicados que todavía no tienen resultado contado."""
+        return (self.hasta - self.desde - self.indice.completed) if self.desde is not None else 0
+
+    def cola(self, profundidad):
+        # Mientras hay mensajes en la cola, lo publicado puede estar esperando turno y no en un worker
+        if profundidad:
+            self.cola_vacia_desde = None
+        elif self.cola_vacia_desde is None:
+            self.cola_vacia_desde = time.time()
+
+    def umbral(self):
+        if len(self.latencias) < MIN_LATENCIAS_REZAGO:
+            return None
+        return max(REZAGO_MINIMO, FACTOR_REZAGO * np.percentile(self.latencias, PERCENTIL_REZAGO))
+
+    def a_reemitir(self):
+        """Rangos (start_index, count) a volver a publicar: los descartados y los rezagados."""
+        ahora = time.time()
+        reemitir, self.sin_contar = self.sin_contar, []
+        self.reemitidos += len(reemitir)
+
+        umbral = self.umbral()
+        if self.cola_vacia_desde is not None and umbral is not None:
+            for inicio, (cantidad, publicado, copias) in list(self.en_vuelo.items()):
+                if self.indice.done(inicio, cantidad) == cantidad:
+                    # Contado dentro de un rango que no empezaba en este lote
+                    del self.en_vuelo[inicio]
+                elif copias < MAX_COPIAS and ahora - max(publicado, self.cola_vacia_desde) > umbral:
+                    self.en_vuelo[inicio][2] += 1
+                    self.especulados += 1
+                    reemitir.append((inicio, cantidad))
+
+        # La copia tiene su propio plazo
+        for inicio, cantidad in reemitir:
+            copias = self.en_vuelo[inicio][2] if inicio in self.en_vuelo else 0
+            self.en_vuelo[inicio] = [cantidad, ahora, copias]
+        return reemitir
+
+    def reemitir_huecos(self):
+        """Todos los huecos del rango publicado, para volver a publicarlos de una vez."""
+        if self.desde is None:
+            return []
+        huecos = self.huecos(self.desde, self.hasta)
+        self.sin_contar.extend(huecos)
+        return huecos
+
+    def estadisticas(self):
+        umbral = self.umbral()
+        return {
+            "faltantes": self.faltantes(),
+            "huecos": [list(hueco) for hueco in self.indice.missing(self.hasta, self.desde or 0, limit=5)],
+            "en_vuelo": len(self.en_vuelo),
+            "especulados": self.especulados,
+            "huecos_reemitidos": self.reemitidos,
+            "resultados_duplicados": self.duplicados,
+            "escenarios_descartados": self.escenarios_descartados,
+            "umbral_rezago": f"{umbral:.2f}s" if umbral is not None else "N/A"
+        }
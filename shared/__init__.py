@@ -4,7 +4,82 @@ RABBITMQ_PORT = 5672
 RABBITMQ_USER = 'guest'
 RABBITMQ_PASS = 'guest'
 
+# Transporte (ver shared.transport): 'rabbitmq' o 'local' (broker en memoria,
+# todos los componentes en un mismo proceso). La variable de entorno lo reemplaza
+TRANSPORT = 'rabbitmq'
+TRANSPORT_ENV = 'MONTECARLO_TRANSPORT'
+
 # Nombres de las colas
 SCENARIOS_QUEUE = 'montecarlo_scenarios'
-MODEL_QUEUE = 'montecarlo_model'
-RESULTS_QUEUE = 'montecarlo_results'
\ No newline at end of file
+RESULTS_QUEUE = 'montecarlo_results'
+
+# Los resultados se publican en un exchange topic con routing key RESULTS_QUEUE;
+# cada lector (dashboard, almacén) enlaza su propia cola y todos reciben todo
+RESULTS_EXCHANGE = 'montecarlo_results_topic'
+RESULTS_BINDING = f'{RESULTS_QUEUE}.#'
+STORE_QUEUE = 'montecarlo_results_store'
+STORE_DIR = 'resultados'
+
+# Distribución de modelos: broadcast por un exchange fanout (cada worker enlaza
+# su cola exclusiva) y pedido por model_id a la cola de solicitudes, que atiende
+# el registro del productor respondiendo a la cola indicada en 'reply_to'
+MODELS_EXCHANGE = 'montecarlo_models'
+MODEL_REQUEST_QUEUE = 'montecarlo_model_requests'
+MODEL_REQUEST_TIMEOUT = 5.0
+
+# Reintentos: un mensaje cuyo procesamiento falla vuelve al final de su cola
+# con el contador RETRY_HEADER incrementado y el error en ERROR_HEADER. Pasados
+# MAX_RETRIES reintentos va al exchange de mensajes muertos, que lo deja en
+# QUARANTINE_QUEUE para revisarlo a mano. Las colas de trabajo lo declaran
+# además como x-dead-letter-exchange: lo que el broker rechace también termina ahí
+DEAD_LETTER_EXCHANGE = 'montecarlo_dead_letter'
+QUARANTINE_QUEUE = 'montecarlo_quarantine'
+RETRY_HEADER = 'x-retries'
+ERROR_HEADER = 'x-last-error'
+# Marca de los mensajes que el productor vuelve a publicar (copias especulativas y huecos)
+REISSUE_HEADER = 'x-reissued'
+MAX_RETRIES = 3
+
+# Trabajos: cada uno tiene su propia cola de escenarios (SCENARIOS_QUEUE.<job_id>)
+# y su routing key de resultados (RESULTS_QUEUE.<job_id>). El productor anuncia
+# sus trabajos por un exchange fanout cada JOB_ANNOUNCE_INTERVAL segundos; los
+# workers se suscriben a las colas anunciadas y se retiran de las que dejan de
+# anunciarse y llevan JOB_IDLE_TIMEOUT segundos sin entregar mensajes
+JOBS_EXCHANGE = 'montecarlo_jobs'
+JOB_ANNOUNCE_INTERVAL = 5.0
+JOB_IDLE_TIMEOUT = 60.0
+# Una cola de trabajo sin consumidores se borra sola pasado este tiempo (x-expires)
+JOB_QUEUE_ARGUMENTS = {'x-expires': 24 * 3600 * 1000, 'x-dead-letter-exchange': DEAD_LETTER_EXCHANGE}
+
+# Métricas de los workers: exchange fanout, cada interesado enlaza su propia cola
+METRICS_EXCHANGE = 'montecarlo_metrics'
+METRICS_INTERVAL = 2.0
+
+# Modo batch: escenarios por mensaje y tipos de mensaje (propiedad AMQP 'type')
+BATCH_SIZE = 512
+MSG_SCENARIO_BATCH = 'scenario_batch'
+MSG_RESULT_BATCH = 'result_batch'
+MSG_WORK_UNIT = 'work_unit'
+MSG_RESULT_SUMMARY = 'result_summary'
+MSG_WORKER_METRICS = 'worker_metrics'
+MSG_MODEL = 'model'
+MSG_MODEL_REQUEST = 'model_request'
+MSG_JOB = 'job'
+
+# Perfil previo de cada modelo (productor/perfil.py): se evalúa una muestra de
+# PROFILE_SCENARIOS escenarios y el tamaño de mensaje por defecto se elige para
+# que cada uno lleve unos MESSAGE_TARGET_COMPUTE segundos de cómputo, en
+# potencias de 2 y sin pasar de MESSAGE_MAX_BYTES de escenarios o resultados
+PROFILE_SCENARIOS = 256
+MESSAGE_TARGET_COMPUTE = 0.05
+MESSAGE_MAX_BYTES = 1 << 20
+
+# Agregación en el worker: se publica un resumen cada N escenarios o T segundos
+SUMMARY_FLUSH_SCENARIOS = 100000
+SUMMARY_FLUSH_INTERVAL = 2.0
+
+# Formato de los mensajes (propiedad AMQP 'content_type'). JSON sigue
+# disponible para depurar; el binario es el formato compacto de shared.codec
+CONTENT_TYPE_JSON = 'application/json'
+CONTENT_TYPE_BINARY = 'application/x-montecarlo'
+WIRE_CONTENT_TYPE = CONTENT_TYPE_BINARY
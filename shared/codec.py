@@ -0,0 +1,117 @@
+import struct
+import numpy as np
+from typing import List
+from shared.models import Scenario, Result, ScenarioBatch, ResultBatch
+
+# Codec binario compacto para escenarios y resultados.
+#
+# Cabecera común (little-endian):
+#   magic 'MC' | versión (u8) | tipo (u8) | model_id (u8 largo + utf-8)
+#   | batch_id (u8 largo + utf-8) | start_index (u64) | count (u32)
+# Escenarios: nvars (u16) + nvars * count float64, una columna por variable
+#   en el orden de MonteCarloModel.variables (sin nombres en el mensaje).
+# Resultados: worker_id (u8 largo + utf-8) + count float64 (NaN = sin resultado).
+
+MAGIC = b'MC'
+FORMAT_VERSION = 1
+KIND_SCENARIOS = 1
+KIND_RESULTS = 2
+
+_PREFIX = struct.Struct('<2sBB')
+_RANGE = struct.Struct('<QI')
+_NVARS = struct.Struct('<H')
+_FLOAT = struct.Struct('<d')
+
+
+def _pack_str(value: str) -> bytes:
+    data = value.encode()
+    if len(data) > 255:
+        raise ValueError(f"Identificador demasiado largo para el formato binario: {value!r}")
+    return bytes((len(data),)) + data
+
+def _unpack_str(data: bytes, offset: int):
+    size = data[offset]
+    return data[offset + 1:offset + 1 + size].decode(), offset + 1 + size
+
+def _scenario_index(scenario_id: str) -> int:
+    return int(scenario_id.rsplit('_', 1)[1])
+
+def _header(kind: int, model_id: str, batch_id: str, start_index: int, count: int) -> bytes:
+    return (_PREFIX.pack(MAGIC, FORMAT_VERSION, kind) + _pack_str(model_id) + _pack_str(batch_id)
+            + _RANGE.pack(start_index, count))
+
+def _read_header(data: bytes, expected_kind: int):
+    magic, version, kind = _PREFIX.unpack_from(data, 0)
+    if magic != MAGIC:
+        raise ValueError("El mensaje no está en formato binario Monte Carlo")
+    if version != FORMAT_VERSION:
+        raise ValueError(f"Versión de formato binario no soportada: {version}")
+    if kind != expected_kind:
+        raise ValueError(f"Tipo de mensaje binario inesperado: {kind}")
+    model_id, offset = _unpack_str(data, _PREFIX.size)
+    batch_id, offset = _unpack_str(data, offset)
+    start_index, count = _RANGE.unpack_from(data, offset)
+    return model_id, batch_id, start_index, count, offset + _RANGE.size
+
+
+def peek_model_id(data: bytes) -> str:
+    """model_id de un mensaje binario, para cargar el modelo antes de decodificarlo."""
+    return _unpack_str(data, _PREFIX.size)[0]
+
+
+def encode_scenario_batch(batch: ScenarioBatch, variable_names: List[str]) -> bytes:
+    values = np.empty((len(variable_names), batch.count), dtype='<f8')
+    for i, name in enumerate(variable_names):
+        values[i] = batch.columns[name]
+    return (_header(KIND_SCENARIOS, batch.model_id, batch.batch_id, batch.start_index, batch.count)
+            + _NVARS.pack(len(variable_names)) + values.tobytes())
+
+def decode_scenario_batch(data: bytes, variable_names: List[str]) -> ScenarioBatch:
+    model_id, batch_id, start_index, count, offset = _read_header(data, KIND_SCENARIOS)
+    (nvars,) = _NVARS.unpack_from(data, offset)
+    if nvars != len(variable_names):
+        raise ValueError(f"El mensaje trae {nvars} variables y el modelo {model_id} define {len(variable_names)}")
+    values = np.frombuffer(data, dtype='<f8', count=nvars * count, offset=offset + _NVARS.size)
+    values = values.reshape(nvars, count).copy()
+    return ScenarioBatch(batch_id, model_id, start_index, dict(zip(variable_names, values)))
+
+# Un escenario suelto es un bloque de 1; se empaqueta con struct porque
+# para tan pocos valores NumPy cuesta más de lo que ahorra
+def encode_scenario(scenario: Scenario, variable_names: List[str]) -> bytes:
+    nvars = len(variable_names)
+    return (_header(KIND_SCENARIOS, scenario.model_id, scenario.scenario_id,
+                    _scenario_index(scenario.scenario_id), 1)
+            + _NVARS.pack(nvars) + struct.pack(f'<{nvars}d', *(scenario.parameters[n] for n in variable_names)))
+
+def decode_scenario(data: bytes, variable_names: List[str]) -> Scenario:
+    model_id, scenario_id, start_index, count, offset = _read_header(data, KIND_SCENARIOS)
+    (nvars,) = _NVARS.unpack_from(data, offset)
+    if count != 1 or nvars != len(variable_names):
+        raise ValueError(f"El mensaje no es un escenario del modelo {model_id}")
+    values = struct.unpack_from(f'<{nvars}d', data, offset + _NVARS.size)
+    return Scenario(scenario_id, model_id, dict(zip(variable_names, values)))
+
+
+def encode_result_batch(batch: ResultBatch) -> bytes:
+    values = np.array([np.nan if v is None else v for v in batch.results], dtype='<f8')
+    return (_header(KIND_RESULTS, batch.model_id, batch.batch_id, batch.start_index, len(values))
+            + _pack_str(batch.worker_id) + values.tobytes())
+
+def decode_result_batch(data: bytes) -> ResultBatch:
+    model_id, batch_id, start_index, count, offset = _read_header(data, KIND_RESULTS)
+    worker_id, offset = _unpack_str(data, offset)
+    values = np.frombuffer(data, dtype='<f8', count=count, offset=offset)
+    results = [None if v != v else v for v in values.tolist()]
+    return ResultBatch(batch_id, model_id, start_index, results, worker_id)
+
+def encode_result(result: Result) -> bytes:
+    # Un escenario fallido (None) viaja como NaN, igual que en los lotes
+    value = np.nan if result.result is None else result.result
+    return (_header(KIND_RESULTS, result.model_id, result.scenario_id, _scenario_index(result.scenario_id), 1)
+            + _pack_str(result.worker_id) + _FLOAT.pack(value))
+
+def decode_result(data: bytes) -> Result:
+    model_id, scenario_id, start_index, count, offset = _read_header(data, KIND_RESULTS)
+    worker_id, offset = _unpack_str(data, offset)
+    (value,) = _FLOAT.unpack_from(data, offset)
+    return Result(scenario_id, model_id, None if value != value else value, worker_id)
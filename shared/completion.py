@@ -0,0 +1,149 @@
+import numpy as np
+from typing import Iterable, List, Optional, Sequence, Tuple
+
+# Índice de completitud de un trabajo: un bit por número de secuencia de
+# escenario (el n de '{model_id}_{n:06d}', o start_index + i en lotes y
+# unidades). El bitmap se guarda por tramos de CHUNK_BITS escenarios: un tramo
+# sin resultados no ocupa nada y uno completo se reduce a una marca, así que
+# la memoria nunca pasa de ~1 bit por escenario y en la práctica solo la
+# ocupan los tramos en curso (10^9 escenarios: ≤ 120 MB, casi siempre unos KB).
+
+CHUNK_BITS = 1 << 16
+_FULL = object()  # tramo con todos sus escenarios completos
+
+
+def _spans(start: int, count: int):
+    """(tramo, desde, hasta) de cada tramo que toca [start, start + count)."""
+    end = start + count
+    while start < end:
+        chunk, low = divmod(start, CHUNK_BITS)
+        high = min(CHUNK_BITS, low + end - start)
+        yield chunk, low, high
+        start += high - low
+
+
+def coalesce(ranges: Iterable[Sequence[int]]) -> List[List[int]]:
+    """Ordena y une rangos [start, count] contiguos; los que se solapan quedan separados."""
+    merged = []
+    for start, count in sorted((int(s), int(c)) for s, c in ranges):
+        if merged and merged[-1][0] + merged[-1][1] == start:
+            merged[-1][1] += count
+        else:
+            merged.append([start, count])
+    return merged
+
+
+class CompletionIndex:
+    """Qué escenarios de un trabajo ya tienen resultado, para contar cada uno una vez."""
+
+    def __init__(self):
+        self.chunks = {}  # tramo -> bitmap uint8 (CHUNK_BITS / 8 bytes) o _FULL
+        self.counts = {}  # tramo parcial -> bits en 1
+        self.completed = 0
+
+    def _bits(self, chunk: int, low: int, high: int) -> np.ndarray:
+        bitmap = self.chunks.get(chunk)
+        if bitmap is None or bitmap is _FULL:
+            return np.full(high - low, bitmap is _FULL)
+        first = low >> 3
+        bits = np.unpackbits(bitmap[first:(high + 7) >> 3], bitorder='little')
+        return bits[low - (first << 3):high - (first << 3)].astype(bool)
+
+    def _mark(self, chunk: int, low: int, high: int, new: int):
+        # `new`: cuántos de los bits del rango estaban en 0
+        if not new:
+            return
+        self.completed += new
+        filled = self.counts.pop(chunk, 0) + new
+        if filled == CHUNK_BITS:
+            self.chunks[chunk] = _FULL
+            return
+        bitmap = self.chunks.get(chunk)
+        if bitmap is None:
+            bitmap = self.chunks[chunk] = np.zeros(CHUNK_BITS >> 3, dtype=np.uint8)
+        first, last = low >> 3, (high + 7) >> 3
+        bits = np.unpackbits(bitmap[first:last], bitorder='little')
+        bits[low - (first << 3):high - (first << 3)] = 1
+        bitmap[first:last] = np.packbits(bits, bitorder='little')
+        self.counts[chunk] = filled
+
+    def __contains__(self, index: int) -> bool:
+        chunk, bit = divmod(index, CHUNK_BITS)
+        bitmap = self.chunks.get(chunk)
+        if bitmap is None or bitmap is _FULL:
+            return bitmap is _FULL
+        return bool(bitmap[bit >> 3] >> (bit & 7) & 1)
+
+    def done(self, start: int, count: int = 1) -> int:
+        """Escenarios de [start, start + count) que ya tienen resultado."""
+        total = 0
+        for chunk, low, high in _spans(start, count):
+            bitmap = self.chunks.get(chunk)
+            if bitmap is not None:
+                total += high - low if bitmap is _FULL else int(self._bits(chunk, low, high).sum())
+        return total
+
+    def add(self, start: int, count: int = 1) -> np.ndarray:
+        """Marca [start, start + count); devuelve la máscara de los que no estaban (los que hay que contar)."""
+        masks = []
+        for chunk, low, high in _spans(start, count):
+            new = ~self._bits(chunk, low, high)
+            self._mark(chunk, low, high, int(new.sum()))
+            masks.append(new)
+        return np.concatenate(masks) if masks else np.zeros(0, dtype=bool)
+
+    def add_many(self, indices) -> None:
+        """Marca escenarios sueltos (p. ej. la columna seq de un almacén), agrupados en rangos contiguos."""
+        indices = np.unique(np.asarray(indices, dtype=np.int64))
+        if not len(indices):
+            return
+        cortes = np.flatnonzero(np.diff(indices) != 1) + 1
+        starts = np.concatenate(([0], cortes))
+        ends = np.concatenate((cortes, [len(indices)]))
+        for start, end in zip(indices[starts].tolist(), (ends - starts).tolist()):
+            self.add(start, end)
+
+    def claim(self, ranges: Sequence[Sequence[int]]) -> bool:
+        """Todo o nada: marca los rangos [start, count] solo si ninguno se repite ni estaba.
+
+        Para resultados que no se pueden separar por escenario (resúmenes
+        agregados): si alguno ya se contó, el resultado entero se descarta.
+        """
+        ordered = sorted((int(s), int(c)) for s, c in ranges)
+        for (start, count), (next_start, _) in zip(ordered, ordered[1:]):
+            if start + count > next_start:
+                return False
+        if any(self.done(start, count) for start, count in ordered):
+            return False
+        for start, count in ordered:
+            for chunk, low, high in _spans(start, count):
+                self._mark(chunk, low, high, high - low)
+        return True
+
+    def missing(self, stop: int, start: int = 0, limit: Optional[int] = None) -> List[Tuple[int, int]]:
+        """Rangos (start, count) de [start, stop) todavía sin resultado, a lo sumo `limit`."""
+        gaps = []
+        for chunk, low, high in _spans(start, max(stop - start, 0)):
+            bitmap = self.chunks.get(chunk)
+            if bitmap is _FULL:
+                continue
+            base = chunk * CHUNK_BITS
+            if bitmap is None:
+                runs = [(low, high)]
+            else:
+                # Bordes de las corridas de ceros
+                zeros = np.concatenate(([False], ~self._bits(chunk, low, high), [False]))
+                edges = np.flatnonzero(zeros[1:] != zeros[:-1]).reshape(-1, 2) + low
+                runs = edges.tolist()
+            for run_start, run_end in runs:
+                if gaps and gaps[-1][0] + gaps[-1][1] == base + run_start:
+                    gaps[-1] = (gaps[-1][0], gaps[-1][1] + run_end - run_start)
+                elif limit is not None and len(gaps) >= limit:
+                    return gaps
+                else:
+                    gaps.append((base + run_start, run_end - run_start))
+        return gaps
+
+    @property
+    def nbytes(self) -> int:
+        return sum(bitmap.nbytes for bitmap in self.chunks.values() if bitmap is not _FULL)
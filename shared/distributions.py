@@ -0,0 +1,294 @@
+import math
+import functools
+import numpy as np
+from typing import Any, Dict
+from shared.models import VariableDefinition, DistributionType
+
+# Parámetros de cada distribución: obligatorios y opcionales (con su valor por
+# defecto). Un parámetro que no figura acá es un error del modelo.
+#   uniform      min, max
+#   normal       mean, std
+#   exponential  scale (la media)
+#   lognormal    mu, sigma: parámetros del logaritmo normal
+#   triangular   min, mode, max
+#   beta         a, b sobre [min, max]
+#   discrete     values (lista) con weights opcionales (por defecto equiprobables)
+#   empirical    values (lista de observaciones); se muestrea la CDF empírica
+#                interpolada. En el archivo de modelo también puede ser file=ruta
+PARAMETERS = {
+    DistributionType.UNIFORM: ((), {'min': 0.0, 'max': 1.0}),
+    DistributionType.NORMAL: ((), {'mean': 0.0, 'std': 1.0}),
+    DistributionType.EXPONENTIAL: ((), {'scale': 1.0}),
+    DistributionType.LOGNORMAL: ((), {'mu': 0.0, 'sigma': 1.0}),
+    DistributionType.TRIANGULAR: (('min', 'mode', 'max'), {}),
+    DistributionType.BETA: (('a', 'b'), {'min': 0.0, 'max': 1.0}),
+    DistributionType.DISCRETE: (('values',), {'weights': None}),
+    DistributionType.EMPIRICAL: (('values',), {}),
+}
+LIST_PARAMETERS = ('values', 'weights')
+# Observaciones que se conservan de una distribución empírica: más se reducen
+# a ese número de cuantiles, así el modelo sigue siendo chico para difundirlo
+EMPIRICAL_MAX_POINTS = 4097
+
+
+def validate_parameters(name: str, distribution: DistributionType, params: Dict[str, Any]):
+    """Comprueba nombres y valores de los parámetros de una variable; ValueError si no son válidos."""
+    required, optional = PARAMETERS[distribution]
+    accepted = set(required) | set(optional)
+    unknown = set(params) - accepted
+    if unknown:
+        raise ValueError(f"{name}: {distribution.value} no acepta {', '.join(sorted(unknown))} "
+                         f"(parámetros: {', '.join(required + tuple(optional))})")
+    missing = [p for p in required if p not in params]
+    if missing:
+        raise ValueError(f"{name}: {distribution.value} necesita {', '.join(missing)}")
+    for key, value in params.items():
+        if (key in LIST_PARAMETERS) != isinstance(value, list):
+            raise ValueError(f"{name}: {key} debe ser {'una lista' if key in LIST_PARAMETERS else 'un número'}")
+
+    p = {**optional, **params}
+    if distribution in (DistributionType.UNIFORM, DistributionType.BETA, DistributionType.TRIANGULAR) \
+            and not p['min'] < p['max']:
+        raise ValueError(f"{name}: min debe ser menor que max")
+    if distribution == DistributionType.TRIANGULAR and not p['min'] <= p['mode'] <= p['max']:
+        raise ValueError(f"{name}: mode debe estar entre min y max")
+    if distribution == DistributionType.NORMAL and p['std'] <= 0:
+        raise ValueError(f"{name}: std debe ser positivo")
+    if distribution == DistributionType.EXPONENTIAL and p['scale'] <= 0:
+        raise ValueError(f"{name}: scale debe ser positivo")
+    if distribution == DistributionType.LOGNORMAL and p['sigma'] <= 0:
+        raise ValueError(f"{name}: sigma debe ser positivo")
+    if distribution == DistributionType.BETA and (p['a'] <= 0 or p['b'] <= 0):
+        raise ValueError(f"{name}: a y b deben ser positivos")
+    if distribution in (DistributionType.DISCRETE, DistributionType.EMPIRICAL):
+        values = np.asarray(p['values'], dtype=float)
+        if not len(values) or not np.all(np.isfinite(values)):
+            raise ValueError(f"{name}: values debe tener al menos un número finito")
+        weights = p.get('weights')
+        if weights is not None:
+            weights = np.asarray(weights, dtype=float)
+            if len(weights) != len(values):
+                raise ValueError(f"{name}: weights y values deben tener el mismo largo")
+            if np.any(weights < 0) or not weights.sum() > 0:
+                raise ValueError(f"{name}: weights deben ser no negativos y no todos cero")
+
+
+def empirical_values(observations) -> list:
+    """Observaciones ordenadas de una distribución empírica, reducidas a EMPIRICAL_MAX_POINTS cuantiles."""
+    values = np.sort(np.asarray(observations, dtype=float).ravel())
+    if len(values) > EMPIRICAL_MAX_POINTS:
+        values = np.quantile(values, np.linspace(0, 1, EMPIRICAL_MAX_POINTS))
+    return values.tolist()
+
+
+# Aproximación racional de Acklam a la inversa de la normal estándar
+# (error relativo < 1.2e-9), vectorizada
+_A = [-3.969683028665376e+01, 2.209460984245205e+02, -2.759285104469687e+02,
+      1.383577518672690e+02, -3.066479806614716e+01, 2.506628277459239e+00]
+_B = [-5.447609879822406e+01, 1.615858368580409e+02, -1.556989798598866e+02,
+      6.680131188771972e+01, -1.328068155288572e+01, 1.0]
+_C = [-7.784894002430293e-03, -3.223964580411365e-01, -2.400758277161838e+00,
+      -2.549732539343734e+00, 4.374664141464968e+00, 2.938163982698783e+00]
+_D = [7.784695709041462e-03, 3.224671290700398e-01, 2.445134137142996e+00,
+      3.754408661907416e+00, 1.0]
+_P_LOW = 0.02425
+
+
+def norm_ppf(u: np.ndarray) -> np.ndarray:
+    u = np.asarray(u, dtype=np.float64)
+    x = np.empty_like(u)
+
+    central = (u >= _P_LOW) & (u <= 1 - _P_LOW)
+    q = u[central] - 0.5
+    r = q * q
+    x[central] = np.polyval(_A, r) * q / np.polyval(_B, r)
+
+    tails = ~central
+    p = np.where(u[tails] < 0.5, u[tails], 1 - u[tails])
+    q = np.sqrt(-2 * np.log(p))
+    tail = np.polyval(_C, q) / np.polyval(_D, q)
+    x[tails] = np.where(u[tails] < 0.5, tail, -tail)
+    return x
+
+
+# erfc de Chebyshev (Numerical Recipes, erfcc): error relativo < 1.2e-7 en
+# todo el rango, también en las colas
+_ERFC = [0.17087277, -0.82215223, 1.48851587, -1.13520398, 0.27886807,
+         -0.18628806, 0.09678418, 0.37409196, 1.00002368, -1.26551223]
+
+
+def norm_cdf(z: np.ndarray) -> np.ndarray:
+    z = np.asarray(z, dtype=np.float64)
+    x = np.abs(z) / math.sqrt(2)
+    t = 1 / (1 + 0.5 * x)
+    tail = 0.5 * t * np.exp(-x * x + np.polyval(_ERFC, t))
+    return np.where(z < 0, tail, 1 - tail)
+
+
+def _betacf(a: float, b: float, x: np.ndarray) -> np.ndarray:
+    # Fracción continua de la beta incompleta (Lentz modificado), vectorizada
+    tiny = 1e-300
+    c = np.ones_like(x)
+    d = 1 - (a + b) * x / (a + 1)
+    d = 1 / np.where(np.abs(d) < tiny, tiny, d)
+    h = d.copy()
+    for m in range(1, 301):
+        for aa in (m * (b - m) * x / ((a - 1 + 2 * m) * (a + 2 * m)),
+                   -(a + m) * (a + b + m) * x / ((a + 2 * m) * (a + 1 + 2 * m))):
+            d = 1 + aa * d
+            d = 1 / np.where(np.abs(d) < tiny, tiny, d)
+            c = 1 + aa / c
+            c = np.where(np.abs(c) < tiny, tiny, c)
+            delta = d * c
+            h *= delta
+        if np.all(np.abs(delta - 1) < 3e-14):
+            break
+    return h
+
+
+def betainc(a: float, b: float, x: np.ndarray) -> np.ndarray:
+    """Beta incompleta regularizada I_x(a, b)."""
+    x = np.clip(np.asarray(x, dtype=np.float64), 0, 1)
+    inner = (x > 0) & (x < 1)
+    xi = x[inner]
+    log_front = (math.lgamma(a + b) - math.lgamma(a) - math.lgamma(b)
+                 + a * np.log(xi) + b * np.log1p(-xi))
+    front = np.exp(log_front)
+    # La fracción converge rápido de un lado de (a + 1) / (a + b + 2); del otro se usa la simetría
+    lower = xi < (a + 1) / (a + b + 2)
+    value = np.empty_like(xi)
+    value[lower] = front[lower] * _betacf(a, b, xi[lower]) / a
+    value[~lower] = 1 - front[~lower] * _betacf(b, a, 1 - xi[~lower]) / b
+    result = np.where(x >= 1, 1.0, 0.0)
+    result[inner] = value
+    return result
+
+
+@functools.lru_cache(maxsize=64)
+def _beta_table(a: float, b: float, size: int = 8193):
+    # Inversa de la CDF tabulada una vez por (a, b), con puntos concentrados en
+    # los extremos (x = sin²) donde la densidad puede ser singular
+    x = np.sin(np.linspace(0, np.pi / 2, size)) ** 2
+    cdf = np.maximum.accumulate(betainc(a, b, x))
+    return cdf, x
+
+
+def _uniform(rng: np.random.Generator, params: Dict[str, Any], size: int) -> np.ndarray:
+    return rng.uniform(params.get('min', 0), params.get('max', 1), size)
+
+def _normal(rng: np.random.Generator, params: Dict[str, Any], size: int) -> np.ndarray:
+    return rng.normal(params.get('mean', 0), params.get('std', 1), size)
+
+def _exponential(rng: np.random.Generator, params: Dict[str, Any], size: int) -> np.ndarray:
+    return rng.exponential(params.get('scale', 1), size)
+
+def _lognormal(rng: np.random.Generator, params: Dict[str, Any], size: int) -> np.ndarray:
+    return rng.lognormal(params.get('mu', 0), params.get('sigma', 1), size)
+
+def _triangular(rng: np.random.Generator, params: Dict[str, Any], size: int) -> np.ndarray:
+    return rng.triangular(params['min'], params['mode'], params['max'], size)
+
+def _beta(rng: np.random.Generator, params: Dict[str, Any], size: int) -> np.ndarray:
+    low, high = params.get('min', 0), params.get('max', 1)
+    return low + (high - low) * rng.beta(params['a'], params['b'], size)
+
+def _discrete(rng: np.random.Generator, params: Dict[str, Any], size: int) -> np.ndarray:
+    return _discrete_ppf(rng.random(size), params)
+
+def _empirical(rng: np.random.Generator, params: Dict[str, Any], size: int) -> np.ndarray:
+    return _empirical_ppf(rng.random(size), params)
+
+SAMPLERS = {
+    DistributionType.UNIFORM: _uniform,
+    DistributionType.NORMAL: _normal,
+    DistributionType.EXPONENTIAL: _exponential,
+    DistributionType.LOGNORMAL: _lognormal,
+    DistributionType.TRIANGULAR: _triangular,
+    DistributionType.BETA: _beta,
+    DistributionType.DISCRETE: _discrete,
+    DistributionType.EMPIRICAL: _empirical,
+}
+
+
+# Inversas de la CDF: llevan uniformes estratificadas, de baja discrepancia o
+# de una cópula a cada distribución conservando su estructura
+def _uniform_ppf(u: np.ndarray, params: Dict[str, Any]) -> np.ndarray:
+    return params.get('min', 0) + (params.get('max', 1) - params.get('min', 0)) * u
+
+def _normal_ppf(u: np.ndarray, params: Dict[str, Any]) -> np.ndarray:
+    return params.get('mean', 0) + params.get('std', 1) * norm_ppf(u)
+
+def _exponential_ppf(u: np.ndarray, params: Dict[str, Any]) -> np.ndarray:
+    return -params.get('scale', 1) * np.log1p(-u)
+
+def _lognormal_ppf(u: np.ndarray, params: Dict[str, Any]) -> np.ndarray:
+    return np.exp(params.get('mu', 0) + params.get('sigma', 1) * norm_ppf(u))
+
+def _triangular_ppf(u: np.ndarray, params: Dict[str, Any]) -> np.ndarray:
+    low, mode, high = params['min'], params['mode'], params['max']
+    split = (mode - low) / (high - low)
+    left = low + np.sqrt(u * (high - low) * (mode - low))
+    right = high - np.sqrt((1 - u) * (high - low) * (high - mode))
+    return np.where(u < split, left, right)
+
+def _beta_ppf(u: np.ndarray, params: Dict[str, Any]) -> np.ndarray:
+    cdf, x = _beta_table(float(params['a']), float(params['b']))
+    low, high = params.get('min', 0), params.get('max', 1)
+    return low + (high - low) * np.interp(u, cdf, x)
+
+def _discrete_ppf(u: np.ndarray, params: Dict[str, Any]) -> np.ndarray:
+    values = np.asarray(params['values'], dtype=float)
+    weights = np.asarray(params.get('weights') or np.ones(len(values)), dtype=float)
+    cumulative = np.cumsum(weights) / weights.sum()
+    return values[np.minimum(np.searchsorted(cumulative, u, side='right'), len(values) - 1)]
+
+def _empirical_ppf(u: np.ndarray, params: Dict[str, Any]) -> np.ndarray:
+    values = np.sort(np.asarray(params['values'], dtype=float))
+    return np.interp(np.asarray(u) * (len(values) - 1), np.arange(len(values)), values)
+
+PPFS = {
+    DistributionType.UNIFORM: _uniform_ppf,
+    DistributionType.NORMAL: _normal_ppf,
+    DistributionType.EXPONENTIAL: _exponential_ppf,
+    DistributionType.LOGNORMAL: _lognormal_ppf,
+    DistributionType.TRIANGULAR: _triangular_ppf,
+    DistributionType.BETA: _beta_ppf,
+    DistributionType.DISCRETE: _discrete_ppf,
+    DistributionType.EMPIRICAL: _empirical_ppf,
+}
+
+
+def from_normal(z: np.ndarray, var: VariableDefinition) -> np.ndarray:
+    """Lleva normales estándar (p. ej. de la cópula) a la distribución de la variable."""
+    params = var.parameters
+    # Normal y lognormal se transforman directo, sin pasar por la CDF
+    if var.distribution == DistributionType.NORMAL:
+        return params.get('mean', 0) + params.get('std', 1) * z
+    if var.distribution == DistributionType.LOGNORMAL:
+        return np.exp(params.get('mu', 0) + params.get('sigma', 1) * z)
+    return PPFS[var.distribution](norm_cdf(z), params)
+
+
+def expected_value(var: VariableDefinition) -> float:
+    """Media teórica de una variable; permite usarla como variable de control."""
+    params = var.parameters
+    if var.distribution == DistributionType.UNIFORM:
+        return (params.get('min', 0) + params.get('max', 1)) / 2
+    if var.distribution == DistributionType.NORMAL:
+        return params.get('mean', 0)
+    if var.distribution == DistributionType.LOGNORMAL:
+        return math.exp(params.get('mu', 0) + params.get('sigma', 1) ** 2 / 2)
+    if var.distribution == DistributionType.TRIANGULAR:
+        return (params['min'] + params['mode'] + params['max']) / 3
+    if var.distribution == DistributionType.BETA:
+        low, high = params.get('min', 0), params.get('max', 1)
+        return low + (high - low) * params['a'] / (params['a'] + params['b'])
+    if var.distribution == DistributionType.DISCRETE:
+        values = np.asarray(params['values'], dtype=float)
+        weights = np.asarray(params.get('weights') or np.ones(len(values)), dtype=float)
+        return float(values @ weights / weights.sum())
+    if var.distribution == DistributionType.EMPIRICAL:
+        # Media de la CDF empírica interpolada: promedio de los tramos entre observaciones
+        values = np.sort(np.asarray(params['values'], dtype=float))
+        return float(values.mean() if len(values) == 1 else (values[:-1] + values[1:]).mean() / 2)
+    return params.get('scale', 1)
@@ -0,0 +1,131 @@
+import ast
+import random
+import time
+import numpy as np
+from shared.sampling import SamplingEngine
+from shared.distributions import expected_value
+
+# Compilación y evaluación de la FUNCTION de un modelo: la usan los workers para
+# calcular y el productor para perfilar el modelo antes de publicarlo
+
+# Funciones de NumPy que operan elemento a elemento sobre arreglos
+FUNCIONES_NUMPY = {
+    'abs', 'absolute', 'sqrt', 'exp', 'log', 'log10', 'log2', 'log1p', 'expm1',
+    'sin', 'cos', 'tan', 'arcsin', 'arccos', 'arctan', 'sinh', 'cosh', 'tanh',
+    'floor', 'ceil', 'round', 'rint', 'trunc', 'sign', 'power', 'maximum', 'minimum',
+    'where', 'clip', 'mod', 'fmod', 'hypot', 'square'
+}
+FUNCIONES_BUILTIN = {'abs', 'round'}
+
+NODOS_PERMITIDOS = (
+    ast.Module, ast.Assign, ast.AugAssign, ast.Expr, ast.BinOp, ast.UnaryOp,
+    ast.Compare, ast.Name, ast.Constant, ast.Load, ast.Store, ast.Call, ast.Attribute,
+    ast.operator, ast.unaryop, ast.cmpop
+)
+
+MUESTRA_VERIFICACION = 16
+
+
+def es_vectorizable(codigo, function_code, nombres_variables):
+    """Indica si el código del modelo se puede evaluar sobre arreglos completos.
+
+    Primero revisa el AST (solo aritmética, comparaciones y funciones
+    elemento a elemento de np) y luego compara la evaluación vectorizada
+    contra el bucle escalar sobre una muestra pequeña.
+    """
+    try:
+        arbol = ast.parse(function_code)
+    except SyntaxError:
+        return False
+
+    for nodo in ast.walk(arbol):
+        if not isinstance(nodo, NODOS_PERMITIDOS):
+            return False
+        if isinstance(nodo, ast.Call) and not _llamada_vectorizable(nodo.func):
+            return False
+        if isinstance(nodo, ast.Attribute) and not (
+                isinstance(nodo.value, ast.Name) and nodo.value.id == 'np'
+                and nodo.attr in FUNCIONES_NUMPY):
+            return False
+        if isinstance(nodo, ast.Name) and nodo.id == 'random':
+            return False
+
+    rng = np.random.default_rng(0)
+    columnas = {nombre: rng.uniform(1, 2, MUESTRA_VERIFICACION) for nombre in nombres_variables}
+    try:
+        vectorizado = evaluar_vectorizado(codigo, columnas, MUESTRA_VERIFICACION)
+        escalar = [
+            evaluar_escalar(codigo, {nombre: float(valores[i]) for nombre, valores in columnas.items()})
+            for i in range(MUESTRA_VERIFICACION)
+        ]
+        return bool(np.allclose(vectorizado, np.asarray(escalar, dtype=float), equal_nan=True))
+    except Exception:
+        return False
+
+
+def _llamada_vectorizable(func):
+    if isinstance(func, ast.Name):
+        return func.id in FUNCIONES_BUILTIN
+    if isinstance(func, ast.Attribute):
+        return isinstance(func.value, ast.Name) and func.value.id == 'np' and func.attr in FUNCIONES_NUMPY
+    return False
+
+
+def evaluar_escalar(codigo, parameters, exec_globals=None):
+    """Evalúa un escenario; `codigo` puede ser fuente o un code object ya compilado.
+
+    Si se pasa `exec_globals` se reutiliza entre llamadas en lugar de
+    construir un diccionario nuevo por escenario.
+    """
+    if exec_globals is None:
+        exec_globals = {'random': random, 'np': np}
+    exec_globals['resultado'] = 0
+    exec_globals.update(parameters)
+    exec(codigo, exec_globals)
+    return exec_globals.get('resultado', 0)
+
+
+def evaluar_vectorizado(codigo, columnas, cantidad):
+    """Evalúa el modelo una sola vez con cada variable ligada a un arreglo."""
+    exec_globals = {
+        'random': random,
+        'np': np,
+        'resultado': 0
+    }
+    exec_globals.update(columnas)
+    exec(codigo, exec_globals)
+
+    # Un resultado constante se replica para todo el bloque
+    resultado = np.asarray(exec_globals.get('resultado', 0), dtype=float)
+    return np.broadcast_to(resultado, (cantidad,))
+
+
+class ModeloCompilado:
+    """MonteCarloModel con su FUNCTION compilada una sola vez."""
+
+    def __init__(self, model):
+        self.model = model
+        self.model_id = model.model_id
+        self.codigo = compile(model.function_code, f"<modelo {model.model_id}>", "exec")
+        self.nombres_variables = [var.name for var in model.variables]
+        # El perfil del productor ya comparó ambas evaluaciones sobre escenarios reales
+        self.vectorizable = (model.profile["vectorizable"] if model.profile
+                             else es_vectorizable(self.codigo, model.function_code, self.nombres_variables))
+        self.load_time = time.time()
+        # Globals reutilizados por la evaluación escalar de este modelo
+        self.exec_globals = {
+            'random': random,
+            'np': np,
+            'resultado': 0
+        }
+        # Variables de control: entradas con media conocida que se acumulan junto al resultado
+        self.controles = {var.name: expected_value(var) for var in model.variables
+                          if var.name in model.controls}
+        self.samplers = {}
+
+    def sampler(self, seed):
+        # Un motor de muestreo por semilla de trabajo, reutilizado entre unidades
+        if seed not in self.samplers:
+            self.samplers[seed] = SamplingEngine(self.model.variables, seed, method=self.model.sampling,
+                                                  correlation=self.model.correlation)
+        return self.samplers[seed]
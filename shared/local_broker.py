@@ -0,0 +1,590 @@
+import copy
+import functools
+import heapq
+import itertools
+import threading
+import time
+import uuid
+from collections import deque, defaultdict
+import pika
+from pika import spec
+from pika.frame import Method
+from pika.exceptions import ChannelClosedByBroker, ChannelWrongStateError
+
+# Broker en memoria con la parte de la API de pika que usa el sistema: exchange
+# directo por defecto, fanout y topic; colas exclusivas y con nombre generado;
+# prefetch por consumidor; ack/nack simples y múltiples; reencolado al cancelar
+# o cerrar; x-dead-letter-exchange para los nack sin reencolar; purga y
+# publisher confirms. Los mensajes no se copian ni se
+# serializan: pasan por referencia entre los hilos del proceso.
+#
+# Como en pika, cada conexión corre sus callbacks en el hilo que llama a
+# process_data_events / start_consuming (o en el hilo de su ioloop). Con
+# `latency` > 0 las RPC síncronas tardan un RTT y las entregas y confirms
+# llegan medio RTT después, para simular un broker remoto.
+
+
+class Message:
+    __slots__ = ("exchange", "routing_key", "properties", "body", "redelivered")
+
+    def __init__(self, exchange, routing_key, properties, body):
+        self.exchange = exchange
+        self.routing_key = routing_key
+        self.properties = properties
+        self.body = body
+        self.redelivered = False
+
+
+class Queue:
+    def __init__(self, name, owner=None, arguments=None):
+        self.name = name
+        self.owner = owner  # conexión dueña de una cola exclusiva
+        self.arguments = arguments or {}
+        self.messages = deque()
+        self.consumers = []
+        self.turn = 0
+        self.max_depth = 0
+
+
+class Consumer:
+    def __init__(self, channel, tag, queue, callback, auto_ack, prefetch):
+        self.channel = channel
+        self.tag = tag
+        self.queue = queue
+        self.callback = callback
+        self.auto_ack = auto_ack
+        self.prefetch = prefetch
+        self.unacked = 0
+
+    def available(self):
+        return self.auto_ack or not self.prefetch or self.unacked < self.prefetch
+
+
+def topic_matches(pattern: str, routing_key: str) -> bool:
+    """Routing key contra un binding de topic: '*' es una palabra, '#' cero o más."""
+    words, keys = pattern.split("."), routing_key.split(".")
+
+    @functools.lru_cache(maxsize=None)
+    def match(i, j):
+        if i == len(words):
+            return j == len(keys)
+        if words[i] == "#":
+            return match(i + 1, j) or (j < len(keys) and match(i, j + 1))
+        return j < len(keys) and words[i] in ("*", keys[j]) and match(i + 1, j + 1)
+
+    return match(0, 0)
+
+
+class LocalBroker:
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.lock = threading.RLock()
+        self.queues = {}
+        self.exchanges = {"": "direct"}
+        self.bindings = defaultdict(list)  # exchange -> [(cola, routing_key)]
+        self.tags = itertools.count(1)
+        self.published = 0
+        self.published_bytes = 0
+        self.delivered = 0
+        self.redelivered = 0
+        self.acked = 0
+        self.dropped = 0
+        self.dead_lettered = 0
+        self.unroutable = 0
+
+    # --- Topología ---
+
+    def declare_queue(self, channel, name, passive, exclusive, arguments):
+        with self.lock:
+            if passive:
+                if name not in self.queues:
+                    channel.close_by_broker(404, f"NOT_FOUND - no queue '{name}'")
+                return self.queues[name]
+            name = name or f"amq.gen-{uuid.uuid4().hex[:22]}"
+            if name not in self.queues:
+                self.queues[name] = Queue(name, channel.connection if exclusive else None, arguments)
+            return self.queues[name]
+
+    def declare_exchange(self, name, exchange_type):
+        with self.lock:
+            self.exchanges.setdefault(name, exchange_type)
+
+    def bind(self, queue, exchange, routing_key):
+        with self.lock:
+            if (queue, routing_key) not in self.bindings[exchange]:
+                self.bindings[exchange].append((queue, routing_key))
+
+    def purge(self, name):
+        with self.lock:
+            queue = self.queues.get(name)
+            if queue is None:
+                return 0
+            count = len(queue.messages)
+            queue.messages.clear()
+            return count
+
+    def delete_queue(self, name):
+        with self.lock:
+            queue = self.queues.pop(name, None)
+            for bindings in self.bindings.values():
+                bindings[:] = [(q, k) for q, k in bindings if q != name]
+            if queue is None:
+                return 0
+            for consumer in queue.consumers:
+                consumer.channel.consumers.pop(consumer.tag, None)
+            return len(queue.messages)
+
+    def depth(self, name):
+        """Mensajes listos en la cola, o None si no existe."""
+        with self.lock:
+            queue = self.queues.get(name)
+            return len(queue.messages) if queue is not None else None
+
+    # --- Mensajes ---
+
+    def destinations(self, exchange, routing_key):
+        if exchange == "":
+            return [routing_key] if routing_key in self.queues else []
+        exchange_type = self.exchanges.get(exchange)
+        if exchange_type == "fanout":
+            return [queue for queue, _ in self.bindings[exchange]]
+        if exchange_type == "topic":
+            return [queue for queue, pattern in self.bindings[exchange] if topic_matches(pattern, routing_key)]
+        return [queue for queue, key in self.bindings[exchange] if key == routing_key]
+
+    def publish(self, exchange, routing_key, body, properties):
+        if isinstance(body, str):
+            body = body.encode()
+        with self.lock:
+            self.published += 1
+            self.published_bytes += len(body)
+            names = [name for name in self.destinations(exchange, routing_key) if name in self.queues]
+            if not names:
+                self.unroutable += 1
+            for name in names:
+                queue = self.queues[name]
+                queue.messages.append(Message(exchange, routing_key, properties, body))
+                queue.max_depth = max(queue.max_depth, len(queue.messages))
+                self.dispatch(queue)
+
+    def dispatch(self, queue):
+        # Round robin entre los consumidores con lugar en su prefetch
+        with self.lock:
+            while queue.messages and queue.consumers:
+                for _ in range(len(queue.consumers)):
+                    queue.turn = (queue.turn + 1) % len(queue.consumers)
+                    consumer = queue.consumers[queue.turn]
+                    if consumer.available():
+                        break
+                else:
+                    return
+                message = queue.messages.popleft()
+                self.delivered += 1
+                self.redelivered += message.redelivered
+                consumer.channel.deliver(consumer, queue, message)
+
+    def dead_letter(self, queue, message, reason="rejected"):
+        # Como RabbitMQ: se republica en el exchange de la cola con la historia en x-death
+        exchange = queue.arguments.get("x-dead-letter-exchange")
+        if exchange is None:
+            self.dropped += 1
+            return
+        properties = copy.copy(message.properties)
+        death = {"queue": queue.name, "reason": reason, "count": 1,
+                 "exchange": message.exchange, "routing-keys": [message.routing_key]}
+        properties.headers = {**(properties.headers or {}),
+                              "x-death": [death] + list((properties.headers or {}).get("x-death", []))}
+        routing_key = queue.arguments.get("x-dead-letter-routing-key", message.routing_key)
+        self.dead_lettered += 1
+        self.publish(exchange, routing_key, message.body, properties)
+
+    def requeue(self, deliveries):
+        with self.lock:
+            affected = set()
+            for queue, message in reversed(deliveries):
+                if queue.name in self.queues:
+                    message.redelivered = True
+                    queue.messages.appendleft(message)
+                    affected.add(queue.name)
+            for name in affected:
+                self.dispatch(self.queues[name])
+
+    def stats(self):
+        with self.lock:
+            return {
+                "published": self.published,
+                "published_mb": round(self.published_bytes / 2 ** 20, 2),
+                "delivered": self.delivered,
+                "redelivered": self.redelivered,
+                "acked": self.acked,
+                "dropped": self.dropped,
+                "dead_lettered": self.dead_lettered,
+                "unroutable": self.unroutable,
+                "max_depth": max((queue.max_depth for queue in self.queues.values()), default=0)
+            }
+
+
+class EventLoop:
+    """Callbacks y timers de una conexión, ejecutados en el hilo que la atiende."""
+
+    def __init__(self):
+        self.cond = threading.Condition()
+        self.events = deque()  # (listo_en, callback), en orden de llegada
+        self.timers = []
+        self.sequence = itertools.count()
+        self.stopped = False
+
+    def add(self, callback, delay=0.0):
+        with self.cond:
+            self.events.append((time.perf_counter() + delay, callback))
+            self.cond.notify()
+
+    def call_later(self, delay, callback):
+        with self.cond:
+            timer = [time.perf_counter() + delay, next(self.sequence), callback]
+            heapq.heappush(self.timers, timer)
+            self.cond.notify()
+            return timer
+
+    def remove_timeout(self, timer):
+        timer[2] = None
+
+    def remove(self, condition):
+        # Eventos aún no atendidos que cumplen la condición, en orden
+        with self.cond:
+            removed = [event for event in self.events if condition(event[1])]
+            self.events = deque(event for event in self.events if not condition(event[1]))
+            return removed
+
+    def _ready(self, now):
+        ready = []
+        while self.timers and self.timers[0][0] <= now:
+            callback = heapq.heappop(self.timers)[2]
+            if callback is not None:
+                ready.append(callback)
+        while self.events and self.events[0][0] <= now:
+            ready.append(self.events.popleft()[1])
+        return ready
+
+    def process(self, time_limit=0):
+        """Espera hasta que haya algo listo (o se cumpla time_limit) y lo atiende."""
+        deadline = None if time_limit is None else time.perf_counter() + time_limit
+        with self.cond:
+            while True:
+                now = time.perf_counter()
+                ready = self._ready(now)
+                if ready or self.stopped or (deadline is not None and now >= deadline):
+                    break
+                upcoming = [t[0] for t in self.timers[:1]] + [e[0] for e in list(self.events)[:1]]
+                if deadline is not None:
+                    upcoming.append(deadline)
+                self.cond.wait(max(0.0, min(upcoming) - now) if upcoming else None)
+        for callback in ready:
+            callback()
+        return len(ready)
+
+
+class Channel:
+    """Canal bloqueante (los métodos devuelven el frame) o asíncrono (con callback=)."""
+
+    def __init__(self, connection, number):
+        self.connection = connection
+        self.broker = connection.broker
+        self.channel_number = number
+        self.consumers = {}
+        self.unacked = {}  # delivery_tag -> (cola, mensaje, consumidor)
+        self.next_tag = 0
+        self.prefetch = 0
+        self.on_confirm = None
+        self.confirm_tag = 0
+        self.consuming = False
+        self.is_open = True
+
+    @property
+    def is_closed(self):
+        return not self.is_open
+
+    def _reply(self, method, callback):
+        frame = Method(self.channel_number, method)
+        if callback is not None:
+            self.connection.loop.add(functools.partial(callback, frame), self.broker.latency)
+            return None
+        if self.broker.latency:
+            time.sleep(self.broker.latency)
+        return frame
+
+    def _check(self):
+        if not self.is_open:
+            raise ChannelWrongStateError("Channel is closed.")
+
+    def close_by_broker(self, code, text):
+        self.close()
+        raise ChannelClosedByBroker(code, text)
+
+    # --- Topología ---
+
+    def queue_declare(self, queue='', passive=False, durable=False, exclusive=False,
+                      auto_delete=False, arguments=None, callback=None):
+        self._check()
+        declared = self.broker.declare_queue(self, queue, passive, exclusive, arguments)
+        return self._reply(spec.Queue.DeclareOk(declared.name, len(declared.messages), len(declared.consumers)), callback)
+
+    def exchange_declare(self, exchange, exchange_type='direct', passive=False, durable=False,
+                         auto_delete=False, internal=False, arguments=None, callback=None):
+        self._check()
+        self.broker.declare_exchange(exchange, getattr(exchange_type, 'value', exchange_type))
+        return self._reply(spec.Exchange.DeclareOk(), callback)
+
+    def queue_bind(self, queue, exchange, routing_key=None, arguments=None, callback=None):
+        self._check()
+        self.broker.bind(queue, exchange, routing_key if routing_key is not None else queue)
+        return self._reply(spec.Queue.BindOk(), callback)
+
+    def queue_purge(self, queue, callback=None):
+        self._check()
+        return self._reply(spec.Queue.PurgeOk(self.broker.purge(queue)), callback)
+
+    def queue_delete(self, queue, if_unused=False, if_empty=False, callback=None):
+        self._check()
+        return self._reply(spec.Queue.DeleteOk(self.broker.delete_queue(queue)), callback)
+
+    def basic_qos(self, prefetch_size=0, prefetch_count=0, global_qos=False, callback=None):
+        self._check()
+        # Como en RabbitMQ con global=False: solo lo toman los consumidores creados después
+        self.prefetch = prefetch_count
+        return self._reply(spec.Basic.QosOk(), callback)
+
+    def confirm_delivery(self, ack_nack_callback=None, callback=None):
+        self._check()
+        self.on_confirm = ack_nack_callback or (lambda frame: None)
+        return self._reply(spec.Confirm.SelectOk(), callback)
+
+    # --- Consumo ---
+
+    def basic_consume(self, queue, on_message_callback, auto_ack=False, exclusive=False,
+                      consumer_tag=None, arguments=None, callback=None):
+        self._check()
+        broker = self.broker
+        with broker.lock:
+            declared = broker.queues.get(queue)
+            if declared is None:
+                self.close_by_broker(404, f"NOT_FOUND - no queue '{queue}'")
+            tag = consumer_tag or f"ctag-{next(broker.tags)}"
+            consumer = Consumer(self, tag, declared, on_message_callback, auto_ack, self.prefetch)
+            self.consumers[tag] = consumer
+            declared.consumers.append(consumer)
+            broker.dispatch(declared)
+        if callback is not None:
+            self._reply(spec.Basic.ConsumeOk(tag), callback)
+        return tag
+
+    def deliver(self, consumer, queue, message):
+        # Llamado por el broker con su lock tomado
+        self.next_tag += 1
+        tag = self.next_tag
+        if consumer.auto_ack:
+            self.broker.acked += 1
+        else:
+            consumer.unacked += 1
+            self.unacked[tag] = (queue, message, consumer)
+        method = spec.Basic.Deliver(consumer.tag, tag, message.redelivered, message.exchange, message.routing_key)
+        delivery = functools.partial(self._invoke, consumer, method, message)
+        delivery.consumer = consumer
+        self.connection.loop.add(delivery, self.broker.latency / 2)
+
+    def _invoke(self, consumer, method, message):
+        if self.is_open and consumer.tag in self.consumers:
+            consumer.callback(self, method, message.properties, message.body)
+        elif self.is_open and not consumer.auto_ack:
+            # Se canceló después de que el bucle la tomó: pika la devuelve con nack
+            self.basic_nack(method.delivery_tag, requeue=True)
+
+    def basic_cancel(self, consumer_tag='', callback=None):
+        broker = self.broker
+        with broker.lock:
+            consumer = self.consumers.pop(consumer_tag, None)
+            if consumer is None:
+                return []
+            consumer.queue.consumers.remove(consumer)
+            # Como pika: lo que llegó y no pasó por el callback se devuelve a la cola
+            pending = self.connection.loop.remove(lambda cb: getattr(cb, "consumer", None) is consumer)
+            returned = []
+            for _, delivery in pending:
+                tag = delivery.args[1].delivery_tag
+                if tag in self.unacked:
+                    queue, message, _ = self.unacked.pop(tag)
+                    returned.append((queue, message))
+            consumer.unacked -= len(returned)
+            broker.requeue(returned)
+        if callback is not None:
+            self._reply(spec.Basic.CancelOk(consumer_tag), callback)
+        return []
+
+    def _settle(self, delivery_tag, multiple):
+        if multiple:
+            tags = [tag for tag in self.unacked if tag <= delivery_tag] if delivery_tag else list(self.unacked)
+        else:
+            tags = [delivery_tag] if delivery_tag in self.unacked else []
+        settled = [self.unacked.pop(tag) for tag in tags]
+        queues = set()
+        for queue, _, consumer in settled:
+            consumer.unacked -= 1
+            queues.add(queue)
+        return settled, queues
+
+    def basic_ack(self, delivery_tag=0, multiple=False):
+        self._check()
+        broker = self.broker
+        with broker.lock:
+            settled, queues = self._settle(delivery_tag, multiple)
+            broker.acked += len(settled)
+            for queue in queues:
+                broker.dispatch(queue)
+
+    def basic_nack(self, delivery_tag=0, multiple=False, requeue=True):
+        self._check()
+        broker = self.broker
+        with broker.lock:
+            settled, queues = self._settle(delivery_tag, multiple)
+            if requeue:
+                broker.requeue([(queue, message) for queue, message, _ in settled])
+            else:
+                for queue, message, _ in settled:
+                    broker.dead_letter(queue, message)
+            for queue in queues:
+                broker.dispatch(queue)
+
+    def basic_reject(self, delivery_tag, requeue=True):
+        self.basic_nack(delivery_tag, multiple=False, requeue=requeue)
+
+    def basic_publish(self, exchange, routing_key, body, properties=None, mandatory=False):
+        self._check()
+        self.broker.publish(exchange, routing_key, body, properties or pika.BasicProperties())
+        if self.on_confirm is not None:
+            self.confirm_tag += 1
+            ack = Method(self.channel_number, spec.Basic.Ack(self.confirm_tag, False))
+            self.connection.loop.add(functools.partial(self.on_confirm, ack), self.broker.latency / 2)
+
+    def start_consuming(self):
+        self.consuming = True
+        while self.consuming and self.is_open and self.connection.is_open:
+            self.connection.loop.process(0.5)
+
+    def stop_consuming(self, consumer_tag=None):
+        self.consuming = False
+
+    def close(self, reply_code=0, reply_text="Normal shutdown"):
+        if not self.is_open:
+            return
+        broker = self.broker
+        with broker.lock:
+            self.is_open = False
+            for consumer in self.consumers.values():
+                if consumer in consumer.queue.consumers:
+                    consumer.queue.consumers.remove(consumer)
+            self.consumers = {}
+            # Lo entregado sin ack vuelve a su cola, como al caerse un worker
+            returned = [(queue, message) for queue, message, _ in self.unacked.values()]
+            self.unacked = {}
+            broker.requeue(returned)
+
+
+class _Connection:
+    def __init__(self, broker):
+        self.broker = broker
+        self.loop = EventLoop()
+        self.channels = []
+        self.is_open = True
+
+    @property
+    def is_closed(self):
+        return not self.is_open
+
+    def _new_channel(self):
+        channel = Channel(self, len(self.channels) + 1)
+        self.channels.append(channel)
+        return channel
+
+    def _close(self):
+        if not self.is_open:
+            return False
+        for channel in self.channels:
+            channel.close()
+        with self.broker.lock:
+            for name, queue in list(self.broker.queues.items()):
+                if queue.owner is self:
+                    self.broker.delete_queue(name)
+        self.is_open = False
+        return True
+
+
+class BlockingConnection(_Connection):
+    """Equivalente en memoria de pika.BlockingConnection."""
+
+    def channel(self, channel_number=None):
+        return self._new_channel()
+
+    def process_data_events(self, time_limit=0):
+        self.loop.process(time_limit)
+
+    def sleep(self, duration):
+        deadline = time.perf_counter() + duration
+        while (remaining := deadline - time.perf_counter()) > 0:
+            self.loop.process(remaining)
+
+    def call_later(self, delay, callback):
+        return self.loop.call_later(delay, callback)
+
+    def remove_timeout(self, timeout_id):
+        self.loop.remove_timeout(timeout_id)
+
+    def add_callback_threadsafe(self, callback):
+        self.loop.add(callback)
+
+    def close(self, reply_code=200, reply_text="Normal shutdown"):
+        self._close()
+
+
+class IOLoop:
+    def __init__(self, loop):
+        self.loop = loop
+
+    def start(self):
+        self.loop.stopped = False
+        while not self.loop.stopped:
+            self.loop.process(0.5)
+
+    def stop(self):
+        with self.loop.cond:
+            self.loop.stopped = True
+            self.loop.cond.notify()
+
+    def call_later(self, delay, callback):
+        return self.loop.call_later(delay, callback)
+
+    def remove_timeout(self, timeout_handle):
+        self.loop.remove_timeout(timeout_handle)
+
+    def add_callback_threadsafe(self, callback):
+        self.loop.add(callback)
+
+
+class SelectConnection(_Connection):
+    """Equivalente en memoria de pika.SelectConnection: todo pasa en el hilo de su ioloop."""
+
+    def __init__(self, broker, on_open_callback=None, on_open_error_callback=None, on_close_callback=None):
+        super().__init__(broker)
+        self.ioloop = IOLoop(self.loop)
+        self.on_close_callback = on_close_callback
+        if on_open_callback:
+            self.loop.add(functools.partial(on_open_callback, self), broker.latency)
+
+    def channel(self, channel_number=None, on_open_callback=None):
+        channel = self._new_channel()
+        if on_open_callback:
+            self.loop.add(functools.partial(on_open_callback, channel), self.broker.latency)
+        return channel
+
+    def close(self, reply_code=200, reply_text="Normal shutdown"):
+        if self._close() and self.on_close_callback:
+            self.loop.add(functools.partial(self.on_close_callback, self, ConnectionError(reply_text)))
@@ -1,14 +1,20 @@
 import json
 import enum
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional
+from shared import SCENARIOS_QUEUE, RESULTS_QUEUE
 
 class DistributionType(enum.Enum):
     UNIFORM = "uniform"
     NORMAL = "normal"
     EXPONENTIAL = "exponential"
+    LOGNORMAL = "lognormal"
+    TRIANGULAR = "triangular"
+    BETA = "beta"
+    DISCRETE = "discrete"
+    EMPIRICAL = "empirical"
 
 class VariableDefinition:
-    def __init__(self, name: str, distribution: DistributionType, parameters: Dict[str, float]):
+    def __init__(self, name: str, distribution: DistributionType, parameters: Dict[str, Any]):
         self.name = name
         self.distribution = distribution
         self.parameters = parameters
@@ -29,18 +35,30 @@ class VariableDefinition:
         )
 
 class MonteCarloModel:
-    def __init__(self, model_id: str, function_code: str, variables: List[VariableDefinition], iterations: int = 1000):
+    def __init__(self, model_id: str, function_code: str, variables: List[VariableDefinition], iterations: int = 1000,
+                 sampling: str = "random", controls: Optional[List[str]] = None,
+                 correlation: Optional[List[Dict[str, Any]]] = None, profile: Optional[Dict[str, Any]] = None):
         self.model_id = model_id
         self.function_code = function_code
         self.variables = variables
         self.iterations = iterations
+        self.sampling = sampling
+        self.controls = controls or []
+        # Grupos de variables correlacionadas: [{"variables": [...], "matrix": [[...]]}]
+        self.correlation = correlation or []
+        # Perfil de costo medido por el productor antes de publicar (productor/perfil.py)
+        self.profile = profile
     
     def to_json(self):
         return json.dumps({
             "model_id": self.model_id,
             "function_code": self.function_code,
             "variables": [var.to_dict() for var in self.variables],
-            "iterations": self.iterations
+            "iterations": self.iterations,
+            "sampling": self.sampling,
+            "controls": self.controls,
+            "correlation": self.correlation,
+            "profile": self.profile
         })
     
     @classmethod
@@ -51,7 +69,11 @@ class MonteCarloModel:
             model_id=data["model_id"],
             function_code=data["function_code"],
             variables=variables,
-            iterations=data.get("iterations", 1000)
+            iterations=data.get("iterations", 1000),
+            sampling=data.get("sampling", "random"),
+            controls=data.get("controls"),
+            correlation=data.get("correlation"),
+            profile=data.get("profile")
         )
 
 class Scenario:
@@ -99,4 +121,243 @@ class Result:
             model_id=data["model_id"],
             result=data["result"],
             worker_id=data["worker_id"]
-        )
\ No newline at end of file
+        )
+
+class ScenarioBatch:
+    def __init__(self, batch_id: str, model_id: str, start_index: int, columns: Dict[str, List[float]]):
+        self.batch_id = batch_id
+        self.model_id = model_id
+        self.start_index = start_index
+        self.columns = columns
+
+    @property
+    def count(self) -> int:
+        return len(next(iter(self.columns.values()))) if self.columns else 0
+
+    def scenario_ids(self) -> List[str]:
+        return [f"{self.model_id}_{self.start_index + i:06d}" for i in range(self.count)]
+
+    def rows(self):
+        names = list(self.columns.keys())
+        for values in zip(*(self.columns[name] for name in names)):
+            yield dict(zip(names, values))
+
+    def to_json(self):
+        return json.dumps({
+            "batch_id": self.batch_id,
+            "model_id": self.model_id,
+            "start_index": self.start_index,
+            "columns": {name: list(values) for name, values in self.columns.items()}
+        })
+
+    @classmethod
+    def from_json(cls, json_str: str):
+        data = json.loads(json_str)
+        return cls(
+            batch_id=data["batch_id"],
+            model_id=data["model_id"],
+            start_index=data["start_index"],
+            columns=data["columns"]
+        )
+
+class WorkUnit:
+    def __init__(self, model_id: str, seed: int, start_index: int, count: int):
+        self.model_id = model_id
+        self.seed = seed
+        self.start_index = start_index
+        self.count = count
+
+    @property
+    def unit_id(self) -> str:
+        return f"{self.model_id}_u{self.start_index:06d}"
+
+    def to_json(self):
+        return json.dumps({
+            "model_id": self.model_id,
+            "seed": self.seed,
+            "start_index": self.start_index,
+            "count": self.count
+        })
+
+    @classmethod
+    def from_json(cls, json_str: str):
+        data = json.loads(json_str)
+        return cls(
+            model_id=data["model_id"],
+            seed=data["seed"],
+            start_index=data["start_index"],
+            count=data["count"]
+        )
+
+class ResultBatch:
+    def __init__(self, batch_id: str, model_id: str, start_index: int, results: List[float], worker_id: str):
+        self.batch_id = batch_id
+        self.model_id = model_id
+        self.start_index = start_index
+        self.results = results
+        self.worker_id = worker_id
+
+    def scenario_ids(self) -> List[str]:
+        return [f"{self.model_id}_{self.start_index + i:06d}" for i in range(len(self.results))]
+
+    def to_results(self) -> List[Result]:
+        return [
+            Result(scenario_id, self.model_id, value, self.worker_id)
+            for scenario_id, value in zip(self.scenario_ids(), self.results)
+            if value is not None
+        ]
+
+    def to_json(self):
+        return json.dumps({
+            "batch_id": self.batch_id,
+            "model_id": self.model_id,
+            "start_index": self.start_index,
+            "results": self.results,
+            "worker_id": self.worker_id
+        })
+
+    @classmethod
+    def from_json(cls, json_str: str):
+        data = json.loads(json_str)
+        return cls(
+            batch_id=data["batch_id"],
+            model_id=data["model_id"],
+            start_index=data["start_index"],
+            results=data["results"],
+            worker_id=data["worker_id"]
+        )
+
+class ResultSummary:
+    def __init__(self, summary_id: str, model_id: str, worker_id: str, aggregate: Dict[str, Any],
+                 units: Optional[List[List[int]]] = None):
+        self.summary_id = summary_id
+        self.model_id = model_id
+        self.worker_id = worker_id
+        self.aggregate = aggregate
+        # [start_index, count] de cada lote o unidad de trabajo que cubre el resumen
+        self.units = units or []
+
+    def to_json(self):
+        return json.dumps({
+            "summary_id": self.summary_id,
+            "model_id": self.model_id,
+            "worker_id": self.worker_id,
+            "aggregate": self.aggregate,
+            "units": self.units
+        })
+
+    @classmethod
+    def from_json(cls, json_str: str):
+        data = json.loads(json_str)
+        return cls(
+            summary_id=data["summary_id"],
+            model_id=data["model_id"],
+            worker_id=data["worker_id"],
+            aggregate=data["aggregate"],
+            units=data.get("units")
+        )
+
+class WorkerMetrics:
+    def __init__(self, worker_id: str, timestamp: float, processed: int, scenarios_per_sec: float,
+                 latency_p50: float, latency_p99: float, cache: Dict[str, Any],
+                 current_model: Optional[str], idle_time: float, processes: int = 1,
+                 jobs: Optional[Dict[str, Any]] = None, stages: Optional[Dict[str, float]] = None):
+        self.worker_id = worker_id
+        self.timestamp = timestamp
+        self.processed = processed
+        self.scenarios_per_sec = scenarios_per_sec
+        self.latency_p50 = latency_p50
+        self.latency_p99 = latency_p99
+        self.cache = cache
+        self.current_model = current_model
+        self.idle_time = idle_time
+        self.processes = processes
+        self.jobs = jobs or {}
+        # Utilización de cada etapa (recepción, cómputo, publicación) en los consumidores en pipeline
+        self.stages = stages
+
+    def to_json(self):
+        return json.dumps({
+            "worker_id": self.worker_id,
+            "timestamp": self.timestamp,
+            "processed": self.processed,
+            "scenarios_per_sec": self.scenarios_per_sec,
+            "latency_p50": self.latency_p50,
+            "latency_p99": self.latency_p99,
+            "cache": self.cache,
+            "current_model": self.current_model,
+            "idle_time": self.idle_time,
+            "processes": self.processes,
+            "jobs": self.jobs,
+            "stages": self.stages
+        })
+
+    @classmethod
+    def from_json(cls, json_str: str):
+        data = json.loads(json_str)
+        return cls(
+            worker_id=data["worker_id"],
+            timestamp=data["timestamp"],
+            processed=data["processed"],
+            scenarios_per_sec=data["scenarios_per_sec"],
+            latency_p50=data["latency_p50"],
+            latency_p99=data["latency_p99"],
+            cache=data["cache"],
+            current_model=data.get("current_model"),
+            idle_time=data["idle_time"],
+            processes=data.get("processes", 1),
+            jobs=data.get("jobs"),
+            stages=data.get("stages")
+        )
+
+class Job:
+    # Estados: 'active' (publicando), 'closed' (sin más publicaciones, se drena
+    # la cola), 'done' (terminado antes de tiempo, su cola ya se vació)
+    def __init__(self, job_id: str, model_id: str, weight: int = 1, published: int = 0,
+                 status: str = "active", timestamp: float = 0.0, first_index: int = 0):
+        self.job_id = job_id
+        self.model_id = model_id
+        self.weight = weight
+        self.published = published
+        self.status = status
+        self.timestamp = timestamp
+        # Los escenarios del trabajo son [first_index, first_index + published)
+        self.first_index = first_index
+
+    @property
+    def queue(self) -> str:
+        return f"{SCENARIOS_QUEUE}.{self.job_id}"
+
+    @property
+    def results_key(self) -> str:
+        return f"{RESULTS_QUEUE}.{self.job_id}"
+
+    @staticmethod
+    def id_from_results_key(routing_key: str) -> Optional[str]:
+        # RESULTS_QUEUE a secas corresponde a la cola de escenarios compartida
+        _, _, job_id = routing_key.partition(".")
+        return job_id or None
+
+    def to_json(self):
+        return json.dumps({
+            "job_id": self.job_id,
+            "model_id": self.model_id,
+            "weight": self.weight,
+            "published": self.published,
+            "status": self.status,
+            "timestamp": self.timestamp,
+            "first_index": self.first_index
+        })
+
+    @classmethod
+    def from_json(cls, json_str: str):
+        data = json.loads(json_str)
+        return cls(
+            job_id=data["job_id"],
+            model_id=data["model_id"],
+            weight=data.get("weight", 1),
+            published=data.get("published", 0),
+            status=data.get("status", "active"),
+            timestamp=data.get("timestamp", 0.0),
+            first_index=data.get("first_index", 0)
+        )
@@ -0,0 +1,160 @@
+import numpy as np
+from typing import Any, Dict, List, Optional, Tuple
+from shared.models import VariableDefinition
+from shared.sobol import ScrambledSobol
+from shared.distributions import SAMPLERS, PPFS, norm_ppf, from_normal
+
+# Escenarios por flujo aleatorio independiente. El escenario n siempre se
+# muestrea del flujo n // STREAM_BLOCK, así que cualquier proceso puede
+# generar cualquier rango y obtener exactamente los mismos valores.
+STREAM_BLOCK = 16384
+
+
+# Métodos de muestreo (directiva SAMPLING: del archivo de modelo):
+#   random      pseudoaleatorio i.i.d. (por defecto)
+#   antithetic  pares (u, 1 - u): el escenario 2k+1 es el reflejo del 2k
+#   lhs         hipercubo latino por rebanadas: cada tramo alineado de
+#               LHS_SLICE escenarios es un hipercubo latino y el flujo
+#               completo también lo es con STREAM_BLOCK estratos
+#   sobol       Sobol aleatorizado sobre toda la secuencia (una dimensión por variable)
+SAMPLING_METHODS = ('random', 'antithetic', 'lhs', 'sobol')
+# Igual al BATCH_SIZE por defecto: cada lote publicado queda estratificado
+LHS_SLICE = 512
+
+
+def sliced_lhs(rng: np.random.Generator, size: int, slice_size: int) -> np.ndarray:
+    """Uniformes de un hipercubo latino de `size` puntos partido en rebanadas que también lo son."""
+    slices = size // slice_size
+    # Estrato grueso j = estratos finos j·slices .. (j+1)·slices - 1; cada rebanada
+    # recibe exactamente un estrato fino de cada estrato grueso
+    fine = np.argsort(rng.random((slice_size, slices)), axis=1) + slices * np.arange(slice_size)[:, None]
+    # Dentro de cada rebanada los estratos gruesos se visitan en orden aleatorio
+    order = np.argsort(rng.random((slices, slice_size)), axis=1)
+    strata = fine.T[np.arange(slices)[:, None], order].ravel()
+    return (strata + rng.random(size)) / size
+
+
+def cholesky_factor(names: List[str], matrix: List[List[float]]) -> np.ndarray:
+    """Factor de Cholesky de una matriz de correlación; ValueError si no es válida."""
+    corr = np.asarray(matrix, dtype=float)
+    if corr.shape != (len(names), len(names)):
+        raise ValueError(f"CORRELATION de {', '.join(names)} debe ser una matriz de {len(names)}x{len(names)}")
+    if not np.allclose(np.diag(corr), 1):
+        raise ValueError("CORRELATION debe tener unos en la diagonal")
+    if not np.allclose(corr, corr.T):
+        raise ValueError("CORRELATION debe ser simétrica")
+    if np.any(np.abs(corr) > 1):
+        raise ValueError("CORRELATION: las correlaciones deben estar entre -1 y 1")
+    try:
+        return np.linalg.cholesky(corr)
+    except np.linalg.LinAlgError:
+        # Incluye correlaciones perfectas: esas variables se expresan en FUNCTION
+        raise ValueError(f"CORRELATION de {', '.join(names)} no es definida positiva")
+
+
+class SamplingEngine:
+    """Muestreo en bloque y reproducible de las variables de un modelo.
+
+    Cada (bloque de STREAM_BLOCK escenarios, variable) tiene su propio
+    Generator derivado de la semilla del trabajo con SeedSequence, de modo
+    que el resultado de un rango no depende de quién ni en qué orden lo genera.
+
+    Las variables de un grupo de `correlation` se muestrean con una cópula
+    gaussiana: normales independientes del método elegido, multiplicadas por
+    el factor de Cholesky en una sola operación por bloque y llevadas a cada
+    distribución. La correlación indicada es la de las normales subyacentes.
+    """
+
+    def __init__(self, variables: List[VariableDefinition], seed: Optional[int] = None,
+                 stream_block: int = STREAM_BLOCK, method: str = 'random',
+                 correlation: Optional[List[Dict[str, Any]]] = None):
+        if method not in SAMPLING_METHODS:
+            raise ValueError(f"Método de muestreo desconocido: {method}")
+        if method == 'antithetic' and stream_block % 2:
+            raise ValueError("El muestreo antitético necesita flujos de tamaño par")
+        if method == 'lhs' and stream_block % LHS_SLICE:
+            raise ValueError(f"El hipercubo latino necesita flujos múltiplos de {LHS_SLICE}")
+        self.variables = variables
+        self.seed = seed if seed is not None else np.random.SeedSequence().entropy
+        self.stream_block = stream_block
+        self.method = method
+        self.samplers = [SAMPLERS[var.distribution] for var in variables]
+        self.ppfs = [PPFS[var.distribution] for var in variables]
+        index = {var.name: i for i, var in enumerate(variables)}
+        self.groups = [([index[name] for name in group["variables"]],
+                        cholesky_factor(group["variables"], group["matrix"]))
+                       for group in correlation or []]
+        self.correlated = {i for indices, _ in self.groups for i in indices}
+        # Sobol: una única secuencia por trabajo, aleatorizada con la semilla
+        self.sobol = [ScrambledSobol(i, self.generator(0, i)) for i in range(len(variables))] \
+            if method == 'sobol' else None
+        self._cached_block = None
+        self._cached_columns = None
+
+    def generator(self, block: int, var_index: int) -> np.random.Generator:
+        seed_seq = np.random.SeedSequence(self.seed, spawn_key=(block, var_index))
+        return np.random.Generator(np.random.PCG64(seed_seq))
+
+    def uniforms(self, block: int, var_index: int) -> np.ndarray:
+        size = self.stream_block
+        if self.method == 'sobol':
+            return self.sobol[var_index].points(block * size, size)
+
+        rng = self.generator(block, var_index)
+        if self.method == 'lhs':
+            return sliced_lhs(rng, size, LHS_SLICE)
+        half = rng.random(size // 2)
+        return np.column_stack([half, 1 - half]).ravel()
+
+    def normals(self, block: int, var_index: int) -> np.ndarray:
+        # Normales estándar independientes para la cópula, con la estructura del método
+        if self.method == 'random':
+            return self.generator(block, var_index).standard_normal(self.stream_block)
+        return norm_ppf(self.uniforms(block, var_index))
+
+    def sample_block(self, block: int) -> Dict[str, np.ndarray]:
+        if block != self._cached_block:
+            columns = {}
+            for i, var in enumerate(self.variables):
+                if i in self.correlated:
+                    continue
+                if self.method == 'random':
+                    columns[var.name] = self.samplers[i](self.generator(block, i), var.parameters, self.stream_block)
+                else:
+                    columns[var.name] = self.ppfs[i](self.uniforms(block, i), var.parameters)
+
+            for indices, factor in self.groups:
+                correlated = factor @ np.stack([self.normals(block, i) for i in indices])
+                for i, z in zip(indices, correlated):
+                    columns[self.variables[i].name] = from_normal(z, self.variables[i])
+
+            self._cached_columns = {var.name: columns[var.name] for var in self.variables}
+            self._cached_block = block
+        return self._cached_columns
+
+    def sample(self, start_index: int, count: int) -> Dict[str, np.ndarray]:
+        """Columnas (un arreglo por variable) de los escenarios [start_index, start_index + count)."""
+        columns = {var.name: np.empty(count) for var in self.variables}
+        position = start_index
+        end = start_index + count
+        while position < end:
+            block, offset = divmod(position, self.stream_block)
+            take = min(self.stream_block - offset, end - position)
+            block_columns = self.sample_block(block)
+            for name, values in block_columns.items():
+                columns[name][position - start_index:position - start_index + take] = values[offset:offset + take]
+            position += take
+        return columns
+
+
+def shard_ranges(total: int, shards: int, stream_block: int = STREAM_BLOCK) -> List[Tuple[int, int]]:
+    """Reparte [0, total) en rangos (start, count) alineados a flujos, uno por proceso productor."""
+    blocks = -(-total // stream_block)
+    per_shard = -(-blocks // shards) if shards > 0 else blocks
+    ranges = []
+    for shard in range(shards):
+        start = shard * per_shard * stream_block
+        if start >= total:
+            break
+        ranges.append((start, min(per_shard * stream_block, total - start)))
+    return ranges
@@ -0,0 +1,96 @@
+import numpy as np
+
+# Secuencia de Sobol con scrambling lineal de matriz (LMS) y desplazamiento
+# digital aleatorio, en base 2 con 32 dígitos. El punto n se calcula directo
+# a partir de n (orden de código Gray), así que cualquier proceso puede generar
+# cualquier rango de índices sin recorrer los anteriores.
+
+BITS = 32
+
+# Números de dirección de Joe y Kuo (new-joe-kuo-6.21201) para las
+# dimensiones 2..21: (grado s, coeficientes a, m_1..m_s). La dimensión 1 es
+# la secuencia de van der Corput.
+DIRECTION_NUMBERS = [
+    (1, 0, [1]),
+    (2, 1, [1, 3]),
+    (3, 1, [1, 3, 1]),
+    (3, 2, [1, 1, 1]),
+    (4, 1, [1, 1, 3, 3]),
+    (4, 4, [1, 3, 5, 13]),
+    (5, 2, [1, 1, 5, 5, 17]),
+    (5, 4, [1, 1, 5, 5, 5]),
+    (5, 7, [1, 1, 7, 11, 19]),
+    (5, 11, [1, 1, 5, 1, 1]),
+    (5, 13, [1, 1, 1, 3, 11]),
+    (5, 14, [1, 3, 5, 5, 31]),
+    (6, 1, [1, 3, 3, 9, 7, 49]),
+    (6, 13, [1, 1, 1, 15, 21, 21]),
+    (6, 16, [1, 3, 1, 13, 27, 49]),
+    (6, 19, [1, 1, 1, 15, 7, 5]),
+    (6, 22, [1, 3, 1, 15, 13, 25]),
+    (6, 25, [1, 1, 5, 5, 19, 61]),
+    (7, 1, [1, 3, 7, 11, 23, 15, 103]),
+    (7, 4, [1, 3, 7, 13, 13, 15, 69]),
+]
+MAX_DIMENSIONS = len(DIRECTION_NUMBERS) + 1
+
+
+def direction_vectors(dimension: int) -> np.ndarray:
+    """V_1..V_BITS de una dimensión (0 = van der Corput), alineados al bit más significativo."""
+    if dimension == 0:
+        return np.array([1 << (BITS - i) for i in range(1, BITS + 1)], dtype=np.uint64)
+
+    s, a, m = DIRECTION_NUMBERS[dimension - 1]
+    v = [m[i] << (BITS - 1 - i) for i in range(s)]
+    for i in range(s, BITS):
+        value = v[i - s] ^ (v[i - s] >> s)
+        for k in range(1, s):
+            if (a >> (s - 1 - k)) & 1:
+                value ^= v[i - k]
+        v.append(value)
+    return np.array(v, dtype=np.uint64)
+
+
+def _parity(value: int) -> int:
+    return bin(value).count('1') & 1
+
+
+def scramble(vectors: np.ndarray, rng: np.random.Generator) -> np.ndarray:
+    """Multiplica los vectores de dirección por una matriz triangular inferior aleatoria con diagonal 1."""
+    # Fila k de la matriz como máscara de bits: dígitos 0..k (desde el más significativo)
+    masks = []
+    for k in range(BITS):
+        row = int(rng.integers(0, 1 << k)) if k else 0
+        mask = 1 << (BITS - 1 - k)
+        for l in range(k):
+            if (row >> l) & 1:
+                mask |= 1 << (BITS - 1 - l)
+        masks.append(mask)
+
+    scrambled = []
+    for v in vectors.tolist():
+        out = 0
+        for k, mask in enumerate(masks):
+            out |= _parity(v & mask) << (BITS - 1 - k)
+        scrambled.append(out)
+    return np.array(scrambled, dtype=np.uint64)
+
+
+class ScrambledSobol:
+    """Una dimensión de Sobol aleatorizada; los índices van de 0 a 2**32 - 1."""
+
+    def __init__(self, dimension: int, rng: np.random.Generator):
+        if dimension >= MAX_DIMENSIONS:
+            raise ValueError(f"Sobol admite hasta {MAX_DIMENSIONS} variables")
+        self.vectors = scramble(direction_vectors(dimension), rng)
+        self.shift = np.uint64(rng.integers(0, 1 << BITS))
+
+    def points(self, start: int, count: int) -> np.ndarray:
+        """Uniformes en (0, 1) de los índices [start, start + count)."""
+        index = np.arange(start, start + count, dtype=np.uint64)
+        gray = index ^ (index >> np.uint64(1))
+        x = np.full(count, self.shift, dtype=np.uint64)
+        for j in range(BITS):
+            bit = (gray >> np.uint64(j)) & np.uint64(1)
+            x ^= bit * self.vectors[j]
+        return (x.astype(np.float64) + 0.5) / float(1 << BITS)
@@ -0,0 +1,372 @@
+import math
+import numpy as np
+from typing import Any, Dict, List, Optional
+
+# Estadísticos en línea y combinables (merge) para resultados Monte Carlo.
+# Todos se pueden actualizar por bloques en cualquier worker y luego
+# combinarse en cualquier orden obteniendo el mismo resumen.
+
+HISTOGRAM_BINS = 64
+SKETCH_ACCURACY = 0.01
+SKETCH_MAX_BUCKETS = 2048
+
+
+def _add_counts(store: Dict[int, int], keys: np.ndarray):
+    unique, counts = np.unique(keys, return_counts=True)
+    for key, count in zip(unique.tolist(), counts.tolist()):
+        store[key] = store.get(key, 0) + count
+
+
+class RunningStats:
+    """Conteo, suma, media/M2 de Welford y mínimo/máximo."""
+
+    def __init__(self, count: int = 0, total: float = 0.0, mean: float = 0.0, m2: float = 0.0,
+                 minimum: float = math.inf, maximum: float = -math.inf):
+        self.count = count
+        self.total = total
+        self.mean = mean
+        self.m2 = m2
+        self.minimum = minimum
+        self.maximum = maximum
+
+    def update(self, values: np.ndarray):
+        if len(values) == 0:
+            return
+        block_mean = float(values.mean())
+        block_m2 = float(((values - block_mean) ** 2).sum())
+        self._combine(len(values), float(values.sum()), block_mean, block_m2,
+                      float(values.min()), float(values.max()))
+
+    def merge(self, other: 'RunningStats'):
+        if other.count:
+            self._combine(other.count, other.total, other.mean, other.m2, other.minimum, other.maximum)
+
+    def _combine(self, count, total, mean, m2, minimum, maximum):
+        # Combinación de Chan et al. para la media y M2 de dos muestras
+        n = self.count + count
+        delta = mean - self.mean
+        self.mean += delta * count / n
+        self.m2 += m2 + delta * delta * self.count * count / n
+        self.count = n
+        self.total += total
+        self.minimum = min(self.minimum, minimum)
+        self.maximum = max(self.maximum, maximum)
+
+    @property
+    def variance(self) -> float:
+        return self.m2 / (self.count - 1) if self.count > 1 else 0.0
+
+    @property
+    def std(self) -> float:
+        return math.sqrt(self.variance)
+
+    @property
+    def stderr(self) -> float:
+        return self.std / math.sqrt(self.count) if self.count > 1 else math.inf
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"count": self.count, "sum": self.total, "mean": self.mean, "m2": self.m2,
+                "min": self.minimum if self.count else None, "max": self.maximum if self.count else None}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]):
+        return cls(data["count"], data["sum"], data["mean"], data["m2"],
+                   data["min"] if data["min"] is not None else math.inf,
+                   data["max"] if data["max"] is not None else -math.inf)
+
+
+class Histogram:
+    """Histograma de ancho fijo con bins alineados en 0.
+
+    El ancho es siempre una potencia de 2, así que dos histogramas con
+    anchos distintos se combinan exactamente llevando el fino al más grueso.
+    Cuando se superan `max_bins` bins el ancho se duplica.
+    """
+
+    def __init__(self, max_bins: int = HISTOGRAM_BINS, width: Optional[float] = None,
+                 counts: Optional[Dict[int, int]] = None):
+        self.max_bins = max_bins
+        self.width = width
+        self.counts = counts if counts is not None else {}
+
+    def update(self, values: np.ndarray):
+        if len(values) == 0:
+            return
+        if self.width is None:
+            span = float(values.max() - values.min()) or max(abs(float(values[0])), 1.0)
+            self.width = 2.0 ** math.ceil(math.log2(span / self.max_bins))
+        _add_counts(self.counts, np.floor(values / self.width).astype(np.int64))
+        self._compact()
+
+    def _coarsen(self, width: float):
+        factor = int(round(width / self.width))
+        if factor > 1:
+            coarse = {}
+            for key, count in self.counts.items():
+                coarse[key // factor] = coarse.get(key // factor, 0) + count
+            self.counts = coarse
+        self.width = width
+
+    def _compact(self):
+        while len(self.counts) > self.max_bins:
+            self._coarsen(self.width * 2)
+
+    def merge(self, other: 'Histogram'):
+        if other.width is None:
+            return
+        if self.width is None:
+            self.width = other.width
+        width = max(self.width, other.width)
+        self._coarsen(width)
+        other_counts = Histogram(other.max_bins, other.width, dict(other.counts))
+        other_counts._coarsen(width)
+        for key, count in other_counts.counts.items():
+            self.counts[key] = self.counts.get(key, 0) + count
+        self._compact()
+
+    def bins(self):
+        """Bordes izquierdos, ancho y conteos en orden ascendente."""
+        keys = sorted(self.counts)
+        return [k * self.width for k in keys], self.width, [self.counts[k] for k in keys]
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"max_bins": self.max_bins, "width": self.width, "counts": list(self.counts.items())}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]):
+        return cls(data["max_bins"], data["width"], {int(k): c for k, c in data["counts"]})
+
+
+class QuantileSketch:
+    """Sketch de cuantiles con error relativo acotado (DDSketch).
+
+    Cada valor cae en el bucket ceil(log_gamma |x|); combinar dos sketches
+    es sumar sus conteos por bucket.
+    """
+
+    MIN_POSITIVE = 1e-12
+
+    def __init__(self, relative_accuracy: float = SKETCH_ACCURACY, max_buckets: int = SKETCH_MAX_BUCKETS):
+        self.relative_accuracy = relative_accuracy
+        self.max_buckets = max_buckets
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self.log_gamma = math.log(self.gamma)
+        self.positive: Dict[int, int] = {}
+        self.negative: Dict[int, int] = {}
+        self.zero_count = 0
+        self.count = 0
+
+    def _keys(self, magnitudes: np.ndarray) -> np.ndarray:
+        return np.ceil(np.log(magnitudes) / self.log_gamma).astype(np.int64)
+
+    def update(self, values: np.ndarray):
+        if len(values) == 0:
+            return
+        positive = values[values > self.MIN_POSITIVE]
+        negative = -values[values < -self.MIN_POSITIVE]
+        _add_counts(self.positive, self._keys(positive))
+        _add_counts(self.negative, self._keys(negative))
+        self.zero_count += len(values) - len(positive) - len(negative)
+        self.count += len(values)
+        self._collapse()
+
+    def _collapse(self):
+        # Si hay demasiados buckets se juntan los de menor magnitud (los más cercanos a 0)
+        for store in (self.positive, self.negative):
+            if len(store) > self.max_buckets:
+                keys = sorted(store)
+                excess = keys[:len(keys) - self.max_buckets + 1]
+                store[excess[-1]] = sum(store.pop(k) for k in excess[:-1]) + store[excess[-1]]
+
+    def merge(self, other: 'QuantileSketch'):
+        if other.relative_accuracy != self.relative_accuracy:
+            raise ValueError("Solo se pueden combinar sketches con la misma precisión relativa")
+        for store, other_store in ((self.positive, other.positive), (self.negative, other.negative)):
+            for key, count in other_store.items():
+                store[key] = store.get(key, 0) + count
+        self.zero_count += other.zero_count
+        self.count += other.count
+        self._collapse()
+
+    def _value(self, key: int) -> float:
+        return 2 * self.gamma ** key / (self.gamma + 1)
+
+    def quantile(self, q: float) -> Optional[float]:
+        if self.count == 0:
+            return None
+        rank = q * (self.count - 1)
+        seen = 0
+        for key in sorted(self.negative, reverse=True):
+            seen += self.negative[key]
+            if seen > rank:
+                return -self._value(key)
+        seen += self.zero_count
+        if seen > rank:
+            return 0.0
+        for key in sorted(self.positive):
+            seen += self.positive[key]
+            if seen > rank:
+                return self._value(key)
+        return self._value(max(self.positive)) if self.positive else 0.0
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"relative_accuracy": self.relative_accuracy, "max_buckets": self.max_buckets,
+                "positive": list(self.positive.items()), "negative": list(self.negative.items()),
+                "zero_count": self.zero_count, "count": self.count}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]):
+        sketch = cls(data["relative_accuracy"], data["max_buckets"])
+        sketch.positive = {int(k): c for k, c in data["positive"]}
+        sketch.negative = {int(k): c for k, c in data["negative"]}
+        sketch.zero_count = data["zero_count"]
+        sketch.count = data["count"]
+        return sketch
+
+
+class ControlVariates:
+    """Media y co-momentos de (resultado, controles) para el estimador con variables de control.
+
+    Los controles son entradas del modelo con media conocida. Con
+    beta = Cov(C)^-1 Cov(C, Y), la media ajustada Y - beta·(C - mu) es
+    insesgada y su varianza es la residual de la regresión de Y sobre C.
+    """
+
+    def __init__(self, names: List[str], means: List[float]):
+        self.names = list(names)
+        self.means = np.asarray(means, dtype=float)
+        dims = len(self.names) + 1
+        self.count = 0
+        self.mean = np.zeros(dims)
+        self.m2 = np.zeros((dims, dims))
+
+    def update(self, results: np.ndarray, controls: np.ndarray):
+        # controls: una fila por control, alineada con results
+        if len(results) == 0:
+            return
+        z = np.vstack([results, controls])
+        block_mean = z.mean(axis=1)
+        centered = z - block_mean[:, None]
+        self._combine(len(results), block_mean, centered @ centered.T)
+
+    def merge(self, other: 'ControlVariates'):
+        if other.count:
+            self._combine(other.count, other.mean, other.m2)
+
+    def _combine(self, count, mean, m2):
+        # Misma combinación de Chan et al. que RunningStats, con matriz de co-momentos
+        n = self.count + count
+        delta = mean - self.mean
+        self.mean = self.mean + delta * count / n
+        self.m2 = self.m2 + m2 + np.outer(delta, delta) * self.count * count / n
+        self.count = n
+
+    @property
+    def beta(self) -> np.ndarray:
+        # lstsq tolera controles constantes o colineales
+        return np.linalg.lstsq(self.m2[1:, 1:], self.m2[1:, 0], rcond=None)[0]
+
+    @property
+    def adjusted_mean(self) -> float:
+        return float(self.mean[0] - self.beta @ (self.mean[1:] - self.means))
+
+    @property
+    def residual_variance(self) -> float:
+        dof = self.count - len(self.names) - 1
+        if dof <= 0:
+            return 0.0
+        return max(float(self.m2[0, 0] - self.beta @ self.m2[1:, 0]), 0.0) / dof
+
+    @property
+    def stderr(self) -> float:
+        return math.sqrt(self.residual_variance / self.count) if self.count > len(self.names) + 1 else math.inf
+
+    @property
+    def variance_reduction(self) -> float:
+        """Fracción de la varianza de Y explicada por los controles (R²)."""
+        if self.m2[0, 0] <= 0:
+            return 0.0
+        return float(self.beta @ self.m2[1:, 0]) / self.m2[0, 0]
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"names": self.names, "means": self.means.tolist(), "count": self.count,
+                "mean": self.mean.tolist(), "m2": self.m2.tolist()}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]):
+        controls = cls(data["names"], data["means"])
+        controls.count = data["count"]
+        controls.mean = np.asarray(data["mean"], dtype=float)
+        controls.m2 = np.asarray(data["m2"], dtype=float)
+        return controls
+
+
+class Aggregate:
+    """Resumen combinable de los resultados de un modelo.
+
+    Con `controls` (nombre de variable -> media conocida) también acumula
+    las variables de control; `update` recibe entonces las columnas de entrada.
+    """
+
+    def __init__(self, controls: Optional[Dict[str, float]] = None):
+        self.stats = RunningStats()
+        self.histogram = Histogram()
+        self.sketch = QuantileSketch()
+        self.failed = 0
+        self.controls = ControlVariates(list(controls), list(controls.values())) if controls else None
+
+    @property
+    def count(self) -> int:
+        return self.stats.count + self.failed
+
+    def update(self, results, columns: Optional[Dict[str, Any]] = None):
+        # None (escenario fallido) se convierte en NaN
+        values = np.asarray(results, dtype=float)
+        mask = np.isfinite(values)
+        finite = values[mask]
+        self.failed += len(values) - len(finite)
+        self.stats.update(finite)
+        self.histogram.update(finite)
+        self.sketch.update(finite)
+        if self.controls is not None and columns is not None:
+            controls = np.array([np.asarray(columns[name], dtype=float)[mask] for name in self.controls.names])
+            self.controls.update(finite, controls)
+
+    def merge(self, other: 'Aggregate'):
+        self.stats.merge(other.stats)
+        self.histogram.merge(other.histogram)
+        self.sketch.merge(other.sketch)
+        self.failed += other.failed
+        if other.controls is not None:
+            if self.controls is None:
+                self.controls = ControlVariates(other.controls.names, other.controls.means)
+            self.controls.merge(other.controls)
+
+    @property
+    def mean(self) -> float:
+        """Media de los resultados, ajustada por variables de control si las hay."""
+        if self.controls is not None and self.controls.count > len(self.controls.names) + 1:
+            return self.controls.adjusted_mean
+        return self.stats.mean
+
+    @property
+    def stderr(self) -> float:
+        if self.controls is not None and self.controls.count > len(self.controls.names) + 1:
+            return self.controls.stderr
+        return self.stats.stderr
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"stats": self.stats.to_dict(), "histogram": self.histogram.to_dict(),
+                "sketch": self.sketch.to_dict(), "failed": self.failed,
+                "controls": self.controls.to_dict() if self.controls is not None else None}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]):
+        aggregate = cls()
+        aggregate.stats = RunningStats.from_dict(data["stats"])
+        aggregate.histogram = Histogram.from_dict(data["histogram"])
+        aggregate.sketch = QuantileSketch.from_dict(data["sketch"])
+        aggregate.failed = data["failed"]
+        if data.get("controls"):
+            aggregate.controls = ControlVariates.from_dict(data["controls"])
+        return aggregate
@@ -0,0 +1,128 @@
+import os
+import threading
+from contextlib import contextmanager
+import pika
+from shared import RABBITMQ_HOST, RABBITMQ_PORT, RABBITMQ_USER, RABBITMQ_PASS, TRANSPORT, TRANSPORT_ENV
+from shared.local_broker import LocalBroker, BlockingConnection, SelectConnection
+
+# Cómo se abren las conexiones al broker. Productor, registro, publicador,
+# workers, almacén y dashboard usan la API de canal de pika (basic_publish,
+# basic_consume, basic_ack/nack, queue_declare, ...) sobre la conexión que
+# devuelve el transporte activo:
+#
+#   'rabbitmq'  pika contra RABBITMQ_HOST.
+#   'local'     shared.local_broker, un broker en memoria dentro del proceso:
+#               sin red ni disco, los mensajes pasan por referencia. Para una
+#               corrida en una sola máquina (productor.nodo_local); el cómputo
+#               en paralelo lo dan los procesos del pool de cada worker.
+
+
+class Transport:
+    name = None
+
+    def connect(self):
+        """Conexión con la API de pika.BlockingConnection."""
+        raise NotImplementedError
+
+    def connect_async(self, on_open_callback, on_open_error_callback=None, on_close_callback=None):
+        """Conexión con la API de pika.SelectConnection (ioloop propio)."""
+        raise NotImplementedError
+
+    def queue_depth(self, channel, queue):
+        """Mensajes listos en `queue`, o None si no existe.
+
+        Con RabbitMQ una cola inexistente cierra el canal: quien llama debe
+        abrir otro si channel.is_closed.
+        """
+        try:
+            return channel.queue_declare(queue=queue, passive=True).method.message_count
+        except pika.exceptions.ChannelClosedByBroker:
+            return None
+
+
+class RabbitMQTransport(Transport):
+    name = 'rabbitmq'
+
+    def __init__(self, host=RABBITMQ_HOST, port=RABBITMQ_PORT, user=RABBITMQ_USER, password=RABBITMQ_PASS):
+        self.parameters = pika.ConnectionParameters(
+            host=host,
+            port=port,
+            credentials=pika.PlainCredentials(user, password)
+        )
+
+    def connect(self):
+        return pika.BlockingConnection(self.parameters)
+
+    def connect_async(self, on_open_callback, on_open_error_callback=None, on_close_callback=None):
+        return pika.SelectConnection(
+            self.parameters,
+            on_open_callback=on_open_callback,
+            on_open_error_callback=on_open_error_callback,
+            on_close_callback=on_close_callback
+        )
+
+
+class LocalTransport(Transport):
+    name = 'local'
+
+    def __init__(self, broker=None, latency=0.0):
+        self.broker = broker or LocalBroker(latency)
+
+    def connect(self):
+        return BlockingConnection(self.broker)
+
+    def connect_async(self, on_open_callback, on_open_error_callback=None, on_close_callback=None):
+        return SelectConnection(self.broker, on_open_callback, on_open_error_callback, on_close_callback)
+
+    def queue_depth(self, channel, queue):
+        # Sin RPC: el broker está en el mismo proceso y el canal no se cierra
+        return self.broker.depth(queue)
+
+
+TRANSPORTS = {'rabbitmq': RabbitMQTransport, 'local': LocalTransport}
+
+_current = None
+_lock = threading.Lock()
+
+
+def create_transport(name):
+    if name not in TRANSPORTS:
+        raise ValueError(f"Transporte desconocido: {name} (opciones: {', '.join(TRANSPORTS)})")
+    return TRANSPORTS[name]()
+
+
+def get_transport() -> Transport:
+    """El transporte activo; por defecto el de TRANSPORT_ENV o TRANSPORT."""
+    global _current
+    with _lock:
+        if _current is None:
+            _current = create_transport(os.environ.get(TRANSPORT_ENV, TRANSPORT))
+        return _current
+
+
+def set_transport(transport: Transport):
+    global _current
+    with _lock:
+        previous, _current = _current, transport
+        return previous
+
+
+@contextmanager
+def using(transport: Transport):
+    previous = set_transport(transport)
+    try:
+        yield transport
+    finally:
+        set_transport(previous)
+
+
+def connect():
+    return get_transport().connect()
+
+
+def connect_async(on_open_callback, on_open_error_callback=None, on_close_callback=None):
+    return get_transport().connect_async(on_open_callback, on_open_error_callback, on_close_callback)
+
+
+def queue_depth(channel, queue):
+    return get_transport().queue_depth(channel, queue)
@@ -1,33 +1,78 @@
 # visualizador/dashboard.py
-import pika
 import json
 import matplotlib.pyplot as plt
-import matplotlib.animation as animation
 import threading
 import time
 import numpy as np
-from collections import defaultdict
+from collections import defaultdict, deque
 import sys
 
-from shared import RABBITMQ_HOST, RABBITMQ_PORT, RABBITMQ_USER, RABBITMQ_PASS, RESULTS_QUEUE, SCENARIOS_QUEUE, MODEL_QUEUE
+from shared import RESULTS_QUEUE, SCENARIOS_QUEUE, MODEL_REQUEST_QUEUE
+from shared import MSG_RESULT_BATCH, MSG_RESULT_SUMMARY, CONTENT_TYPE_BINARY, METRICS_EXCHANGE
+from shared import RESULTS_EXCHANGE, RESULTS_BINDING, JOBS_EXCHANGE
+from shared import codec, transport
+from shared.models import ResultBatch, ResultSummary, WorkerMetrics, Job
+from shared.stats import Aggregate
+from shared.completion import CompletionIndex
+from visualizador.render import RenderizadorDashboard, VENTANA_FRAMES, HUECOS_MOSTRADOS
+from almacen.columnar import LectorColumnar, modelos_guardados
+
+# Puntos de la serie temporal que se conservan por modelo
+SERIE_MAX = 2000
+Z_95 = 1.96
+
+class EstadoModelo:
+    """Acumuladores en línea de un modelo.
+
+    La memoria y el costo de actualizar no dependen de cuántos resultados
+    lleguen: estadísticos combinables más un buffer circular con la
+    evolución reciente de la estimación.
+    """
+    def __init__(self):
+        self.aggregate = Aggregate()
+        self.serie = deque(maxlen=SERIE_MAX)  # (procesados, media, semiancho IC 95%)
+    
+    def combinar(self, aggregate):
+        self.aggregate.merge(aggregate)
+        self.serie.append((self.aggregate.count, self.aggregate.mean, self.semiancho()))
+    
+    def semiancho(self):
+        # Con variables de control, media y error estándar son los del estimador ajustado
+        return Z_95 * self.aggregate.stderr if self.aggregate.stats.count > 1 else 0.0
+    
+    def resumen(self):
+        stats = self.aggregate.stats
+        sketch = self.aggregate.sketch
+        return {
+            "count": self.aggregate.count,
+            "failed": self.aggregate.failed,
+            "mean": self.aggregate.mean,
+            "ic": self.semiancho(),
+            "std": stats.std,
+            "quantiles": [sketch.quantile(q) for q in (0.05, 0.5, 0.95)] if stats.count else None,
+            "serie": list(self.serie)
+        }
 
 # Almacenamiento de datos
-resultados = []
+modelos = defaultdict(EstadoModelo)  # model_id -> EstadoModelo
 workers_activos = defaultdict(float)
+metricas_workers = {}  # worker_id -> última WorkerMetrics recibida
+trabajos = {}  # job_id -> último Job anunciado
+# job_id (o model_id, para la cola compartida) -> escenarios con resultado: cada uno se cuenta una vez
+completitud = defaultdict(CompletionIndex)
+huecos_trabajo = {}  # job_id -> primeros rangos sin resultado (uno más de los que se muestran)
+escenarios_repetidos = 0
+en_cola_trabajo = {}  # job_id -> mensajes en su cola de escenarios
 scenarios_generated = 0
 scenarios_processed = 0
 data_lock = threading.Lock()
 
+def total_procesados():
+    return sum(estado.aggregate.count for estado in modelos.values())
+
 def setup_rabbitmq_connection():
     try:
-        credentials = pika.PlainCredentials(RABBITMQ_USER, RABBITMQ_PASS)
-        connection = pika.BlockingConnection(
-            pika.ConnectionParameters(
-                host=RABBITMQ_HOST,
-                port=RABBITMQ_PORT,
-                credentials=credentials
-            )
-        )
+        connection = transport.connect()
         return connection
     except Exception as e:
         print(f"Error conectando a RabbitMQ: {e}")
@@ -42,13 +87,15 @@ def get_queue_stats():
         
         channel = connection.channel()
         
+        with data_lock:
+            colas_trabajos = [job.queue for job in trabajos.values()]
+        
         stats = {}
-        for queue_name in [SCENARIOS_QUEUE, MODEL_QUEUE, RESULTS_QUEUE]:
-            try:
-                method = channel.queue_declare(queue=queue_name, passive=True)
-                stats[queue_name] = method.method.message_count
-            except:
-                stats[queue_name] = 0
+        for queue_name in [SCENARIOS_QUEUE, MODEL_REQUEST_QUEUE, RESULTS_QUEUE, *colas_trabajos]:
+            stats[queue_name] = transport.queue_depth(channel, queue_name) or 0
+            if channel.is_closed:
+                # Con RabbitMQ una cola inexistente cierra el canal: se abre otro para las siguientes
+                channel = connection.channel()
         
         connection.close()
         return stats
@@ -65,8 +112,13 @@ def check_queues_periodically():
         try:
             stats = get_queue_stats()
             with data_lock:
-                scenarios_generated = stats.get(SCENARIOS_QUEUE, 0)
-                scenarios_processed = len(resultados)
+                for job_id, job in trabajos.items():
+                    en_cola_trabajo[job_id] = stats.get(job.queue, 0)
+                    # Recorre el bitmap del trabajo: se hace acá y no en cada frame
+                    huecos_trabajo[job_id] = completitud[job_id].missing(
+                        job.first_index + job.published, job.first_index, limit=HUECOS_MOSTRADOS + 1)
+                scenarios_generated = stats.get(SCENARIOS_QUEUE, 0) + sum(en_cola_trabajo.values())
+                scenarios_processed = total_procesados()
                 
             time.sleep(2)
             
@@ -74,47 +126,134 @@ def check_queues_periodically():
             print(f"Error en monitoreo: {e}")
             time.sleep(5)
 
-def rabbitmq_consumer():
-    """Consume SOLO resultados para el dashboard"""
-    print("Dashboard conectando a RabbitMQ...")
-    
+def metrics_consumer():
+    """Escucha los latidos de los workers en una cola exclusiva enlazada al exchange de métricas"""
     try:
-        credentials = pika.PlainCredentials(RABBITMQ_USER, RABBITMQ_PASS)
-        connection = pika.BlockingConnection(
-            pika.ConnectionParameters(
-                host=RABBITMQ_HOST,
-                port=RABBITMQ_PORT,
-                credentials=credentials
-            )
-        )
+        connection = setup_rabbitmq_connection()
+        if not connection:
+            raise ConnectionError("sin conexión")
         channel = connection.channel()
         
-        channel.queue_declare(queue=RESULTS_QUEUE, durable=True)
+        channel.exchange_declare(exchange=METRICS_EXCHANGE, exchange_type='fanout')
+        # Cola propia y temporal: se borra al cerrar el dashboard y no compite con nadie
+        queue_name = channel.queue_declare(queue='', exclusive=True).method.queue
+        channel.queue_bind(exchange=METRICS_EXCHANGE, queue=queue_name)
         
         def callback(ch, method, properties, body):
-            """Procesa resultados SIN interferir con workers"""
             try:
-                resultado = json.loads(body.decode())
-                
+                metricas = WorkerMetrics.from_json(body.decode())
                 with data_lock:
-                    resultados.append(resultado)
-                    
-                    # Actualizar información del worker
-                    worker_id = resultado.get('worker_id', 'unknown')
-                    if worker_id != 'unknown':
-                        workers_activos[worker_id] = time.time()
-                
-                ch.basic_ack(delivery_tag=method.delivery_tag)
-                
-                if len(resultados) % 10 == 0:
-                    print(f"Dashboard: {len(resultados)} resultados recibidos")
-                    
+                    metricas_workers[metricas.worker_id] = metricas
+                    workers_activos[metricas.worker_id] = time.time()
+            except Exception as e:
+                print(f"Error procesando métricas: {e}")
+        
+        channel.basic_consume(queue=queue_name, on_message_callback=callback, auto_ack=True)
+        
+        # Anuncios de trabajos por el mismo canal: peso, estado y escenarios publicados
+        channel.exchange_declare(exchange=JOBS_EXCHANGE, exchange_type='fanout')
+        cola_trabajos = channel.queue_declare(queue='', exclusive=True).method.queue
+        channel.queue_bind(exchange=JOBS_EXCHANGE, queue=cola_trabajos)
+        
+        def callback_trabajo(ch, method, properties, body):
+            try:
+                job = Job.from_json(body.decode())
+                with data_lock:
+                    trabajos[job.job_id] = job
             except Exception as e:
-                print(f"Error procesando resultado: {e}")
+                print(f"Error procesando anuncio de trabajo: {e}")
+        
+        channel.basic_consume(queue=cola_trabajos, on_message_callback=callback_trabajo, auto_ack=True)
+        print("Dashboard escuchando métricas de workers...")
+        channel.start_consuming()
+        
+    except Exception as e:
+        print(f"Error en consumidor de métricas: {e}")
+        time.sleep(5)
+        metrics_consumer()
+
+def recibir_resultado(ch, method, properties, body):
+    """Procesa resultados SIN interferir con workers.
+    
+    Cada escenario se cuenta una sola vez por trabajo aunque llegue repetido
+    (reentregas, copias especulativas): de un lote se toman los escenarios
+    nuevos y un resumen que repite alguno se descarta entero.
+    """
+    global escenarios_repetidos
+    try:
+        binario = properties.content_type == CONTENT_TYPE_BINARY
+        # La routing key identifica el trabajo (RESULTS_QUEUE.<job_id>)
+        job_id = Job.id_from_results_key(method.routing_key)
+        # Se decodifica y agrega fuera del lock; adentro solo se marca el índice y se combina
+        aggregate = Aggregate()
+        if properties.type == MSG_RESULT_SUMMARY:
+            # Los workers ya agregaron sus resultados
+            summary = ResultSummary.from_json(body.decode())
+            model_id, worker_id = summary.model_id, summary.worker_id
+            recibido = Aggregate.from_dict(summary.aggregate)
+            with data_lock:
+                nuevo = not summary.units or completitud[job_id or model_id].claim(summary.units)
+            if nuevo:
+                aggregate = recibido
+            repetidos = 0 if nuevo else recibido.count
+        elif properties.type == MSG_RESULT_BATCH:
+            # Un mensaje batch trae los resultados de todo un bloque de escenarios
+            if binario:
+                batch = codec.decode_result_batch(body)
+            else:
+                batch = ResultBatch.from_json(body.decode())
+            model_id, worker_id = batch.model_id, batch.worker_id
+            with data_lock:
+                nuevos = completitud[job_id or model_id].add(batch.start_index, len(batch.results))
+            # None (fallido) pasa a NaN, como en Aggregate.update
+            aggregate.update(np.asarray(batch.results, dtype=float)[nuevos])
+            repetidos = len(batch.results) - int(nuevos.sum())
+        else:
+            if binario:
+                resultado = vars(codec.decode_result(body))
+            else:
+                resultado = json.loads(body.decode())
+            model_id, worker_id = resultado.get('model_id'), resultado.get('worker_id', 'unknown')
+            indice = int(resultado['scenario_id'].rsplit('_', 1)[1])
+            with data_lock:
+                repetidos = 0 if completitud[job_id or model_id].add(indice)[0] else 1
+            if not repetidos:
+                aggregate.update([resultado.get('result')])
+        
+        with data_lock:
+            escenarios_repetidos += repetidos
+            total_antes = total_procesados()
+            if aggregate.count:
+                modelos[model_id].combinar(aggregate)
+            total = total_antes + aggregate.count
+            
+            # Actualizar información del worker
+            if worker_id != 'unknown':
+                workers_activos[worker_id] = time.time()
+        
+        ch.basic_ack(delivery_tag=method.delivery_tag)
+        
+        if total // 10000 > total_antes // 10000:
+            print(f"Dashboard: {total} resultados recibidos")
+            
+    except Exception as e:
+        print(f"Error procesando resultado: {e}")
+
+def rabbitmq_consumer():
+    """Consume SOLO resultados para el dashboard"""
+    print("Dashboard conectando a RabbitMQ...")
+    
+    try:
+        connection = transport.connect()
+        channel = connection.channel()
+        
+        channel.queue_declare(queue=RESULTS_QUEUE, durable=True)
+        channel.exchange_declare(exchange=RESULTS_EXCHANGE, exchange_type='topic', durable=True)
+        channel.queue_bind(queue=RESULTS_QUEUE, exchange=RESULTS_EXCHANGE, routing_key=RESULTS_BINDING)
         
         channel.basic_consume(
             queue=RESULTS_QUEUE,
-            on_message_callback=callback,
+            on_message_callback=recibir_resultado,
             auto_ack=False
         )
         
@@ -126,102 +265,90 @@ def rabbitmq_consumer():
         time.sleep(5)
         rabbitmq_consumer()
 
-def update_plot(frame):
-    """Actualiza los gráficos en tiempo real"""
-    global resultados, workers_activos, scenarios_generated, scenarios_processed
-    
+def capturar_estado():
+    """Copia bajo el lock solo resúmenes de tamaño fijo, no los resultados"""
     with data_lock:
-        current_results = resultados.copy()
-        current_workers = workers_activos.copy()
-        gen = scenarios_generated
-        proc = scenarios_processed
-    
-    # Limpiar gráficos
-    ax1.clear()
-    ax2.clear()
-    ax3.clear()
-    ax4.clear()
-    
-    # Gráfico 1: Progreso de la simulación
-    ax1.bar(['Generados', 'Procesados'], [gen, len(current_results)], 
-            color=['blue', 'green'], alpha=0.7)
-    ax1.set_title('Progreso de Simulacion')
-    ax1.set_ylabel('Cantidad de Escenarios')
-    
-    # Agregar números en las barras
-    for i, v in enumerate([gen, len(current_results)]):
-        ax1.text(i, v + max(gen, 1)*0.01, str(v), ha='center', va='bottom', fontweight='bold')
-    
-    # Gráfico 2: Resultados a lo largo del tiempo (simple)
-    ax2.plot(range(len(current_results)), range(len(current_results)), 'ro-', markersize=2, alpha=0.7)
-    ax2.set_title('Resultados Procesados')
-    ax2.set_xlabel('Tiempo')
-    ax2.set_ylabel('Total de Resultados')
-    ax2.grid(True, alpha=0.3)
-    
-    # Gráfico 3: Workers activos
-    current_time = time.time()
-    active_workers = [wid for wid, last_seen in current_workers.items() 
-                     if current_time - last_seen < 30]
-    
-    if active_workers:
-        worker_counts = {}
-        for worker in active_workers:
-            worker_counts[worker] = worker_counts.get(worker, 0) + 1
-        
-        workers = list(worker_counts.keys())
-        counts = list(worker_counts.values())
-        
-        bars = ax3.bar(workers, counts, color='orange', alpha=0.7)
-        ax3.set_title(f'Workers Activos: {len(active_workers)}')
-        ax3.set_ylabel('Actividad Reciente')
-        
-        for bar, count in zip(bars, counts):
-            ax3.text(bar.get_x() + bar.get_width()/2., bar.get_height() + 0.1,
-                    str(count), ha='center', va='bottom')
-    else:
-        ax3.text(0.5, 0.5, 'No hay workers activos', 
-                ha='center', va='center', transform=ax3.transAxes)
-        ax3.set_title('Workers Activos')
-    
-    # Gráfico 4: Información del sistema (solo texto simple)
-    ax4.axis('off')
-    
-    info_text = "SISTEMA MONTE CARLO\n\n"
-    info_text += f"Workers activos: {len(active_workers)}\n"
-    info_text += f"Resultados: {len(current_results)}\n"
-    info_text += f"Escenarios pendientes: {gen}\n"
-    info_text += f"Ultima actualizacion: {time.strftime('%H:%M:%S')}"
+        current_models = {model_id: estado.resumen() for model_id, estado in modelos.items()}
+        return {
+            "modelos": current_models,
+            "workers": workers_activos.copy(),
+            "metricas": dict(metricas_workers),
+            "trabajos": {
+                job_id: {"modelo": job.model_id, "peso": job.weight, "estado": job.status,
+                         "publicados": job.published, "procesados": completitud[job_id].completed,
+                         "en_cola": en_cola_trabajo.get(job_id, 0), "huecos": huecos_trabajo.get(job_id, [])}
+                for job_id, job in trabajos.items()
+            },
+            "repetidos": escenarios_repetidos,
+            "generados": scenarios_generated,
+            "procesados": sum(r["count"] for r in current_models.values()),
+            "ahora": time.time()
+        }
+
+def update_plot():
+    """Actualiza los gráficos en tiempo real"""
+    renderizador.actualizar(capturar_estado())
     
-    ax4.text(0.05, 0.95, info_text, transform=ax4.transAxes, fontsize=10,
-             verticalalignment='top', fontfamily='monospace',
-             bbox=dict(boxstyle="round,pad=0.5", facecolor="lightblue", alpha=0.7))
+    if renderizador.frames % VENTANA_FRAMES == 0:
+        frame = renderizador.estadisticas_frame()
+        print(f"Dashboard: render p50 {frame['p50_ms']:.1f}ms, p95 {frame['p95_ms']:.1f}ms, "
+              f"max {frame['max_ms']:.1f}ms, {frame['redibujos']} redibujos en {frame['frames']} frames")
 
-def main():
+# Filas por punto de la serie al reconstruir una corrida desde el almacén
+FILAS_POR_PUNTO = 65536
+
+def cargar_desde_almacen(directorio, model_ids=None):
+    """Carga una corrida terminada desde el almacén columnar, sin RabbitMQ"""
+    for model_id in model_ids or modelos_guardados(directorio):
+        lector = LectorColumnar(directorio, model_id)
+        estado = modelos[model_id]
+        # Se recorre chunk por chunk vía mmap, de a FILAS_POR_PUNTO filas
+        for bloque in lector.bloques():
+            for inicio in range(0, len(bloque), FILAS_POR_PUNTO):
+                aggregate = Aggregate()
+                aggregate.update(bloque['result'][inicio:inicio + FILAS_POR_PUNTO])
+                estado.combinar(aggregate)
+        # Resultados que solo llegaron como resúmenes de los workers
+        if lector.resumen is not None:
+            estado.combinar(lector.resumen)
+        print(f"Modelo {model_id}: {len(lector)} resultados cargados desde '{directorio}/'")
+
+def main(directorio_almacen=None, model_ids=None):
     """Función principal del dashboard"""
-    global ax1, ax2, ax3, ax4
+    global renderizador
     
     plt.style.use('ggplot')
     fig, ((ax1, ax2), (ax3, ax4)) = plt.subplots(2, 2, figsize=(12, 8))
     fig.suptitle('Dashboard Monte Carlo - Monitoreo en Tiempo Real', fontsize=14, fontweight='bold')
+    renderizador = RenderizadorDashboard(fig, ax1, ax2, ax3, ax4)
     
     print("Iniciando dashboard...")
     
-    # Hilo para consumir resultados
-    consumer_thread = threading.Thread(target=rabbitmq_consumer, daemon=True)
-    consumer_thread.start()
-    
-    # Hilo para monitoreo de colas
-    monitor_thread = threading.Thread(target=check_queues_periodically, daemon=True)
-    monitor_thread.start()
-    
-    print("Dashboard iniciado correctamente")
-    print("Monitoreando sin interferir con workers...")
+    if directorio_almacen:
+        # Corrida terminada: todo sale del almacén, no hay nada que escuchar
+        cargar_desde_almacen(directorio_almacen, model_ids)
+    else:
+        # Hilo para consumir resultados
+        consumer_thread = threading.Thread(target=rabbitmq_consumer, daemon=True)
+        consumer_thread.start()
+        
+        # Hilo para métricas de los workers
+        metrics_thread = threading.Thread(target=metrics_consumer, daemon=True)
+        metrics_thread.start()
+        
+        # Hilo para monitoreo de colas
+        monitor_thread = threading.Thread(target=check_queues_periodically, daemon=True)
+        monitor_thread.start()
+        
+        print("Dashboard iniciado correctamente")
+        print("Monitoreando sin interferir con workers...")
     print("Presiona Ctrl+C para cerrar")
     
     try:
-        # Animación que actualiza cada 500ms
-        ani = animation.FuncAnimation(fig, update_plot, interval=500, cache_frame_data=False)
+        # Actualización cada 500ms; el renderizador decide si basta con blitting
+        timer = fig.canvas.new_timer(interval=500)
+        timer.add_callback(update_plot)
+        timer.start()
         plt.show()
         
     except KeyboardInterrupt:
@@ -229,7 +356,16 @@ def main():
     except Exception as e:
         print(f"Error: {e}")
     finally:
-        print(f"Resumen final: {len(resultados)} resultados procesados")
+        print(f"Resumen final: {total_procesados()} resultados procesados")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    import argparse
+    
+    parser = argparse.ArgumentParser(description="Dashboard Monte Carlo")
+    parser.add_argument("--store", metavar="DIR", default=None,
+                        help="Abrir una corrida terminada desde el almacén de resultados")
+    parser.add_argument("--model", action="append", default=None,
+                        help="model_id a cargar del almacén (por defecto, todos)")
+    args = parser.parse_args()
+    
+    main(args.store, args.model)
\ No newline at end of file
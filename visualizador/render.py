@@ -0,0 +1,285 @@
+# visualizador/render.py
+import time
+from collections import deque
+import numpy as np
+
+# Puntos que se dibujan por serie, sin importar cuántos haya en el buffer
+PUNTOS_SERIE = 500
+# Frames recientes con los que se mide el costo de render
+VENTANA_FRAMES = 120
+# Factor con el que se agrandan los ejes, para no redibujar el fondo en cada frame
+MARGEN_EJES = 1.5
+# Segundos sin noticias tras los que un worker deja de contarse como activo
+WORKER_INACTIVO = 30
+# Rangos sin resultado que se listan por trabajo
+HUECOS_MOSTRADOS = 3
+
+
+def lttb(x, y, puntos):
+    """Índices que conserva la decimación Largest-Triangle-Three-Buckets de (x, y).
+
+    Se mantienen el primer y el último punto; de cada bucket intermedio se
+    elige el que forma el triángulo de mayor área con el punto ya elegido y
+    el promedio del bucket siguiente, lo que preserva picos y tendencia.
+    """
+    n = len(x)
+    if puntos < 3 or n <= puntos:
+        return np.arange(n)
+
+    indices = np.empty(puntos, dtype=np.int64)
+    indices[0] = 0
+    indices[-1] = n - 1
+    bordes = np.linspace(1, n - 1, puntos - 1).astype(np.int64)
+    # Promedio de cada bucket; el último es solo el punto final
+    tamanos = np.diff(np.append(bordes, n))
+    cx = np.add.reduceat(x, bordes) / tamanos
+    cy = np.add.reduceat(y, bordes) / tamanos
+    elegido = 0
+    for i in range(puntos - 2):
+        inicio, fin = bordes[i], bordes[i + 1]
+        xa, ya = x[elegido], y[elegido]
+        areas = np.abs((xa - cx[i + 1]) * (y[inicio:fin] - ya) - (xa - x[inicio:fin]) * (cy[i + 1] - ya))
+        elegido = inicio + int(np.argmax(areas))
+        indices[i + 1] = elegido
+    return indices
+
+
+class RenderizadorDashboard:
+    """Dibuja el dashboard creando los artistas una sola vez.
+
+    Lo que cambia en cada frame (barras, series, texto) son artistas
+    'animated' que se pintan con blitting sobre un fondo cacheado. El fondo
+    (ejes, títulos, leyenda, workers) solo se redibuja completo cuando cambian
+    los límites de los ejes, aparece un modelo o cambia el conjunto de workers.
+    """
+
+    def __init__(self, fig, ax1, ax2, ax3, ax4):
+        self.fig = fig
+        self.canvas = fig.canvas
+        self.ax1, self.ax2, self.ax3, self.ax4 = ax1, ax2, ax3, ax4
+        self.animados = []
+        self.fondo = None
+        self.tiempos_frame = deque(maxlen=VENTANA_FRAMES)
+        self.frames = 0
+        self.redibujos = 0
+
+        # Gráfico 1: Progreso de la simulación
+        self.barras = ax1.bar(['Generados', 'Procesados'], [0, 0], color=['blue', 'green'], alpha=0.7)
+        self.textos_barras = [ax1.text(i, 0, '0', ha='center', va='bottom', fontweight='bold')
+                              for i in range(2)]
+        ax1.set_title('Progreso de Simulacion')
+        ax1.set_ylabel('Cantidad de Escenarios')
+        ax1.set_ylim(0, 1)
+
+        # Gráfico 2: Convergencia de la media con su intervalo de confianza
+        self.series = {}  # model_id -> (línea de la media, banda del IC)
+        ax2.set_title('Convergencia de la Media (IC 95%)')
+        ax2.set_xlabel('Resultados Procesados')
+        ax2.set_ylabel('Media')
+        ax2.grid(True, alpha=0.3)
+
+        # Gráfico 3: Throughput por worker (los ejes se rehacen solo cuando cambia el conjunto)
+        self.workers = None
+        self.barras_workers = []
+        self.textos_workers = []
+
+        # Gráfico 4: Información del sistema
+        ax4.axis('off')
+        self.info = ax4.text(0.05, 0.95, '', transform=ax4.transAxes, fontsize=10,
+                             verticalalignment='top', fontfamily='monospace',
+                             bbox=dict(boxstyle="round,pad=0.5", facecolor="lightblue", alpha=0.7))
+
+        for artista in [*self.barras, *self.textos_barras, self.info]:
+            self._animar(artista)
+        self.canvas.mpl_connect('draw_event', self._on_draw)
+
+    def _animar(self, artista):
+        artista.set_animated(True)
+        self.animados.append(artista)
+
+    def _on_draw(self, event):
+        # Tras un dibujo completo se guarda el fondo (sin los artistas animados)
+        self.fondo = self.canvas.copy_from_bbox(self.fig.bbox)
+        self._pintar_animados()
+
+    def _pintar_animados(self):
+        for artista in self.animados:
+            self.fig.draw_artist(artista)
+
+    def actualizar(self, estado):
+        """Actualiza los datos de los artistas y pinta el frame. Devuelve el tiempo empleado."""
+        inicio = time.perf_counter()
+
+        redibujar = self._actualizar_progreso(estado["generados"], estado["procesados"])
+        redibujar |= self._actualizar_convergencia(estado["modelos"])
+        redibujar |= self._actualizar_workers(estado["workers"], estado["metricas"], estado["ahora"])
+        self._actualizar_info(estado)
+
+        if redibujar or self.fondo is None:
+            # El draw_event vuelve a cachear el fondo y pinta los animados
+            self.redibujos += 1
+            self.canvas.draw_idle()
+        else:
+            self.canvas.restore_region(self.fondo)
+            self._pintar_animados()
+            self.canvas.blit(self.fig.bbox)
+
+        duracion = time.perf_counter() - inicio
+        self.tiempos_frame.append(duracion)
+        self.frames += 1
+        return duracion
+
+    def estadisticas_frame(self):
+        if not self.tiempos_frame:
+            return {"frames": 0, "p50_ms": 0.0, "p95_ms": 0.0, "max_ms": 0.0, "redibujos": 0}
+        tiempos = np.array(self.tiempos_frame) * 1000
+        return {
+            "frames": self.frames,
+            "p50_ms": float(np.percentile(tiempos, 50)),
+            "p95_ms": float(np.percentile(tiempos, 95)),
+            "max_ms": float(tiempos.max()),
+            "redibujos": self.redibujos
+        }
+
+    def _ajustar_eje(self, actual, fijar, minimo, maximo, desde_cero=False):
+        """Fija límites con margen si los datos se salen o quedaron muy chicos; True si cambió."""
+        if desde_cero:
+            minimo = 0.0
+            maximo = max(maximo, 1.0)
+        ancho = max(maximo - minimo, abs(maximo) * 1e-6, 1e-9)
+        ancho_actual = actual[1] - actual[0]
+        if actual[0] <= minimo and maximo <= actual[1] and ancho * MARGEN_EJES ** 2 >= ancho_actual:
+            return False
+        if desde_cero:
+            fijar(0, maximo * MARGEN_EJES)
+        else:
+            centro = (minimo + maximo) / 2
+            fijar(centro - ancho * MARGEN_EJES / 2, centro + ancho * MARGEN_EJES / 2)
+        return True
+
+    def _actualizar_progreso(self, generados, procesados):
+        valores = [generados, procesados]
+        for i, (barra, texto, valor) in enumerate(zip(self.barras, self.textos_barras, valores)):
+            barra.set_height(valor)
+            texto.set_position((i, valor))
+            texto.set_text(str(valor))
+        return self._ajustar_eje(self.ax1.get_ylim(), self.ax1.set_ylim, 0, max(valores), desde_cero=True)
+
+    def _actualizar_convergencia(self, modelos):
+        redibujar = False
+        x_max, y_min, y_max = 0.0, np.inf, -np.inf
+
+        for model_id, resumen in modelos.items():
+            if not resumen["serie"]:
+                continue
+            if model_id not in self.series:
+                linea, = self.ax2.plot([], [], '-', linewidth=1.5, label=model_id)
+                banda = self.ax2.fill_between([], [], [], alpha=0.2, color=linea.get_color())
+                self._animar(linea)
+                self._animar(banda)
+                self.series[model_id] = (linea, banda)
+                self.ax2.legend(fontsize=8)
+                redibujar = True
+
+            x, media, ic = (np.asarray(columna, dtype=float) for columna in zip(*resumen["serie"]))
+            indices = lttb(x, media, PUNTOS_SERIE)
+            x, media, ic = x[indices], media[indices], ic[indices]
+
+            linea, banda = self.series[model_id]
+            linea.set_data(x, media)
+            banda.set_verts([np.column_stack([np.concatenate([x, x[::-1]]),
+                                              np.concatenate([media - ic, (media + ic)[::-1]])])])
+
+            # El IC de los primeros puntos es enorme; el eje y sigue a la media y al IC actual
+            x_max = max(x_max, x[-1])
+            y_min = min(y_min, media.min(), media[-1] - ic[-1])
+            y_max = max(y_max, media.max(), media[-1] + ic[-1])
+
+        if x_max > 0:
+            redibujar |= self._ajustar_eje(self.ax2.get_xlim(), self.ax2.set_xlim, 0, x_max, desde_cero=True)
+            redibujar |= self._ajustar_eje(self.ax2.get_ylim(), self.ax2.set_ylim, y_min, y_max)
+        return redibujar
+
+    def _actualizar_workers(self, workers, metricas, ahora):
+        activos = sorted(wid for wid, last_seen in workers.items() if ahora - last_seen < WORKER_INACTIVO)
+        redibujar = False
+        if activos != self.workers:
+            self._rehacer_workers(activos)
+            redibujar = True
+
+        tasas = [metricas[wid].scenarios_per_sec if wid in metricas else 0.0 for wid in activos]
+        for barra, texto, tasa in zip(self.barras_workers, self.textos_workers, tasas):
+            barra.set_height(tasa)
+            texto.set_position((barra.get_x() + barra.get_width() / 2., tasa))
+            texto.set_text(f"{tasa:.0f}")
+        if activos:
+            redibujar |= self._ajustar_eje(self.ax3.get_ylim(), self.ax3.set_ylim, 0, max(tasas), desde_cero=True)
+        return redibujar
+
+    def _rehacer_workers(self, activos):
+        for artista in self.barras_workers + self.textos_workers:
+            self.animados.remove(artista)
+        self.workers = activos
+
+        self.ax3.clear()
+        self.barras_workers = list(self.ax3.bar(activos, [0] * len(activos), color='orange', alpha=0.7))
+        self.textos_workers = [self.ax3.text(barra.get_x() + barra.get_width() / 2., 0, '',
+                                             ha='center', va='bottom')
+                               for barra in self.barras_workers]
+        for artista in self.barras_workers + self.textos_workers:
+            self._animar(artista)
+
+        if activos:
+            self.ax3.set_title(f'Workers Activos: {len(activos)}')
+            self.ax3.set_ylabel('Escenarios/s')
+            self.ax3.set_ylim(0, 1)
+        else:
+            self.ax3.text(0.5, 0.5, 'No hay workers activos',
+                          ha='center', va='center', transform=self.ax3.transAxes)
+            self.ax3.set_title('Workers Activos')
+
+    def _actualizar_info(self, estado):
+        frame = self.estadisticas_frame()
+
+        info_text = "SISTEMA MONTE CARLO\n\n"
+        info_text += f"Workers activos: {len(self.workers or [])}\n"
+        metricas = [estado["metricas"][wid] for wid in self.workers or [] if wid in estado["metricas"]]
+        if metricas:
+            tasas = np.array([m.scenarios_per_sec for m in metricas])
+            total = tasas.sum()
+            # Desbalance: el worker más rápido contra el promedio (1.0 = parejo)
+            skew = tasas.max() / tasas.mean() if total > 0 else 1.0
+            info_text += f"Throughput: {total:.0f} esc/s (skew {skew:.2f})\n"
+            for m in metricas:
+                info_text += (f"  {m.worker_id}: {m.scenarios_per_sec:.0f} esc/s, "
+                              f"p50 {m.latency_p50:.1f}ms p99 {m.latency_p99:.1f}ms, "
+                              f"cache {m.cache.get('hit_rate', 'N/A')}, inactivo {m.idle_time:.0f}s\n")
+                if m.stages:
+                    info_text += "    etapas: " + ", ".join(f"{etapa} {valor * 100:.0f}%"
+                                                           for etapa, valor in m.stages.items()) + "\n"
+        info_text += f"Resultados: {estado['procesados']}"
+        info_text += f" ({estado['repetidos']} repetidos descartados)\n" if estado.get("repetidos") else "\n"
+        if estado.get("trabajos"):
+            info_text += "Trabajos:\n"
+            for job_id, trabajo in estado["trabajos"].items():
+                progreso = trabajo["procesados"] / trabajo["publicados"] * 100 if trabajo["publicados"] else 0.0
+                info_text += (f"  {job_id} [{trabajo['estado']}] peso {trabajo['peso']}: "
+                              f"{trabajo['procesados']}/{trabajo['publicados']} ({progreso:.0f}%), "
+                              f"en cola {trabajo['en_cola']} msgs\n")
+                if trabajo["huecos"] and not trabajo["en_cola"]:
+                    # Sin nada en cola, lo que falta son rangos concretos sin resultado
+                    huecos = ", ".join(f"{inicio}+{cantidad}" for inicio, cantidad in trabajo["huecos"][:HUECOS_MOSTRADOS])
+                    mas = "..." if len(trabajo["huecos"]) > HUECOS_MOSTRADOS else ""
+                    info_text += f"    faltan: {huecos}{mas}\n"
+        for model_id, resumen in estado["modelos"].items():
+            info_text += f"\nModelo {model_id}: {resumen['count']} ({resumen['failed']} fallidos)\n"
+            if resumen["quantiles"]:
+                p5, p50, p95 = resumen["quantiles"]
+                info_text += f"  Media: {resumen['mean']:.4f} ± {resumen['ic']:.4f}\n"
+                info_text += f"  Desv.: {resumen['std']:.4f}\n"
+                info_text += f"  p5/p50/p95: {p5:.3f} / {p50:.3f} / {p95:.3f}\n"
+        info_text += "\n"
+        info_text += f"Escenarios pendientes: {estado['generados']}\n"
+        info_text += f"Frame: p50 {frame['p50_ms']:.1f}ms / p95 {frame['p95_ms']:.1f}ms ({frame['redibujos']} redibujos)\n"
+        info_text += f"Ultima actualizacion: {time.strftime('%H:%M:%S')}"
+        self.info.set_text(info_text)